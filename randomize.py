@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Run the randomizer from any directory, for example python3 path/to/randomize.py --seed 5. Takes the same options as
+python3 -m src, which only works from the project root.
+"""
+
+import os
+import sys
+
+# The src package is next to this script, wherever it is run from.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.randomizer import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""
+Entry point for python3 -m src.
+"""
+
+from .randomizer import main
+
+main()
@@ -0,0 +1,211 @@
+"""
+Statistics of the generator across many seeds.
+
+Seeds are split into chunks, and every worker process folds the statistics of its seeds into fixed-size arrays as it
+goes. Memory use therefore doesn't grow with the number of seeds, and this can be run over hundreds of thousands of
+them.
+"""
+
+import argparse
+from array import array
+from collections import deque
+import csv
+import random
+import sys
+import time
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from .batch import chunks, map_chunks, quiet_range
+from .level import Level
+from .level_cache import load_level_graph
+from .level_graph import START_LEVEL, LevelGraph, SeedStats
+from .randomizer import LEVEL_INFO_FILE, generate
+
+# Histograms lump everything at or above their last bin into it.
+MAX_HUB_PATH = 10
+MAX_DEPTH = 40
+MAX_SELF_CONNECTIONS = 5
+
+
+def _zeros(size: int) -> array:
+    return array("q", bytes(8 * size))
+
+
+class SeedAggregate:
+    """
+    Running totals of the statistics of many seeds.
+    """
+
+    def __init__(self, num_levels: int) -> None:
+        self.seeds = 0
+        self.failures = 0
+        self.hits = _zeros(6)
+        self.hub_path_lengths = _zeros(MAX_HUB_PATH + 1)
+        self.self_connections = _zeros(MAX_SELF_CONNECTIONS + 1)
+        # Depth of every placed level from the start, over all seeds.
+        self.depths = _zeros(MAX_DEPTH + 1)
+        # The deepest level of each seed.
+        self.max_depths = _zeros(MAX_DEPTH + 1)
+        # Per level, indexed by level id.
+        self.level_placed = _zeros(num_levels)
+        self.level_depth_total = _zeros(num_levels)
+        self.level_removed = _zeros(num_levels)
+
+    def add(self, stats: SeedStats, depths: Dict[int, int], graph: LevelGraph) -> None:
+        """
+        Add the statistics of a single seed.
+
+        :param stats: What the generator recorded for the seed.
+        :param depths: The depth from the start of every level placed by the seed, by level id.
+        :param graph: The level database the seed was generated from.
+        """
+        self.seeds += 1
+        for hit, count in enumerate(stats.hits):
+            self.hits[hit] += count
+        for length in stats.hub_paths:
+            self.hub_path_lengths[min(length, MAX_HUB_PATH)] += 1
+        self.self_connections[min(stats.self_connections, MAX_SELF_CONNECTIONS)] += 1
+        for name in stats.removed_levels:
+            self.level_removed[graph.ids[name]] += 1
+        for level_id, depth in depths.items():
+            self.depths[min(depth, MAX_DEPTH)] += 1
+            self.level_placed[level_id] += 1
+            self.level_depth_total[level_id] += depth
+        if depths:
+            self.max_depths[min(max(depths.values()), MAX_DEPTH)] += 1
+
+    def merge(self, other: 'SeedAggregate') -> None:
+        """Add the totals of another aggregate to this one."""
+        self.seeds += other.seeds
+        self.failures += other.failures
+        for name in ("hits", "hub_path_lengths", "self_connections", "depths", "max_depths", "level_placed",
+                     "level_depth_total", "level_removed"):
+            totals = getattr(self, name)
+            for idx, value in enumerate(getattr(other, name)):
+                totals[idx] += value
+
+    def write_csv(self, graph: LevelGraph, f: TextIO) -> None:
+        """Write the per-level statistics as CSV."""
+        writer = csv.writer(f)
+        writer.writerow(["level", "placed", "removed", "mean_depth"])
+        for level in graph.templates:
+            placed = self.level_placed[level.id]
+            mean_depth = f"{self.level_depth_total[level.id] / placed:.2f}" if placed else ""
+            writer.writerow([level.name, placed, self.level_removed[level.id], mean_depth])
+
+    def histograms(self) -> str:
+        """Get text histograms of the per-seed statistics."""
+        output = [f"{self.seeds} seeds analysed, {self.failures} failed to generate."]
+        output += _histogram("Main loop cases (hit)", self.hits)
+        output += _histogram("Hub path lengths", self.hub_path_lengths, MAX_HUB_PATH)
+        output += _histogram("Self connections per seed", self.self_connections, MAX_SELF_CONNECTIONS)
+        output += _histogram("Level depth from GOMEZ_HOUSE", self.depths, MAX_DEPTH)
+        output += _histogram("Deepest level per seed", self.max_depths, MAX_DEPTH)
+        return "\n".join(output)
+
+
+def _histogram(title: str, counts: array, last_bin: Optional[int] = None, width: int = 50) -> List[str]:
+    output = ["", title]
+    total = sum(counts)
+    largest = max(counts) or 1
+    for idx, count in enumerate(counts):
+        if not count:
+            continue
+        label = f"{idx}+" if idx == last_bin else str(idx)
+        bar = "#" * round(width * count / largest)
+        output.append(f"{label:>4} {count:>10} {count / total:7.2%} {bar}")
+    return output
+
+
+def level_depths(levels: List[Level]) -> Dict[int, int]:
+    """
+    Get the depth of every level reachable from the start, following the connections made by the generator.
+    """
+    start = next((level for level in levels if level.name == START_LEVEL), None)
+    if start is None:
+        return {}
+    depths = {start.id: 0}
+    queue = deque([start])
+    while queue:
+        level = queue.popleft()
+        for connected_level in level.connected_levels:
+            if connected_level.id not in depths:
+                depths[connected_level.id] = depths[level.id] + 1
+                queue.append(connected_level)
+    return depths
+
+
+# The level database, loaded once per worker process.
+_graph: Optional[LevelGraph] = None
+
+
+def _init_worker(level_info_file: str) -> None:
+    global _graph
+    _graph = load_level_graph(level_info_file)
+
+
+def _analyse_chunk(seeds: Tuple[int, int]) -> SeedAggregate:
+    """Generate the seeds in [start, stop) and aggregate their statistics."""
+    assert _graph is not None
+    aggregate = SeedAggregate(len(_graph))
+    for seed in quiet_range(seeds):
+        levels = _graph.fresh_state()
+        # generate removes levels from the list it is given, keep hold of every level to measure the depths.
+        all_levels = list(levels)
+        stats = SeedStats()
+        try:
+            generate(levels, random.Random(seed), stats=stats, table=_graph.entrance_table())
+        except Exception:
+            aggregate.failures += 1
+            continue
+        aggregate.add(stats, level_depths(all_levels), _graph)
+    return aggregate
+
+
+def analyse(start: int, count: int, jobs: Optional[int] = None, level_info_file: str = LEVEL_INFO_FILE,
+            chunk_size: int = 500, graph: Optional[LevelGraph] = None) -> SeedAggregate:
+    """
+    Generate count seeds starting at start, and aggregate their statistics.
+
+    :param jobs: The number of worker processes. Defaults to the number of CPUs; 1 runs in this process.
+    :param chunk_size: The number of seeds handed to a worker at a time.
+    :param graph: The level database loaded from level_info_file, if the caller already has it.
+    """
+    if graph is None:
+        graph = load_level_graph(level_info_file)
+    total = SeedAggregate(len(graph))
+    for aggregate in map_chunks(_analyse_chunk, chunks(start, count, chunk_size), jobs, _init_worker,
+                                (level_info_file,)):
+        total.merge(aggregate)
+    return total
+
+
+def main():
+    """
+    Script for analysing the generator across many seeds.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", default=1, type=int, help="The first seed to generate.")
+    parser.add_argument("--count", default=1000, type=int, help="The number of seeds to generate.")
+    parser.add_argument("--jobs", required=False, type=int, help="Number of worker processes.")
+    parser.add_argument("--csv", required=False, help="Write the per-level statistics to this CSV file (- for stdout).")
+    options = parser.parse_args()
+
+    graph = load_level_graph(LEVEL_INFO_FILE)
+    start = time.perf_counter()
+    aggregate = analyse(options.seed, options.count, options.jobs, graph=graph)
+    elapsed = time.perf_counter() - start
+
+    # When the CSV goes to stdout, everything else goes to stderr.
+    report = sys.stderr if options.csv == "-" else sys.stdout
+    print(aggregate.histograms(), file=report)
+    print(f"\nAnalysed {options.count} seeds in {elapsed:.2f}s ({options.count / elapsed:.1f} seeds/s).", file=report)
+    if options.csv == "-":
+        aggregate.write_csv(graph, sys.stdout)
+    elif options.csv:
+        with open(options.csv, "w", newline="", encoding="UTF-8") as f:
+            aggregate.write_csv(graph, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Generate many seeds at once on a pool of worker processes.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext, redirect_stdout
+from dataclasses import dataclass, field
+import io
+from itertools import islice
+import os
+import statistics
+import time
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from .config_writer import DoorPair, format_doors, to_doors
+from .instrumentation import Profiler
+from .level_cache import load_level_graph
+from .level_graph import LevelGraph, SeedStats
+from .randomizer import LEVEL_INFO_FILE, generate_single
+from .validator import validate
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# The number of seeds generate_many sends to a worker process at once.
+SEEDS_PER_CHUNK = 16
+
+
+def chunks(start: int, count: int, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """Split count consecutive seeds from start into [start, stop) ranges of at most chunk_size seeds."""
+    for chunk_start in range(start, start + count, chunk_size):
+        yield chunk_start, min(chunk_start + chunk_size, start + count)
+
+
+def quiet_range(seeds: Tuple[int, int]) -> Iterator[int]:
+    """
+    Yield the seeds in [start, stop), throwing away anything printed while each of them is generated, so the
+    generator's messages don't pile up over a chunk.
+    """
+    with redirect_stdout(io.StringIO()) as log:
+        for seed in range(*seeds):
+            log.seek(0)
+            log.truncate()
+            yield seed
+
+
+def map_chunks(function: Callable[[T], R], items: Iterable[T], jobs: Optional[int], initializer: Callable[..., None],
+               initargs: tuple) -> Iterator[R]:
+    """
+    Run a function on every chunk of seeds on a pool of worker processes, and yield the results in the order of the
+    chunks. Only a couple of chunks per worker are in flight at once, so memory use doesn't grow with the number of
+    chunks. Closing the iterator early drops the chunks that haven't started.
+
+    :param function: The function run on each chunk, in a worker process.
+    :param items: The chunks.
+    :param jobs: The number of worker processes. Defaults to the number of CPUs; 1 runs in this process.
+    :param initializer: Called with initargs in every worker process before its first chunk.
+    :param initargs: The arguments of the initializer.
+    """
+    if jobs == 1:
+        initializer(*initargs)
+        for item in items:
+            yield function(item)
+        return
+
+    workers = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        pending: Deque[Future] = deque()
+        try:
+            for item in items:
+                pending.append(pool.submit(function, item))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Only the running chunks are waited for if the caller stopped early.
+            pool.shutdown(cancel_futures=True)
+
+
+@dataclass
+class SeedResult:
+    """Class for storing the outcome of generating a single seed."""
+    seed: int
+    config: str
+    elapsed: float
+    # The transitions as door pairs, which keep the level names as they are in the level database (see
+    # config_writer.to_doors). The compact encoding is written from these rather than from the config.
+    doors: List[DoorPair] = field(default_factory=list)
+    log: str = ""
+    # The number of problems the generator printed to the log (see GenerationState.warn).
+    warnings: int = 0
+    error: str = ""
+    # Whether every placed level can be reached, and the validator's report.
+    valid: bool = False
+    validation: str = ""
+    # The number of attempts made, and the derived seed of the one that was kept (see generate_with_retries).
+    attempts: int = 1
+    used_seed: Optional[int] = None
+    # The cost breakdown recorded by instrumentation.Profiler, when profiling.
+    profile: Optional[Dict[str, Any]] = None
+
+
+# The level database and settings, loaded once per worker process.
+_graph: Optional[LevelGraph] = None
+_max_attempts: Optional[int] = None
+_profiler: Optional[Profiler] = None
+_engine = "random"
+
+
+def init_worker(level_info_file: str, max_attempts: Optional[int], profile: bool = False,
+                engine: str = "random") -> None:
+    """
+    Load the level database and the settings used by generate_seed, once per worker process. Pass this as the
+    initializer of a process pool, or call it directly to generate seeds in this process.
+
+    :param level_info_file: The level database to generate from.
+    :param max_attempts: If set, degraded seeds are rejected and retried up to this many times (see
+                         generate_with_retries).
+    :param profile: Record the cost breakdown of every seed in its result (see instrumentation.Profiler).
+    :param engine: The placement engine to use (see randomizer.ENGINES).
+    """
+    global _graph, _max_attempts, _profiler, _engine
+    _graph = load_level_graph(level_info_file)
+    _max_attempts = max_attempts
+    _engine = engine
+    if profile:
+        _profiler = Profiler()
+        _profiler.install()
+
+
+def _stop_profiling() -> None:
+    global _profiler
+    if _profiler is not None:
+        _profiler.uninstall()
+        _profiler = None
+
+
+def generate_seed(seed: int) -> SeedResult:
+    """
+    Generate a single seed from the level database loaded by init_worker. Anything the generator prints is captured in
+    the result's log rather than interleaved with the output of other workers.
+    """
+    assert _graph is not None
+    log = io.StringIO()
+    result = SeedResult(seed, "", 0.0)
+    start = time.perf_counter()
+    with redirect_stdout(log), _profiler.seed(seed) if _profiler else nullcontext(SeedStats()) as stats:
+        try:
+            transitions, result.attempts, result.used_seed, validation = generate_single(_graph, seed, _max_attempts,
+                                                                                         stats, _engine)
+            result.doors = to_doors(transitions)
+            result.config = format_doors(result.doors)
+            if validation is None:
+                validation = validate(transitions, _graph)
+            result.valid = validation.ok
+            result.validation = str(validation)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.warnings = stats.warnings
+    result.elapsed = time.perf_counter() - start
+    if _profiler is not None:
+        result.profile = _profiler.seeds.pop()
+    result.log = log.getvalue()
+    return result
+
+
+def generate_many(seeds: Iterable[int], jobs: Optional[int] = None, level_info_file: str = LEVEL_INFO_FILE,
+                  max_attempts: Optional[int] = None, profile: bool = False,
+                  engine: str = "random") -> Iterator[SeedResult]:
+    """
+    Generate a config for every seed. Each worker loads the level database once and reuses it for all of its seeds.
+    Results are yielded in the same order as the seeds.
+
+    :param seeds: The seeds to generate.
+    :param jobs: The number of worker processes. Defaults to the number of CPUs; 1 runs in this process.
+    :param level_info_file: The level database to generate from.
+    :param max_attempts: If set, degraded seeds are rejected and retried up to this many times (see
+                         generate_with_retries).
+    :param profile: Record the cost breakdown of every seed in its result (see instrumentation.Profiler).
+    :param engine: The placement engine to use (see randomizer.ENGINES). The constraint engine always retries, up to
+                   CONSTRAINT_ATTEMPTS times if max_attempts isn't set.
+    """
+    if jobs == 1:
+        init_worker(level_info_file, max_attempts, profile, engine)
+        try:
+            for seed in seeds:
+                yield generate_seed(seed)
+        finally:
+            _stop_profiling()
+        return
+
+    for results in map_chunks(_generate_seeds, _batched(seeds, SEEDS_PER_CHUNK), jobs, init_worker,
+                              (level_info_file, max_attempts, profile, engine)):
+        yield from results
+
+
+def _batched(seeds: Iterable[int], size: int) -> Iterator[List[int]]:
+    iterator = iter(seeds)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _generate_seeds(seeds: List[int]) -> List[SeedResult]:
+    return [generate_seed(seed) for seed in seeds]
+
+
+def summarize(results: List[SeedResult], wall_time: Optional[float] = None) -> str:
+    """
+    Get a throughput summary for a batch of results.
+
+    :param results: The results of a call to generate_many.
+    :param wall_time: The total time taken by the batch. Defaults to the sum of the per-seed timings.
+    """
+    if not results:
+        return "No seeds generated."
+    timings = [r.elapsed for r in results]
+    failed = len([r for r in results if r.error])
+    invalid = len([r for r in results if not r.error and not r.valid])
+    if wall_time is None:
+        wall_time = sum(timings)
+    output = f"Generated {len(results) - failed}/{len(results)} seeds in {wall_time:.2f}s "
+    output += f"({len(results) / wall_time:.1f} seeds/s), {invalid} not completable.\n"
+    output += f"Per seed: mean={statistics.mean(timings) * 1000:.1f}ms "
+    output += f"median={statistics.median(timings) * 1000:.1f}ms max={max(timings) * 1000:.1f}ms"
+    warned = [r.warnings for r in results if r.warnings]
+    if warned:
+        output += f"\n{sum(warned)} warnings in {len(warned)} seeds."
+    attempts = [r.attempts for r in results]
+    if max(attempts) > 1:
+        output += f"\nAttempts per seed: mean={statistics.mean(attempts):.2f} max={max(attempts)}"
+    return output
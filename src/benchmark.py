@@ -0,0 +1,313 @@
+"""
+Benchmarks of each stage of the generator.
+
+Every stage is timed over a fixed corpus of seeds, on the real level database and on synthetic databases made by
+replicating the real levels. The results are written as JSON, and can be compared against the results of an earlier
+version to catch regressions.
+"""
+
+import argparse
+from contextlib import contextmanager, redirect_stdout
+import copy
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List
+
+from . import randomizer
+from .config_writer import encode_compact, format_config, to_doors
+from .entrance import EntranceIndex
+from .level_cache import levels_from_snapshot, load_levels_from_json, read_compiled
+from .level_graph import GenerationState, LevelGraph
+from .randomizer import LEVEL_INFO_FILE
+from .validator import validate
+
+# Bump this when the stages or the format of the results change.
+BENCHMARK_VERSION = 4
+
+# The most that importing the generator may add to the start up of a process, such as a CLI run or a pool worker.
+STARTUP_BUDGET_MS = 100.0
+
+# Levels the generator refers to by name, which are not copied when scaling up the level database.
+UNIQUE_LEVELS = {"GOMEZ_HOUSE", "NATURE_HUB", "INDUSTRIAL_HUB", "SEWER_HUB", "ZU_CITY_RUINS", "GRAVEYARD_GATE",
+                 "CABIN_INTERIOR_A", "CABIN_INTERIOR_B", "WELL_2", "SEWER_START", "OWL", "OBSERVATORY", "LAVA"}
+
+
+def scale_level_info(levels_json: List[Dict[str, Any]], factor: int) -> List[Dict[str, Any]]:
+    """
+    Make a larger level database by adding factor - 1 copies of the levels that aren't referred to by name. Each copy
+    is renamed, along with its doors to other copied levels, so that every copy is wired up like the original.
+
+    Placing a level uses two of its entrances (three for a one-way level) and leaves the rest open, and the real levels
+    have more dead ends than that leaves open exits for. This doesn't matter once, but the generator would run out of
+    open exits on most seeds of a database with several copies, so each copy leaves out enough dead ends to use as many
+    entrances as it opens. Those without collectibles are left out first.
+    """
+    copied = [level for level in levels_json if level["name"] not in UNIQUE_LEVELS]
+    open_exits = sum(len(level["entrances"]) - (3 if level.get("one_way") else 2) for level in copied)
+    dead_ends = sorted((level for level in copied
+                        if len(level["entrances"]) == 1 and not level.get("collectibles", {}).get("keys")),
+                       key=lambda level: bool(level.get("collectibles")))
+    left_out = {level["name"] for level in dead_ends[:max(-open_exits, 0)]}
+    copied = [level for level in copied if level["name"] not in left_out]
+    names = {level["name"] for level in copied}
+
+    output = copy.deepcopy(levels_json)
+    for idx in range(1, factor):
+        def rename(name: str) -> str:
+            base = name.rstrip("*")
+            if base not in names:
+                return name
+            return f"{base}#{idx}" + name[len(base):]
+
+        for level in copied:
+            level_copy = copy.deepcopy(level)
+            level_copy["name"] = rename(level["name"])
+            for entrance in level_copy["entrances"]:
+                entrance["original_destination"] = rename(entrance["original_destination"])
+            output.append(level_copy)
+    return output
+
+
+def _summary(timings: List[float]) -> Dict[str, float]:
+    """Summarize timings (in seconds) in milliseconds."""
+    if not timings:
+        return {}
+    return {
+        "count": len(timings),
+        "mean_ms": statistics.mean(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+        "total_ms": sum(timings) * 1000,
+    }
+
+
+def _time(func: Callable[[], Any], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+@contextmanager
+def _timed(module: Any, name: str, timings: List[float]) -> Iterator[None]:
+    """Record the time of every call to a module level function while in the context."""
+    original = getattr(module, name)
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            timings.append(time.perf_counter() - start)
+
+    setattr(module, name, timed)
+    try:
+        yield
+    finally:
+        setattr(module, name, original)
+
+
+@contextmanager
+def _returns(owner: Any, name: str, times: List[float]) -> Iterator[None]:
+    """Record the time at which every call to a function or method returns while in the context."""
+    original = getattr(owner, name)
+
+    def recorded(*args, **kwargs):
+        try:
+            return original(*args, **kwargs)
+        finally:
+            times.append(time.perf_counter())
+
+    setattr(owner, name, recorded)
+    try:
+        yield
+    finally:
+        setattr(owner, name, original)
+
+
+def measure_startup(repeat: int) -> Dict[str, Any]:
+    """
+    Measure the start up time of a new interpreter, with and without importing the generator.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def run_python(code: str) -> None:
+        subprocess.run([sys.executable, "-c", code], cwd=root, check=True)
+
+    interpreter = statistics.median(_time(lambda: run_python("pass"), repeat)) * 1000
+    with_import = statistics.median(_time(lambda: run_python("import src.randomizer"), repeat)) * 1000
+    return {
+        "interpreter_ms": interpreter,
+        "import_ms": with_import - interpreter,
+        "budget_ms": STARTUP_BUDGET_MS,
+        "within_budget": with_import - interpreter <= STARTUP_BUDGET_MS,
+    }
+
+
+def benchmark_database(raw: bytes, seeds: List[int], repeat: int) -> Dict[str, Any]:
+    """
+    Time every stage on one level database.
+
+    :param raw: The level database as JSON.
+    :param seeds: The seeds to generate.
+    :param repeat: How many times to repeat the stages that don't depend on the seed.
+    """
+    with redirect_stdout(io.StringIO()):
+        graph = LevelGraph(load_levels_from_json(raw))
+    entrances = [e for level in graph.templates for e in level.entrances]
+
+    stages: Dict[str, List[float]] = {
+        "json_load": _time(lambda: load_levels_from_json(raw), repeat),
+        "entrance_pairs": _time(lambda: EntranceIndex(entrances).misconfigured(), repeat),
+        "fresh_state": _time(graph.fresh_state, repeat),
+    }
+    table = graph.entrance_table()
+
+    generate_times: List[float] = []
+    populate_hubs_times: List[float] = []
+    connect_one_way_times: List[float] = []
+    main_loop_times: List[float] = []
+    # generate starts its main loop as soon as it starts tracking the open exits.
+    loop_starts: List[float] = []
+    serialize_times: List[float] = []
+    compact_times: List[float] = []
+    validate_times: List[float] = []
+    failures = 0
+    with redirect_stdout(io.StringIO()) as log, \
+            _timed(randomizer, "populate_hubs", populate_hubs_times), \
+            _timed(randomizer, "connect_one_way", connect_one_way_times), \
+            _returns(GenerationState, "track_open_exits", loop_starts):
+        for seed in seeds:
+            log.seek(0)
+            log.truncate()
+            levels = graph.fresh_state()
+            start = time.perf_counter()
+            try:
+                transitions = randomizer.generate(levels, random.Random(seed), table=table)
+            except Exception:
+                failures += 1
+                continue
+            end = time.perf_counter()
+            generate_times.append(end - start)
+            main_loop_times.append(end - loop_starts[-1])
+
+            serialize_times += _time(lambda: format_config(transitions), 1)
+            compact_times += _time(lambda: encode_compact(to_doors(transitions)), 1)
+            validate_times += _time(lambda: validate(transitions, graph), 1)
+
+    stages.update({
+        "generate": generate_times,
+        "populate_hubs": populate_hubs_times,
+        "main_loop": main_loop_times,
+        "connect_one_way": connect_one_way_times,
+        "serialize_text": serialize_times,
+        "serialize_compact": compact_times,
+        "validate": validate_times,
+    })
+    return {
+        "levels": len(graph),
+        "entrances": len(entrances),
+        # Whether open exits were counted in bulk (see LevelGraph.entrance_table).
+        "vectorized": table is not None,
+        "seeds": len(seeds),
+        "failures": failures,
+        "stages": {name: _summary(timings) for name, timings in stages.items()},
+    }
+
+
+def run(seeds: List[int], scales: List[int], repeat: int) -> Dict[str, Any]:
+    """
+    Run the benchmarks on the real level database scaled by each factor in scales.
+    """
+    with open(LEVEL_INFO_FILE, "rb") as f:
+        raw = f.read()
+    levels_json = json.loads(raw)
+
+    results: Dict[str, Any] = {
+        "benchmark_version": BENCHMARK_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seeds": [min(seeds), max(seeds)],
+        "startup": measure_startup(repeat),
+        "cache_load": _summary(_time(lambda: levels_from_snapshot(read_compiled(LEVEL_INFO_FILE)), repeat)),
+        "scales": {},
+    }
+    for factor in scales:
+        scaled_raw = json.dumps(scale_level_info(levels_json, factor)).encode("UTF-8") if factor > 1 else raw
+        results["scales"][str(factor)] = benchmark_database(scaled_raw, seeds, repeat)
+    return results
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Get the stages whose median time grew by more than threshold (e.g. 0.2 for 20%) since the baseline.
+    """
+    regressions = []
+    startup = current.get("startup")
+    if startup and not startup["within_budget"]:
+        regressions.append(f"importing the generator takes {startup['import_ms']:.1f}ms, over the "
+                           f"{startup['budget_ms']:.0f}ms budget")
+    for factor, scale in current["scales"].items():
+        old_scale = baseline.get("scales", {}).get(factor)
+        if not old_scale:
+            continue
+        for stage, summary in scale["stages"].items():
+            old_summary = old_scale["stages"].get(stage)
+            if not summary or not old_summary:
+                continue
+            ratio = summary["median_ms"] / old_summary["median_ms"] if old_summary["median_ms"] else 1.0
+            if ratio > 1 + threshold:
+                regressions.append(f"x{factor} {stage}: {old_summary['median_ms']:.3f}ms -> "
+                                   f"{summary['median_ms']:.3f}ms ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    """
+    Script for benchmarking the generator.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seeds", default=200, type=int, help="The number of seeds in the corpus (seeds 1 to N).")
+    parser.add_argument("--scales", default="1,10", help="Comma separated factors to scale the level database by.")
+    parser.add_argument("--repeat", default=20, type=int, help="Repetitions of the stages that don't use a seed.")
+    parser.add_argument("--output", required=False, help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", required=False, help="Results of an earlier run to check for regressions.")
+    parser.add_argument("--threshold", default=0.2, type=float,
+                        help="Slowdown of a stage's median time reported as a regression.")
+    options = parser.parse_args()
+
+    results = run(list(range(1, options.seeds + 1)), [int(s) for s in options.scales.split(",")], options.repeat)
+    output = json.dumps(results, indent=4)
+    if options.output:
+        with open(options.output, "w", encoding="UTF-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    for factor, scale in results["scales"].items():
+        if scale["failures"]:
+            print(f"x{factor}: {scale['failures']} of {scale['seeds']} seeds failed to generate and were not timed",
+                  file=sys.stderr)
+
+    if options.compare:
+        with open(options.compare, "r", encoding="UTF-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, options.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
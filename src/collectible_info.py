@@ -1,6 +1,9 @@
 from dataclasses import dataclass
+import sys
+import threading
+from typing import Dict, Union
 
-@dataclass(unsafe_hash=True)
+@dataclass(frozen=True)
 class CollectibleInfo:
     golden_cubes: int = 0
     anti_cubes: int = 0
@@ -11,9 +14,14 @@ class CollectibleInfo:
     water_lower: bool = False
     other: str = ""
 
+    def __post_init__(self) -> None:
+        # The collectibles never change, so whether there are any is only worked out once.
+        object.__setattr__(self, "_any", not (
+            self.golden_cubes == 0 and self.anti_cubes == 0 and self.heart_pieces == 0 and self.bits == 0
+            and self.keys == 0 and self.owls == 0 and self.water_lower == False and self.other == ""))
+
     def __bool__(self):
-        return not (self.golden_cubes == 0 and self.anti_cubes == 0 and self.heart_pieces == 0 and self.bits == 0
-                    and self.keys == 0 and self.owls == 0 and self.water_lower == False and self.other == "")
+        return self._any
 
     def __not__(self):
         return not bool(self)
@@ -35,3 +43,87 @@ class CollectibleInfo:
     
     def total_cubes(self) -> int:
         return self.golden_cubes + self.anti_cubes + self.bits // 8
+
+
+# Every distinct value of CollectibleInfo.other seen so far, as a bit in CollectibleCounter.other_flags. There is one
+# entry per distinct value in the level database, so this stays small.
+_other_flags: Dict[str, int] = {}
+_other_flags_lock = threading.Lock()
+# CollectibleCounter.other for every combination of flags asked for so far. Flags are never reassigned, so these never
+# change.
+_other_names: Dict[int, str] = {}
+
+
+def _other_flag(other: str) -> int:
+    if not other:
+        return 0
+    try:
+        return _other_flags[other]
+    except KeyError:
+        # Assigning the next bit has to be atomic, or two threads could give different values the same bit.
+        with _other_flags_lock:
+            return _other_flags.setdefault(sys.intern(other), 1 << len(_other_flags))
+
+
+class CollectibleCounter:
+    """
+    Running total of the collectibles obtained during a run. Unlike adding CollectibleInfo objects, adding to a counter
+    updates it in place, the cube total is kept up to date rather than recomputed, and the 'other' collectibles are
+    tracked as bit flags instead of a growing string.
+
+    Only change the cube counts through +=, so that the cube total stays correct. The keys can be changed directly.
+    """
+
+    __slots__ = ("golden_cubes", "anti_cubes", "heart_pieces", "bits", "keys", "owls", "water_lower", "other_flags",
+                 "_total_cubes")
+
+    def __init__(self, golden_cubes: int = 0, anti_cubes: int = 0, heart_pieces: int = 0, bits: int = 0, keys: int = 0,
+                 owls: int = 0, water_lower: bool = False, other_flags: int = 0) -> None:
+        self.golden_cubes = golden_cubes
+        self.anti_cubes = anti_cubes
+        self.heart_pieces = heart_pieces
+        self.bits = bits
+        self.keys = keys
+        self.owls = owls
+        self.water_lower = water_lower
+        self.other_flags = other_flags
+        self._total_cubes = golden_cubes + anti_cubes + bits // 8
+
+    def __iadd__(self, other: object) -> 'CollectibleCounter':
+        if not isinstance(other, CollectibleInfo):
+            return NotImplemented
+        self.golden_cubes += other.golden_cubes
+        self.anti_cubes += other.anti_cubes
+        self.heart_pieces += other.heart_pieces
+        self.bits += other.bits
+        self.keys += other.keys
+        self.owls += other.owls
+        self.water_lower = self.water_lower or other.water_lower
+        self.other_flags |= _other_flag(other.other)
+        self._total_cubes = self.golden_cubes + self.anti_cubes + self.bits // 8
+        return self
+
+    def __repr__(self) -> str:
+        return (f"CollectibleCounter(golden_cubes={self.golden_cubes}, anti_cubes={self.anti_cubes}, "
+                f"heart_pieces={self.heart_pieces}, bits={self.bits}, keys={self.keys}, owls={self.owls}, "
+                f"water_lower={self.water_lower}, other={self.other!r})")
+
+    @property
+    def other(self) -> str:
+        """The 'other' collectibles obtained, in the order they were first seen."""
+        try:
+            return _other_names[self.other_flags]
+        except KeyError:
+            names = ", ".join(name for name, flag in list(_other_flags.items()) if self.other_flags & flag)
+            return _other_names.setdefault(self.other_flags, names)
+
+    def copy(self) -> 'CollectibleCounter':
+        return CollectibleCounter(self.golden_cubes, self.anti_cubes, self.heart_pieces, self.bits, self.keys,
+                                  self.owls, self.water_lower, self.other_flags)
+
+    def total_cubes(self) -> int:
+        return self._total_cubes
+
+
+# Anything that entrance requirements can be checked against.
+Collectibles = Union[CollectibleInfo, CollectibleCounter]
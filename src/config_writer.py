@@ -0,0 +1,125 @@
+"""
+Writing and reading mod config files.
+
+The mod reads a text config with two five-line blocks per transition, one for each direction. For tools that handle
+large numbers of seeds there is also a compact binary encoding of the same information, which can be read back without
+parsing the text.
+"""
+
+import io
+import struct
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, TextIO, Tuple
+
+from .entrance import Entrance, Transition, config_block, normalize
+
+COMPACT_MAGIC = b"FEZC"
+COMPACT_VERSION = 1
+
+
+class Door(NamedTuple):
+    """The parts of an entrance that are written to the config."""
+    level: str
+    original_destination: str
+    volume_id: int
+    viewpoint: str
+
+    @classmethod
+    def from_entrance(cls, entrance: Entrance) -> 'Door':
+        return cls(entrance.level, entrance.original_destination, entrance.volume_id, entrance.viewpoint)
+
+
+# A transition, as the doors on each side of it.
+DoorPair = Tuple[Door, Door]
+
+
+def format_doors(pairs: Iterable[DoorPair]) -> str:
+    """Get the text config for a list of door pairs."""
+    return "".join([config_block(source, dest) + config_block(dest, source) for source, dest in pairs])
+
+
+def to_doors(transitions: Iterable[Transition]) -> List[DoorPair]:
+    return [(Door.from_entrance(t.source), Door.from_entrance(t.dest)) for t in transitions]
+
+
+def format_config(transitions: Iterable[Transition]) -> str:
+    """Get the contents of the mod config file for a list of transitions."""
+    return format_doors(to_doors(transitions))
+
+
+def write_config(transitions: Iterable[Transition], f: TextIO) -> None:
+    """
+    Write the text config to any text stream (a file, sys.stdout, io.StringIO, ...) in a single write.
+    """
+    f.write(format_config(transitions))
+
+
+def encode_compact(pairs: Iterable[DoorPair]) -> bytes:
+    """
+    Encode door pairs in the compact format: a header, a table of every distinct string, and then four little-endian
+    unsigned shorts (level, original destination, volume id, viewpoint) per door.
+    """
+    pairs = list(pairs)
+    strings: Dict[str, int] = {}
+    doors = []
+    for pair in pairs:
+        for door in pair:
+            doors.append((strings.setdefault(door.level, len(strings)),
+                          strings.setdefault(door.original_destination, len(strings)),
+                          door.volume_id,
+                          strings.setdefault(door.viewpoint, len(strings))))
+
+    output = io.BytesIO()
+    output.write(COMPACT_MAGIC + struct.pack("<BHH", COMPACT_VERSION, len(strings), len(pairs)))
+    for string in strings:
+        encoded = string.encode("UTF-8")
+        output.write(struct.pack("<B", len(encoded)) + encoded)
+    output.write(struct.pack(f"<{len(doors) * 4}H", *(value for door in doors for value in door)))
+    return output.getvalue()
+
+
+def decode_compact(data: bytes) -> List[DoorPair]:
+    """Decode door pairs written by encode_compact, from bytes or a memory map of them."""
+    if data[:len(COMPACT_MAGIC)] != COMPACT_MAGIC:
+        raise ValueError("Not a compact config.")
+    offset = len(COMPACT_MAGIC)
+    version, num_strings, num_pairs = struct.unpack_from("<BHH", data, offset)
+    if version != COMPACT_VERSION:
+        raise ValueError(f"Unsupported compact config version {version}.")
+    offset += struct.calcsize("<BHH")
+    strings = []
+    for _ in range(num_strings):
+        length = data[offset]
+        strings.append(str(data[offset + 1:offset + 1 + length], "UTF-8"))
+        offset += 1 + length
+    values = struct.unpack_from(f"<{num_pairs * 8}H", data, offset)
+    doors = [Door(strings[values[i]], strings[values[i + 1]], values[i + 2], strings[values[i + 3]])
+             for i in range(0, len(values), 4)]
+    return [(doors[i], doors[i + 1]) for i in range(0, len(doors), 2)]
+
+
+def write_compact(transitions: Iterable[Transition], f: BinaryIO) -> None:
+    """Write the compact config to a binary stream in a single write."""
+    f.write(encode_compact(to_doors(transitions)))
+
+
+def parse_text(text: str) -> List[DoorPair]:
+    """
+    Parse a text config back into door pairs. The text config only has the level names with their trailing '*' removed,
+    so these are what the doors will hold.
+    """
+    blocks = [block.split("\n") for block in text.split("\n\n") if block.strip()]
+    if len(blocks) % 2:
+        raise ValueError("A config must have two blocks for every transition.")
+    pairs = []
+    for there, back in zip(blocks[::2], blocks[1::2]):
+        pairs.append((Door(there[0], there[1], int(back[3]), back[4]),
+                      Door(back[0], back[1], int(there[3]), there[4])))
+    return pairs
+
+
+def read_config(f: BinaryIO) -> List[DoorPair]:
+    """Read a config in either format from a binary stream."""
+    data = f.read()
+    if data.startswith(COMPACT_MAGIC):
+        return decode_compact(data)
+    return parse_text(data.decode("UTF-8"))
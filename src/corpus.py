@@ -0,0 +1,429 @@
+"""
+Seed corpora: the transitions of many seeds in a single file.
+
+Each seed is stored as a record of entrance ids, two per transition, where an entrance id is the position of the
+entrance in the level database (LevelGraph.entrance_index.entrances). Records are length prefixed and appended to the
+corpus file in chunks, and the seed and offset of every record are appended to an index file next to it (<corpus>.idx).
+A corpus can be added to by later exports, and CorpusReader memory-maps both files, so any record can be read, by its
+position or its seed, without reading the ones before it.
+
+Exporting keeps its memory use bounded, however many seeds are exported: seeds are generated in chunks on worker
+processes, only a few chunks are in flight at once, and their records are written out as soon as they arrive.
+"""
+
+import argparse
+from array import array
+from dataclasses import dataclass
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .batch import chunks, map_chunks, quiet_range
+from .entrance import Entrance, Transition
+from .level_cache import load_level_graph
+from .level_graph import LevelGraph
+from .randomizer import ENGINES, LEVEL_INFO_FILE, generate_single
+
+# Bump this whenever the layout of the corpus or index file changes.
+CORPUS_VERSION = 2
+
+# Records are collected in memory until they take up this many bytes, then written out together.
+DEFAULT_CHUNK_BYTES = 1024 * 1024
+
+_MAGIC = b"FEZCORP"
+# The magic, the version and the SHA-256 of the level database the entrance ids refer to.
+_HEADER = struct.Struct("<7sB32s")
+# The seed, and the number of entrance ids that follow (as little-endian unsigned shorts).
+_RECORD = struct.Struct("<QI")
+# The seed and offset of a record, in the index.
+_INDEX_ENTRY = struct.Struct("<QQ")
+
+_INDEX_SUFFIX = ".idx"
+
+_BIG_ENDIAN = sys.byteorder == "big"
+
+# A seed's transitions, as the entrance ids of the source and destination of each one.
+Record = array
+
+
+def index_file_for(path: str) -> str:
+    """Get the path of the index of a corpus."""
+    return path + _INDEX_SUFFIX
+
+
+def entrance_ids(graph: LevelGraph) -> Dict[Entrance, int]:
+    """
+    Get the id of every entrance of a level database.
+
+    :raises ValueError: If the database has too many entrances for the ids to fit in a record.
+    """
+    entrances = graph.entrance_index.entrances
+    if len(entrances) > 0xFFFF:
+        raise ValueError(f"The level database has {len(entrances)} entrances, records can only refer to 65536.")
+    return {e: idx for idx, e in enumerate(entrances)}
+
+
+def to_record(transitions: Iterable[Transition], ids: Dict[Entrance, int]) -> Record:
+    """Get the record of a seed's transitions."""
+    return array("H", [ids[e] for t in transitions for e in (t.source, t.dest)])
+
+
+def from_record(record: Record, graph: LevelGraph) -> List[Transition]:
+    """Get the transitions of a record back, from the level database it was written with."""
+    entrances = graph.entrance_index.entrances
+    return [Transition(entrances[record[idx]], entrances[record[idx + 1]]) for idx in range(0, len(record), 2)]
+
+
+def _level_info_digest(level_info_hash: str) -> bytes:
+    return bytes.fromhex(level_info_hash)
+
+
+def _read_header(f, level_info_hash: Optional[str]) -> None:
+    """
+    Check the header of a corpus file.
+
+    :raises ValueError: If it isn't a corpus, or was written with another version or level database.
+    """
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size or not header.startswith(_MAGIC):
+        raise ValueError("Not a seed corpus.")
+    _, version, digest = _HEADER.unpack(header)
+    if version != CORPUS_VERSION:
+        raise ValueError(f"Unsupported corpus version {version}.")
+    if level_info_hash is not None and digest != _level_info_digest(level_info_hash):
+        raise ValueError("The corpus was written with a different level database.")
+
+
+class CorpusWriter:
+    """
+    Appends records to a corpus, creating it if it doesn't exist.
+    """
+
+    def __init__(self, path: str, level_info_hash: str, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> None:
+        """
+        :param path: The corpus file. Its index is written next to it.
+        :param level_info_hash: The hash of the level database the records refer to (see seed_cache.hash_level_info).
+        :param chunk_bytes: Write the records out whenever this many bytes of them have been collected.
+        :raises ValueError: If the file exists, but isn't a corpus of the same version and level database.
+        """
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+        self._data = open(path, "a+b")
+        self._index = open(index_file_for(path), "a+b")
+        self._data.seek(0)
+        if self._data.read(1):
+            self._data.seek(0)
+            _read_header(self._data, level_info_hash)
+            self._recover()
+        else:
+            self._data.write(_HEADER.pack(_MAGIC, CORPUS_VERSION, _level_info_digest(level_info_hash)))
+            self._index.truncate(0)
+        self._end = self._data.seek(0, os.SEEK_END)
+        # Records collected since the last write, with their index entries.
+        self._buffer = bytearray()
+        self._entries = bytearray()
+        self.records = 0
+
+    def _recover(self) -> None:
+        """
+        Bring the index up to date with the corpus after an interrupted export. Records are written before their
+        offsets, so the complete records past the last one in the index are added to it, and a partly written record
+        at the end is dropped. This also rebuilds a missing index.
+        """
+        # Start again from the last record in the index, in case that is the one that was cut off.
+        data_size = self._data.seek(0, os.SEEK_END)
+        size = self._index.seek(0, os.SEEK_END)
+        size -= size % _INDEX_ENTRY.size
+        end = _HEADER.size
+        if size:
+            size -= _INDEX_ENTRY.size
+            self._index.seek(size)
+            _, end = _INDEX_ENTRY.unpack(self._index.read(_INDEX_ENTRY.size))
+            if end > data_size:
+                # The index doesn't belong to this corpus, rebuild all of it.
+                size, end = 0, _HEADER.size
+        self._index.truncate(size)
+        entries = bytearray()
+        while end + _RECORD.size <= data_size:
+            self._data.seek(end)
+            seed, length = _RECORD.unpack(self._data.read(_RECORD.size))
+            if end + _RECORD.size + 2 * length > data_size:
+                break
+            entries += _INDEX_ENTRY.pack(seed, end)
+            end += _RECORD.size + 2 * length
+        self._data.truncate(end)
+        self._index.write(entries)
+        self._index.flush()
+
+    def append(self, seed: int, record: Record) -> None:
+        """
+        Add a seed's record to the corpus.
+
+        :raises ValueError: If the seed doesn't fit in an unsigned 64 bit integer.
+        """
+        if not 0 <= seed < 1 << 64:
+            raise ValueError(f"Seed {seed} can't be stored in a corpus.")
+        self._entries += _INDEX_ENTRY.pack(seed, self._end + len(self._buffer))
+        self._buffer += _RECORD.pack(seed, len(record))
+        if _BIG_ENDIAN:
+            record = array("H", record)
+            record.byteswap()
+        self._buffer += record.tobytes()
+        self.records += 1
+        if len(self._buffer) >= self.chunk_bytes:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write out the records collected so far, then their index entries."""
+        if not self._buffer:
+            return
+        self._data.write(self._buffer)
+        self._data.flush()
+        self._index.write(self._entries)
+        self._index.flush()
+        self._end += len(self._buffer)
+        self._buffer.clear()
+        self._entries.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self) -> 'CorpusWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class CorpusReader:
+    """
+    Reads the records of a corpus by their position or their seed, through memory maps of the corpus and its index.
+    """
+
+    def __init__(self, path: str, level_info_hash: Optional[str] = None) -> None:
+        """
+        :param path: The corpus file.
+        :param level_info_hash: If given, check that the corpus was written with this level database.
+        :raises ValueError: If the file isn't a corpus of this version, or of the given level database.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            _read_header(f, level_info_hash)
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # mmap refuses empty files, so an empty index isn't mapped.
+        self._index: Optional[mmap.mmap] = None
+        self._count = 0
+        with open(index_file_for(path), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= _INDEX_ENTRY.size:
+                self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._count = size // _INDEX_ENTRY.size
+        # Only the records that were completely written when the corpus was opened are read.
+        while self._count and self._end_of(self._count - 1) > len(self._data):
+            self._count -= 1
+        # The position of every seed, built from the index the first time a seed is looked up.
+        self._positions: Optional[Dict[int, int]] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _offset(self, idx: int) -> int:
+        assert self._index is not None
+        return _INDEX_ENTRY.unpack_from(self._index, idx * _INDEX_ENTRY.size)[1]
+
+    def _end_of(self, idx: int) -> int:
+        offset = self._offset(idx)
+        if offset + _RECORD.size > len(self._data):
+            return offset + _RECORD.size
+        return offset + _RECORD.size + 2 * _RECORD.unpack_from(self._data, offset)[1]
+
+    def __getitem__(self, idx: int) -> Tuple[int, Record]:
+        """
+        Get the seed and record at a position in the corpus.
+
+        :raises IndexError: If there is no record there.
+        """
+        if idx < 0:
+            idx += self._count
+        if not 0 <= idx < self._count:
+            raise IndexError(f"The corpus has no record {idx}.")
+        offset = self._offset(idx)
+        seed, length = _RECORD.unpack_from(self._data, offset)
+        start = offset + _RECORD.size
+        record = array("H", self._data[start:start + 2 * length])
+        if _BIG_ENDIAN:
+            record.byteswap()
+        return seed, record
+
+    def __iter__(self) -> Iterator[Tuple[int, Record]]:
+        for idx in range(self._count):
+            yield self[idx]
+
+    def by_seed(self, seed: int) -> Record:
+        """
+        Get the record of a seed. A seed that was exported more than once gives its latest record.
+
+        :raises KeyError: If the corpus has no record of the seed.
+        """
+        if self._positions is None:
+            self._positions = {}
+            if self._index is not None:
+                entries = memoryview(self._index)[:self._count * _INDEX_ENTRY.size]
+                for idx, (indexed_seed, _) in enumerate(_INDEX_ENTRY.iter_unpack(entries)):
+                    self._positions[indexed_seed] = idx
+                entries.release()
+        if seed not in self._positions:
+            raise KeyError(f"The corpus has no record of seed {seed}.")
+        return self[self._positions[seed]][1]
+
+    def transitions(self, idx: int, graph: LevelGraph) -> Tuple[int, List[Transition]]:
+        """Get the seed and transitions at a position in the corpus, from the level database it was written with."""
+        seed, record = self[idx]
+        return seed, from_record(record, graph)
+
+    def close(self) -> None:
+        self._data.close()
+        if self._index is not None:
+            self._index.close()
+
+    def __enter__(self) -> 'CorpusReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+@dataclass
+class ExportSummary:
+    """Class for storing the outcome of an export."""
+    records: int = 0
+    failures: int = 0
+    elapsed: float = 0.0
+
+    def __str__(self) -> str:
+        seeds = self.records + self.failures
+        rate = seeds / self.elapsed if self.elapsed else 0.0
+        return (f"Exported {self.records} seeds ({self.failures} failed to generate) in {self.elapsed:.2f}s "
+                f"({rate:.1f} seeds/s).")
+
+
+# The level database, its entrance ids and the settings, loaded once per worker process.
+_graph: Optional[LevelGraph] = None
+_ids: Dict[Entrance, int] = {}
+_max_attempts: Optional[int] = None
+_engine = "random"
+
+
+def _init_worker(level_info_file: str, max_attempts: Optional[int], engine: str) -> None:
+    global _graph, _ids, _max_attempts, _engine
+    _graph = load_level_graph(level_info_file)
+    _ids = entrance_ids(_graph)
+    _max_attempts = max_attempts
+    _engine = engine
+
+
+def _generate_chunk(seeds: Tuple[int, int]) -> List[Tuple[int, Optional[Record]]]:
+    """Generate the seeds in [start, stop), as in batch.generate_seed, and get their records."""
+    assert _graph is not None
+    records: List[Tuple[int, Optional[Record]]] = []
+    for seed in quiet_range(seeds):
+        try:
+            transitions, _, _, _ = generate_single(_graph, seed, _max_attempts, engine=_engine)
+        except Exception:
+            records.append((seed, None))
+            continue
+        records.append((seed, to_record(transitions, _ids)))
+    return records
+
+
+def generate_records(start: int, count: int, jobs: Optional[int] = None, level_info_file: str = LEVEL_INFO_FILE,
+                     max_attempts: Optional[int] = None, engine: str = "random",
+                     chunk_size: int = 200) -> Iterator[Tuple[int, Optional[Record]]]:
+    """
+    Generate consecutive seeds, and yield their records in seed order as they are generated.
+
+    :param start: The first seed.
+    :param count: The number of seeds.
+    :param jobs: The number of worker processes. Defaults to the number of CPUs; 1 runs in this process.
+    :param level_info_file: The level database to generate from.
+    :param max_attempts: If set, degraded seeds are rejected and retried up to this many times (see
+                         generate_with_retries). The record is still stored under the seed asked for.
+    :param engine: The placement engine to use (see randomizer.ENGINES).
+    :param chunk_size: The number of seeds handed to a worker at a time.
+    :return: The seeds with their records, or None for seeds that failed to generate.
+    """
+    # Only a couple of chunks per worker are in flight, so memory use doesn't grow with the number of seeds.
+    for records in map_chunks(_generate_chunk, chunks(start, count, chunk_size), jobs, _init_worker,
+                              (level_info_file, max_attempts, engine)):
+        yield from records
+
+
+def export(path: str, start: int, count: int, jobs: Optional[int] = None, level_info_file: str = LEVEL_INFO_FILE,
+           max_attempts: Optional[int] = None, engine: str = "random") -> ExportSummary:
+    """
+    Generate consecutive seeds and append their records to a corpus. Seeds that fail to generate are left out.
+
+    :raises ValueError: If the corpus exists, but was written with another version or level database.
+    """
+    from .seed_cache import hash_level_info
+
+    started = time.perf_counter()
+    summary = ExportSummary()
+    with CorpusWriter(path, hash_level_info(level_info_file)) as writer:
+        for seed, record in generate_records(start, count, jobs, level_info_file, max_attempts, engine):
+            if record is None:
+                summary.failures += 1
+            else:
+                writer.append(seed, record)
+                summary.records += 1
+    summary.elapsed = time.perf_counter() - started
+    return summary
+
+
+def main():
+    """
+    Script for exporting seeds to a corpus, and reading them back.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="The corpus file. Exported seeds are appended to it.")
+    parser.add_argument("--seed", default=1, type=int, help="The first seed to export.")
+    parser.add_argument("--count", default=1000, type=int, help="The number of seeds to export.")
+    parser.add_argument("--jobs", required=False, type=int, help="Number of worker processes.")
+    parser.add_argument("--max-attempts", required=False, type=int,
+                        help="Reject degraded seeds and retry with a derived seed, up to this many attempts.")
+    parser.add_argument("--engine", choices=ENGINES, default="random", help="The placement engine to generate with.")
+    parser.add_argument("--show", required=False, type=int,
+                        help="Instead of exporting, print the text config of the record at this position.")
+    options = parser.parse_args()
+
+    if options.show is not None:
+        from .config_writer import format_config
+        from .seed_cache import hash_level_info
+        try:
+            with CorpusReader(options.corpus, hash_level_info(LEVEL_INFO_FILE)) as reader:
+                seed, transitions = reader.transitions(options.show, load_level_graph(LEVEL_INFO_FILE))
+        except (ValueError, IndexError) as e:
+            parser.error(str(e))
+        print(f"Seed {seed} (record {options.show} of {len(reader)}):", file=sys.stderr)
+        sys.stdout.write(format_config(transitions))
+        return
+
+    if options.seed < 0 or options.seed + options.count > 1 << 64:
+        parser.error("Only seeds from 0 to 2**64 - 1 can be exported.")
+    try:
+        summary = export(options.corpus, options.seed, options.count, options.jobs, max_attempts=options.max_attempts,
+                         engine=options.engine)
+    except ValueError as e:
+        parser.error(str(e))
+    print(summary)
+    with CorpusReader(options.corpus) as reader:
+        print(f"{options.corpus} holds {len(reader)} seeds in {os.path.getsize(options.corpus)} bytes.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,34 @@ Class for storing information about level transitions.
 """
 
 from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from collectible_info import CollectibleInfo
-@dataclass
+from .collectible_info import Collectibles
+
+# The two halves of the cabin, which are always placed together, and which the mod treats as each other.
+CABIN_PARTNERS = {"CABIN_INTERIOR_A": "CABIN_INTERIOR_B", "CABIN_INTERIOR_B": "CABIN_INTERIOR_A"}
+
+# The level names as written to the config, cached as every name is written many times.
+_normalized: Dict[str, str] = {}
+
+
+def normalize(name: str) -> str:
+    """Get a level name as it is written to the config."""
+    try:
+        return _normalized[name]
+    except KeyError:
+        return _normalized.setdefault(name, name.strip("*"))
+
+
+def config_block(source: Any, dest: Any) -> str:
+    """
+    Get the mod config block for travelling from source to dest, which can be entrances or config_writer.Doors.
+    """
+    return (f"{normalize(source.level)}\n{normalize(source.original_destination)}\n"
+            f"{CABIN_PARTNERS.get(dest.level) or normalize(dest.level)}\n{dest.volume_id}\n{dest.viewpoint}\n\n")
+
+
+@dataclass(frozen=True)
 class Entrance:
     """Class for information about a single entrance."""
     level: str
@@ -22,7 +47,11 @@ class Entrance:
         """Do not allow exiting from locked doors."""
         return not (self.locked or self.cubes_required != 0 or self.is_underwater or self.needs_owls or self.needs_switch)
 
-    def can_enter(self, current_collectibles: CollectibleInfo):
+    def is_gated(self) -> bool:
+        """Return whether or not can_enter depends on the collectibles."""
+        return self.locked or self.cubes_required > 0 or self.is_underwater or self.needs_owls
+
+    def can_enter(self, current_collectibles: Collectibles):
         """Return whether or not this entrance can be accessed."""
         if self.locked:
             return current_collectibles.keys > 0
@@ -42,28 +71,43 @@ class Transition:
     dest: Entrance
 
     def __str__(self) -> str:
-        output = ""
-        # Source -> Dest transition.
-        output += self.source.level.strip("*") + '\n'
-        output += self.source.original_destination.strip("*") + '\n'
-        if self.dest.level == "CABIN_INTERIOR_A":
-            output += "CABIN_INTERIOR_B\n"
-        elif self.dest.level == "CABIN_INTERIOR_B":
-            output += "CABIN_INTERIOR_A\n"
-        else:
-            output += self.dest.level.strip("*") + '\n'
-        output += str(self.dest.volume_id) + '\n'
-        output += self.dest.viewpoint + '\n\n'
-        # Dest -> Source transition
-        output += self.dest.level.strip("*") + '\n'
-        output += self.dest.original_destination.strip("*") + '\n'
-        if self.source.level == "CABIN_INTERIOR_A":
-            output += "CABIN_INTERIOR_B\n"
-        elif self.source.level == "CABIN_INTERIOR_B":
-            output += "CABIN_INTERIOR_A\n"
-        else:
-            output += self.source.level.strip("*") + '\n'
-        output += str(self.source.volume_id) + '\n'
-        output += self.source.viewpoint + '\n\n'
-        return output
+        return config_block(self.source, self.dest) + config_block(self.dest, self.source)
+
+
+class EntranceIndex:
+    """
+    Index of entrances keyed on (level, original_destination), used to look up the vanilla partner of each entrance
+    (the door on the other side of it in the unrandomized game).
+    """
+
+    def __init__(self, entrances: Iterable[Entrance]) -> None:
+        self.entrances = list(entrances)
+        self._by_door: Dict[Tuple[str, str], Entrance] = {}
+        # Entrances with the same level and original destination as an earlier one, which can't be told apart.
+        self.duplicates: List[Entrance] = []
+        for entrance in self.entrances:
+            door = (entrance.level, entrance.original_destination)
+            if door in self._by_door:
+                self.duplicates.append(entrance)
+            else:
+                self._by_door[door] = entrance
+
+    def get(self, level: str, original_destination: str) -> Optional[Entrance]:
+        """Get the entrance in level that originally led to original_destination."""
+        return self._by_door.get((level, original_destination))
+
+    def vanilla_partner(self, entrance: Entrance) -> Optional[Entrance]:
+        """Get the entrance that this entrance originally led to, if it is in the index."""
+        return self._by_door.get((entrance.original_destination, entrance.level))
 
+    def misconfigured(self) -> List[Entrance]:
+        """
+        Get every entrance without a vanilla partner, and every duplicate entrance (only the first of these is indexed,
+        so the others would be paired with the wrong door). The cabin interiors don't need a partner, as they are
+        really a single level split in two.
+        """
+        unpaired = [e for e in self.entrances
+                    if self.vanilla_partner(e) is None
+                    and not (e.level.startswith("CABIN_INTERIOR")
+                             or e.original_destination.startswith("CABIN_INTERIOR"))]
+        return unpaired + self.duplicates
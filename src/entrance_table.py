@@ -0,0 +1,101 @@
+"""
+The requirements of every entrance in a level database, stored as NumPy columns.
+
+Level.open_exits and Level.num_exits check one entrance at a time, which is what the generator spends its time on with
+large (modded) level databases. With the requirements in columns, which entrances are open is worked out for the whole
+database with a few masked operations, and the counts per level with a single bincount. NumPy is optional: without it
+(or for small databases, where the per-level checks are faster) LevelGraph.entrance_table returns None and the
+generator counts exits level by level as before. Both give the same counts, so seeds don't depend on which is used.
+"""
+
+from typing import List, Sequence
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .collectible_info import Collectibles
+from .level import Level
+
+
+def available() -> bool:
+    """Return whether or not NumPy is installed, which EntranceTable needs."""
+    return numpy is not None
+
+
+class EntranceTable:
+    """
+    Columns of entrance requirements, with a row for every entrance of every level in database order. Which entrances
+    are still unused differs between runs, so it is kept in a separate mask (see new_mask).
+    """
+
+    def __init__(self, levels: Sequence[Level]) -> None:
+        """
+        :param levels: The levels of a LevelGraph, in order of their ids.
+        :raises ImportError: If NumPy isn't installed.
+        """
+        if numpy is None:
+            raise ImportError("EntranceTable needs NumPy.")
+        entrances = [e for level in levels for e in level.entrances]
+        # The first row of each level, and the number of rows it has.
+        self.sizes: List[int] = [len(level.entrances) for level in levels]
+        self.starts: List[int] = [0] * len(levels)
+        for idx in range(1, len(levels)):
+            self.starts[idx] = self.starts[idx - 1] + self.sizes[idx - 1]
+
+        self.level = numpy.repeat(numpy.arange(len(levels)), self.sizes)
+        self.locked = numpy.array([e.locked for e in entrances], dtype=bool)
+        self.cubes_required = numpy.array([e.cubes_required for e in entrances], dtype=numpy.int64)
+        self.is_underwater = numpy.array([e.is_underwater for e in entrances], dtype=bool)
+        self.needs_owls = numpy.array([e.needs_owls for e in entrances], dtype=bool)
+        self.needs_switch = numpy.array([e.needs_switch for e in entrances], dtype=bool)
+
+        # The gate that decides each entrance, in the order Entrance.can_enter checks them.
+        not_locked = ~self.locked
+        self._cube_gated = not_locked & (self.cubes_required > 0)
+        self._water_gated = not_locked & (self.cubes_required == 0) & self.is_underwater
+        self._owl_gated = not_locked & (self.cubes_required == 0) & ~self.is_underwater & self.needs_owls
+        # Entrance.can_exit for every row.
+        self._can_exit = ~(self.locked | (self.cubes_required != 0) | self.is_underwater | self.needs_owls
+                           | self.needs_switch)
+
+    def __len__(self) -> int:
+        return len(self.level)
+
+    def new_mask(self) -> 'numpy.ndarray':
+        """Get a mask of the unused entrances for a new run, where every entrance is unused."""
+        return numpy.ones(len(self), dtype=bool)
+
+    def update_mask(self, mask: 'numpy.ndarray', level: Level) -> None:
+        """Update the rows of a level in a mask after some of its entrances have been used."""
+        unused = {id(e) for e in level.unused_entrances}
+        start = self.starts[level.id]
+        mask[start:start + self.sizes[level.id]] = [id(e) in unused for e in level.entrances]
+
+    def open_counts(self, mask: 'numpy.ndarray', collectibles: Collectibles) -> List[int]:
+        """
+        Count the unused entrances of every level that can be entered with the collectibles, as Level.open_exits does.
+
+        :return: The counts, indexed by level id.
+        """
+        closed = (self._cube_gated & (self.cubes_required > collectibles.total_cubes()))
+        if collectibles.keys <= 0:
+            closed |= self.locked
+        if not collectibles.water_lower:
+            closed |= self._water_gated
+        if collectibles.owls != 4:
+            closed |= self._owl_gated
+        return self._count(mask & ~closed)
+
+    def exit_counts(self, mask: 'numpy.ndarray') -> List[int]:
+        """
+        Count the unused entrances of every level that can be exited from, as Level.num_exits does.
+
+        :return: The counts, indexed by level id.
+        """
+        return self._count(mask & self._can_exit)
+
+    def _count(self, rows: 'numpy.ndarray') -> List[int]:
+        # As a list, since indexing it from Python is much faster than indexing an array.
+        return numpy.bincount(self.level[rows], minlength=len(self.sizes)).tolist()
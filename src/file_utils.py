@@ -0,0 +1,30 @@
+"""
+Helpers for the files the tools keep on disk, such as the level cache and the seed cache.
+"""
+
+import os
+import sys
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """
+    Write a file so that concurrent readers only ever see the old or the new contents. A failed write is reported and
+    otherwise ignored, as the files written this way are only caches: a read-only install still works, it just can't
+    benefit from them.
+    """
+    # Unique to this process and call, so that concurrent writers (other processes, or threads of this one) never share
+    # a temporary file.
+    tmp_path = f"{path}.{os.getpid()}.{os.urandom(4).hex()}.tmp"
+    created = False
+    try:
+        # With the mode open() gives new files (0o666 less the umask, which the kernel applies), so that shared installs
+        # and cache directories can be read by other users.
+        fd = os.open(tmp_path, os.O_CREAT | os.O_WRONLY | os.O_EXCL, 0o666)
+        created = True
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        if created and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        print(f"Warning: could not write cache file {path}: {e}", file=sys.stderr)
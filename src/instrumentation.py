@@ -0,0 +1,162 @@
+"""
+Opt-in instrumentation of the generator's hot paths.
+
+Nothing here is active until Profiler.install is called, which swaps the instrumented functions for timing wrappers.
+Profiler.uninstall puts the originals back, so a run without profiling executes exactly the same code as before.
+"""
+
+from contextlib import contextmanager
+import functools
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .entrance import Entrance
+from .level import Level
+from .level_graph import GenerationState, SeedStats
+
+# Called with the name of every instrumented call and its duration in seconds, or 0.0 for fallback events.
+Listener = Callable[[str, float], None]
+
+# Fallback paths of the generator, recognised by the warning they report.
+FALLBACKS: List[Tuple[str, str]] = [
+    ("Unreachable entrance", "fallback.unreachable_entrance"),
+    ("connecting to itself", "fallback.self_connection"),
+    ("Key placed behind key door", "fallback.key_behind_key_door"),
+    ("emerge from locked door", "fallback.locked_door"),
+]
+
+
+class Profiler:
+    """
+    Counts calls and the time spent in the generator's hot paths, overall and per seed. Times are inclusive, so a
+    call to Level.open_exits includes the time spent in the Entrance.can_enter calls it makes.
+    """
+
+    def __init__(self, listener: Optional[Listener] = None) -> None:
+        """
+        :param listener: If given, called for every instrumented call and fallback event as it happens.
+        """
+        self.listener = listener
+        self.calls: Dict[str, int] = {}
+        self.times: Dict[str, float] = {}
+        self.seeds: List[Dict[str, Any]] = []
+        self.hits = [0] * 6
+        self._originals: List[Tuple[Any, str, Any]] = []
+
+    def record(self, name: str, elapsed: float) -> None:
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.times[name] = self.times.get(name, 0.0) + elapsed
+        if self.listener is not None:
+            self.listener(name, elapsed)
+
+    def _wrap(self, name: str, func: Callable) -> Callable:
+        record = self.record
+        perf_counter = time.perf_counter
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, perf_counter() - start)
+        return wrapper
+
+    def _wrap_warn(self, warn: Callable) -> Callable:
+        record = self.record
+
+        @functools.wraps(warn)
+        def wrapper(state: GenerationState, message: str) -> None:
+            event = next((event for text, event in FALLBACKS if text in message), "fallback.other")
+            record(event, 0.0)
+            warn(state, message)
+        return wrapper
+
+    def install(self) -> None:
+        """
+        Start instrumenting the generator.
+        """
+        if self._originals:
+            return
+        from . import randomizer as generator
+        targets = [(Level, "open_exits"), (Level, "num_exits"), (Level, "connect_from_random"),
+                   (Level, "connect_to_random"), (Level, "connect_two_way"), (Entrance, "can_enter"),
+                   (generator, "populate_hubs"), (generator, "connect_to_hub"), (generator, "connect_one_way")]
+        for owner, attribute in targets:
+            original = owner.__dict__[attribute]
+            owner_name = owner.__name__ if isinstance(owner, type) else "randomizer"
+            self._originals.append((owner, attribute, original))
+            setattr(owner, attribute, self._wrap(f"{owner_name}.{attribute}", original))
+        self._originals.append((GenerationState, "warn", GenerationState.warn))
+        GenerationState.warn = self._wrap_warn(GenerationState.warn)
+
+    def uninstall(self) -> None:
+        """Stop instrumenting the generator."""
+        for owner, attribute, original in reversed(self._originals):
+            setattr(owner, attribute, original)
+        self._originals = []
+
+    @contextmanager
+    def installed(self) -> Iterator['Profiler']:
+        self.install()
+        try:
+            yield self
+        finally:
+            self.uninstall()
+
+    @contextmanager
+    def seed(self, seed: int) -> Iterator[SeedStats]:
+        """
+        Record the cost of generating one seed. Pass the SeedStats yielded to generate to record the iterations of the
+        main loop.
+        """
+        calls_before = dict(self.calls)
+        times_before = dict(self.times)
+        stats = SeedStats()
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            elapsed = time.perf_counter() - start
+            for hit, count in enumerate(stats.hits):
+                self.hits[hit] += count
+            self.seeds.append({
+                "seed": seed,
+                "elapsed_ms": elapsed * 1000,
+                "iterations": sum(stats.hits),
+                "hits": list(stats.hits),
+                "backtracks": stats.backtracks,
+                "calls": {name: {"calls": count - calls_before.get(name, 0),
+                                 "ms": (self.times[name] - times_before.get(name, 0.0)) * 1000}
+                          for name, count in self.calls.items() if count != calls_before.get(name, 0)},
+            })
+
+    def report(self) -> Dict[str, Any]:
+        """Get everything recorded, in a form that can be written as JSON."""
+        return {
+            "seeds": self.seeds,
+            "iterations": sum(self.hits),
+            "hits": self.hits,
+            "totals": {name: {"calls": count, "ms": self.times[name] * 1000,
+                              "mean_us": self.times[name] / count * 1e6}
+                       for name, count in sorted(self.calls.items())},
+        }
+
+
+def combine_seeds(seeds: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combine the per-seed records of several profilers (such as one per worker process) into a single report, in the
+    same form as Profiler.report.
+    """
+    hits = [0] * 6
+    totals: Dict[str, Dict[str, float]] = {}
+    for seed in seeds:
+        for hit, count in enumerate(seed["hits"]):
+            hits[hit] += count
+        for name, cost in seed["calls"].items():
+            total = totals.setdefault(name, {"calls": 0, "ms": 0.0})
+            total["calls"] += cost["calls"]
+            total["ms"] += cost["ms"]
+    for total in totals.values():
+        total["mean_us"] = total["ms"] / total["calls"] * 1000
+    return {"seeds": seeds, "iterations": sum(hits), "hits": hits, "totals": dict(sorted(totals.items()))}
@@ -2,12 +2,24 @@
 Class for storing information about levels.
 """
 
+from collections import deque
 import random
 
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple, Union
+
+from .entrance import Entrance, Transition
+from .collectible_info import CollectibleInfo, Collectibles
+
+class GraphVersion:
+    """
+    A counter shared by the levels of a single run, bumped whenever any of them gains a connection. Cached traversals
+    are only valid for the version they were made at.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
 
-from entrance import Entrance, Transition
-from collectible_info import CollectibleInfo
 
 class Level:
     """
@@ -15,13 +27,20 @@ class Level:
     """
 
     def __init__(self, name: str, collectibles: CollectibleInfo, entrances: List[Entrance],
-                 one_way: bool = False) -> None:
+                 one_way: bool = False, level_id: int = -1, version: Optional[GraphVersion] = None) -> None:
         self.name = name
+        # The index of this level in its LevelGraph, used to track levels in sets.
+        self.id = level_id
         self.collectibles = collectibles
         self.entrances = entrances
-        self.unused_entrances = entrances
+        self.unused_entrances = list(entrances)
         self.unreachable_entrances: List[Entrance] = []
+        # Only modify this through add_connection, so that cached traversals are invalidated.
         self.connected_levels: List[Level] = []
+        # Shared by every level that can be connected to this one (see LevelGraph.fresh_state). Levels built without one
+        # don't cache their traversals, as a connection added to another level can't invalidate them.
+        self._version = version
+        self._reachable_cache: Optional[Tuple[int, Tuple[Level, ...]]] = None
         self.one_way = one_way
         self.is_behind_key = False
         self.key_door_source = ""
@@ -34,42 +53,81 @@ class Level:
         else:
             return NotImplemented
 
-    def contains(self, level: Union['Level', str], visited: List['Level'] = []) -> bool:
-        if self in visited:
-            return False
-        if isinstance(level, str):
-            if level == self.name:
-                return True
-        else:
-            if level == self:
-                return True
-        for connected_level in self.connected_levels:
-            if connected_level.contains(level, visited + [self]):
-                return True
-        return False
+    def fresh_copy(self, version: Optional[GraphVersion] = None) -> 'Level':
+        """
+        Get a copy of this level without any connections. The entrances and collectibles are shared, as they are never
+        modified.
+
+        :param version: The version shared by the levels of the run this copy is used in.
+        """
+        return Level(self.name, self.collectibles, self.entrances, self.one_way, self.id, version)
+
+    def add_connection(self, level: 'Level') -> None:
+        """
+        Connect this level to another one.
+        """
+        self.connected_levels.append(level)
+        if self._version is not None:
+            self._version.value += 1
+
+    def reachable(self) -> Tuple['Level', ...]:
+        """
+        Get every level reachable from this one (including itself), in breadth-first order. The result is cached until
+        a connection is added to any level of the same run, for levels that share a GraphVersion.
+        """
+        version = self._version
+        if version is not None and self._reachable_cache is not None and self._reachable_cache[0] == version.value:
+            return self._reachable_cache[1]
+        output: List[Level] = [self]
+        visited = {self.name}
+        queue = deque([self])
+        while queue:
+            level = queue.popleft()
+            for connected_level in level.connected_levels:
+                if connected_level.name not in visited:
+                    visited.add(connected_level.name)
+                    output.append(connected_level)
+                    queue.append(connected_level)
+        if version is None:
+            return tuple(output)
+        self._reachable_cache = (version.value, tuple(output))
+        return self._reachable_cache[1]
 
-    def connect_two_way(self) -> Entrance:
+    def contains(self, level: Union['Level', str]) -> bool:
+        """
+        Return whether or not a level can be reached from this one.
+        """
+        name = level if isinstance(level, str) else level.name
+        return any(l.name == name for l in self.reachable())
+
+    def connect_two_way(self, rng: random.Random, warn: Callable[[str], None] = print) -> Entrance:
         """
         Get an entrance that can both be connected to and from.
+
+        :param rng: The random number generator for this run.
+        :param warn: Reports the fallback of emerging from a locked door, normally GenerationState.warn.
         """
         if self.one_way:
             raise ValueError("Can't connect two way in a one-way level.")
         
         valid_entrances = [e for e in self.unused_entrances if e.can_exit()]
         if len(valid_entrances) == 0:
-            print("Warning: could not find a valid entrance for this level, player will emerge from locked door.")
-            entrance = random.choice(self.unused_entrances)
+            warn("Could not find a valid entrance for this level, player will emerge from locked door.")
+            entrance = rng.choice(self.unused_entrances)
         else:
-            entrance = random.choice(valid_entrances)
+            entrance = rng.choice(valid_entrances)
         self.unused_entrances.remove(entrance)
         return entrance
 
     
-    def connect_from_random(self, current_collectibles: CollectibleInfo) -> Entrance:
+    def connect_from_random(self, current_collectibles: Collectibles, rng: random.Random) -> Entrance:
         """
         Start a connection from a random choice of one of this level's entrances. This also removes this entrance from
         the level's unused entrance list.
 
+        :param current_collectibles: The collectibles obtained so far.
+        :param rng: The random number generator for this run.
+
         :return: The entrance selected.
         """
         if not self.unused_entrances:
@@ -83,15 +141,18 @@ class Level:
         if len(valid_entrances) == 0:
             raise ValueError("No valid entrances found.")
 
-        entrance = random.choice(valid_entrances)
+        entrance = rng.choice(valid_entrances)
         self.unused_entrances.remove(entrance)
         return entrance
 
-    def connect_to_random(self) -> Entrance:
+    def connect_to_random(self, rng: random.Random, warn: Callable[[str], None] = print) -> Entrance:
         """
         End a connection at a 'random' choice of this level's nodes. For some rooms where travel is only permitted one
         way, we must choose the 'starting' entrance for that level.
 
+        :param rng: The random number generator for this run.
+        :param warn: Reports the fallback of emerging from a locked door, normally GenerationState.warn.
+
         :return: The entrance selected.
         """
         if not self.unused_entrances:
@@ -101,32 +162,37 @@ class Level:
         else:
             valid_entrances = [e for e in self.unused_entrances if e.can_exit()]
             if len(valid_entrances) == 0:
-                print("Warning: could not find a valid entrance for this level, player will emerge from locked door.")
-                entrance = random.choice(self.unused_entrances)
+                warn("Could not find a valid entrance for this level, player will emerge from locked door.")
+                entrance = rng.choice(self.unused_entrances)
             else:
-                entrance = random.choice(valid_entrances)
+                entrance = rng.choice(valid_entrances)
         self.unused_entrances.remove(entrance)
         return entrance
 
-    def pprint(self, depth: int = 0, visited: List['Level'] = []) -> str:
+    def pprint(self, depth: int = 0) -> str:
         """
         Get a tree visualization of the levels connections.
         
         :param depth: How many layers into the tree this level is.
-        :param visited: A list of visited nodes.
         """
-        prefix = ("| " * depth) + "|-"
-        if self in visited:
-            # Use a star to indicate that this level'c connections are defined elsewhere.
-            return prefix + self.name + "*\n"
-        else:
-            output = prefix + self.name + "\n"
-            for level in self.connected_levels:
-                other_levels_in_group = [l for l in self.connected_levels if l.name != level.name]
-                output += level.pprint(depth + 1, visited + other_levels_in_group + [self])
-            return output
+        output = []
+        # Each entry holds a level, its depth, and the names of the levels whose connections are printed elsewhere.
+        stack: List[Tuple[Level, int, FrozenSet[str]]] = [(self, depth, frozenset())]
+        while stack:
+            level, level_depth, visited = stack.pop()
+            prefix = ("| " * level_depth) + "|-"
+            if level.name in visited:
+                # Use a star to indicate that this level'c connections are defined elsewhere.
+                output.append(prefix + level.name + "*\n")
+                continue
+            output.append(prefix + level.name + "\n")
+            group = frozenset(l.name for l in level.connected_levels)
+            for connected_level in reversed(level.connected_levels):
+                other_levels_in_group = group - {connected_level.name}
+                stack.append((connected_level, level_depth + 1, visited | other_levels_in_group | {level.name}))
+        return "".join(output)
 
-    def open_exits(self, current_collectibles: CollectibleInfo) -> int:
+    def open_exits(self, current_collectibles: Collectibles) -> int:
         """
         The number of currently reachable exits from this level.
         """
@@ -137,14 +203,14 @@ class Level:
         open_exits = [e for e in self.unused_entrances if e.can_exit()]
         return len(open_exits)
 
-    def get_nearest_entrance(self) -> Optional[Entrance]:
+    def get_nearest_entrance(self, rng: random.Random) -> Optional[Entrance]:
         if len(self.unused_entrances) >= 1:
-            output = random.choice(self.unused_entrances)
+            output = rng.choice(self.unused_entrances)
             self.unused_entrances.remove(output)
             return output
         elif len(self.connected_levels) >= 1:
             for level in self.connected_levels:
-                entrance = level.get_nearest_entrance()
+                entrance = level.get_nearest_entrance(rng)
                 if entrance:
                     return entrance
         else:
@@ -155,24 +221,26 @@ class Level:
 
     @staticmethod
     def next_leaf_bfs(levels: List['Level']) -> Optional['Level']:
-        next_layer = []
-        for level in levels:
+        """
+        Get the nearest level with unused entrances, searching breadth-first from the given levels.
+        """
+        visited = {level.name for level in levels}
+        queue = deque(levels)
+        while queue:
+            level = queue.popleft()
             if level.unused_entrances:
                 return level
             for connected_level in level.connected_levels:
-                if connected_level not in levels:
-                    next_layer += [connected_level]
-        if len(next_layer) == 0:
-            return None
-        return Level.next_leaf_bfs(next_layer)
+                if connected_level.name not in visited:
+                    visited.add(connected_level.name)
+                    queue.append(connected_level)
+        return None
 
-
-    def total_unused_entrances(self, visited: List['Level'] = []) -> int:
-        output = len(self.unused_entrances)
-        for level in self.connected_levels:
-            if level not in visited:
-                output += level.total_unused_entrances(visited + [self])
-        return output
+    def total_unused_entrances(self) -> int:
+        """
+        The number of unused entrances in every level reachable from this one.
+        """
+        return sum(len(level.unused_entrances) for level in self.reachable())
 
     @classmethod
     def load_from_json(cls, json: Dict[str, Any]):
@@ -0,0 +1,125 @@
+"""
+Compiled cache of the level database.
+
+Parsing level_info.json and building the Level objects from it is a large part of the start up time, so the levels are
+compiled to plain tuples and stored with marshal in a cache file next to the JSON. Building levels from these tuples
+is faster than parsing the JSON, run benchmark_startup (python3 -m src.level_cache) to compare the two on this machine.
+The cache is keyed on a hash of the JSON file and is rebuilt automatically whenever the JSON changes.
+"""
+
+import dataclasses
+import hashlib
+import marshal
+import os
+import time
+from typing import Dict, List
+
+from .collectible_info import CollectibleInfo
+from .entrance import Entrance
+from .file_utils import write_atomic
+from .level import Level
+from .level_graph import LevelGraph
+
+# Bump this whenever the fields of Level, Entrance or CollectibleInfo change.
+CACHE_VERSION = 1
+
+_MAGIC = b"FEZLVL"
+
+
+def cache_file_for(level_info_file: str) -> str:
+    """Get the path of the compiled cache for a level info file."""
+    return os.path.splitext(level_info_file)[0] + ".cache"
+
+
+def load_levels_from_json(raw: bytes) -> List[Level]:
+    """Build the levels directly from the contents of a level info file."""
+    # Only needed when the cache is missing or stale, so not imported up front.
+    import json
+    return [Level.load_from_json(level) for level in json.loads(raw)]
+
+
+def compile_levels(levels: List[Level]) -> bytes:
+    """Compile levels to a snapshot that can be turned back into levels with levels_from_snapshot."""
+    return marshal.dumps([(level.name, dataclasses.astuple(level.collectibles),
+                           [dataclasses.astuple(e) for e in level.entrances], level.one_way) for level in levels])
+
+
+def levels_from_snapshot(snapshot: bytes) -> List[Level]:
+    """Build a fresh, unused copy of the levels in a compiled snapshot."""
+    return [Level(name, CollectibleInfo(*collectibles), [Entrance(*e) for e in entrances], one_way)
+            for name, collectibles, entrances, one_way in marshal.loads(snapshot)]
+
+
+def read_compiled(level_info_file: str, use_cache: bool = True) -> bytes:
+    """
+    Get a compiled snapshot of the level database, building and storing it first if the cache is missing or stale.
+
+    :param level_info_file: The level info JSON file.
+    :param use_cache: Whether to read and write the cache file. If False, the JSON is always parsed.
+    """
+    with open(level_info_file, "rb") as f:
+        raw = f.read()
+    header = _MAGIC + bytes([CACHE_VERSION, marshal.version]) + hashlib.sha256(raw).digest()
+
+    cache_file = cache_file_for(level_info_file)
+    if use_cache:
+        try:
+            with open(cache_file, "rb") as f:
+                cached = f.read()
+            if cached.startswith(header):
+                return cached[len(header):]
+        except OSError:
+            pass
+
+    snapshot = compile_levels(load_levels_from_json(raw))
+    if use_cache:
+        write_atomic(cache_file, header + snapshot)
+    return snapshot
+
+
+def load_level_database(level_info_file: str, use_cache: bool = True) -> List[Level]:
+    """
+    Load the levels, using the compiled cache when it is up to date.
+
+    :param level_info_file: The level info JSON file.
+    :param use_cache: Whether to read and write the cache file.
+    """
+    if not use_cache:
+        with open(level_info_file, "rb") as f:
+            return load_levels_from_json(f.read())
+    return levels_from_snapshot(read_compiled(level_info_file))
+
+
+def load_level_graph(level_info_file: str, use_cache: bool = True) -> LevelGraph:
+    """
+    Load the level database as a LevelGraph, using the compiled cache when it is up to date.
+
+    :param level_info_file: The level info JSON file.
+    :param use_cache: Whether to read and write the cache file.
+    """
+    return LevelGraph(load_level_database(level_info_file, use_cache))
+
+
+def benchmark_startup(level_info_file: str, repeat: int = 50) -> Dict[str, float]:
+    """
+    Compare the time taken to get a fresh set of levels from the JSON file and from the compiled cache.
+
+    :return: The mean time in milliseconds of each path.
+    """
+    read_compiled(level_info_file)
+
+    def mean_ms(use_cache: bool) -> float:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            load_level_database(level_info_file, use_cache=use_cache)
+        return (time.perf_counter() - start) * 1000 / repeat
+
+    json_ms = mean_ms(False)
+    cache_ms = mean_ms(True)
+    return {"json_ms": json_ms, "cache_ms": cache_ms, "speedup": json_ms / cache_ms}
+
+
+if __name__ == "__main__":
+    from .randomizer import LEVEL_INFO_FILE
+    import json
+    print(json.dumps(benchmark_startup(LEVEL_INFO_FILE), indent=4))
@@ -0,0 +1,266 @@
+"""
+Class for storing the level database that runs are generated from.
+"""
+
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+from .collectible_info import Collectibles
+from .entrance import EntranceIndex
+from .level import GraphVersion, Level
+
+if TYPE_CHECKING:
+    from .entrance_table import EntranceTable
+
+# The smallest database, in entrances, that open exits are counted in bulk for (see LevelGraph.entrance_table). Below
+# this, NumPy's overhead per call outweighs the per-level checks it replaces.
+VECTORIZE_MIN_ENTRANCES = 1000
+
+# The level every seed starts from (after the 2D section).
+START_LEVEL = "GOMEZ_HOUSE"
+
+
+class LevelGraph:
+    """
+    The immutable level database. Generating a seed consumes its levels, so every run gets its own copy from
+    fresh_state(). The entrances and collectibles are shared between the copies and only the per-run state is copied.
+    """
+
+    def __init__(self, levels: List[Level]) -> None:
+        self.templates = tuple(Level(level.name, level.collectibles, level.entrances, level.one_way, idx)
+                               for idx, level in enumerate(levels))
+        self.ids: Dict[str, int] = {level.name: idx for idx, level in enumerate(self.templates)}
+        self.entrance_index = EntranceIndex(e for level in self.templates for e in level.entrances)
+
+        for entrance in self.entrance_index.misconfigured():
+            print(f"Misconfigured level info JSON. from={entrance}")
+
+        self._entrance_table: Optional['EntranceTable'] = None
+        self._entrance_table_checked = False
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def fresh_state(self) -> List[Level]:
+        """Get an unconnected copy of every level, ready to be used by a single run."""
+        version = GraphVersion()
+        return [template.fresh_copy(version) for template in self.templates]
+
+    def entrance_table(self) -> Optional['EntranceTable']:
+        """
+        Get the entrance requirements as columns, for counting open exits in bulk. Built on first use, and only for
+        databases large enough to benefit when NumPy is installed: otherwise this is None and exits are counted level
+        by level.
+        """
+        if not self._entrance_table_checked:
+            self._entrance_table_checked = True
+            if sum(len(level.entrances) for level in self.templates) >= VECTORIZE_MIN_ENTRANCES:
+                # Deferred, as importing NumPy adds to the start up time.
+                from . import entrance_table
+                if entrance_table.available():
+                    self._entrance_table = entrance_table.EntranceTable(self.templates)
+        return self._entrance_table
+
+
+class GenerationFailed(Exception):
+    """
+    Raised by strict runs as soon as they hit a problem that would make the seed degraded.
+    """
+
+
+@dataclass
+class SeedStats:
+    """Class for recording how a single run went, for analysing the generator across many seeds."""
+    # How often each case of the main loop was hit, indexed by the hit number.
+    hits: List[int] = field(default_factory=lambda: [0] * 6)
+    # The number of rooms in each path built by connect_to_hub.
+    hub_paths: List[int] = field(default_factory=list)
+    self_connections: int = 0
+    # The levels removed at the start of the run.
+    removed_levels: List[str] = field(default_factory=list)
+    # The placements undone by the constraint engine.
+    backtracks: int = 0
+    # The problems reported with GenerationState.warn.
+    warnings: int = 0
+
+
+class GenerationState:
+    """
+    Bookkeeping for a single run: which levels are in the tree, which are still unused, and which levels in the tree
+    still have unused entrances. Levels are tracked by id, so every membership check and removal is constant time.
+    The insertion order of every collection is kept, so random choices made from them are reproducible.
+
+    Once track_open_exits has been called, the number of open exits of every unfinished level is kept up to date as
+    entrances are used and collectibles are gained. A level is only recounted when one of its entrances is used, or
+    when the collectibles cross a threshold that one of its unused entrances is gated on.
+
+    With an EntranceTable, the levels recounted when a threshold is crossed, and the levels filtered by with_exits and
+    with_open_exits, are counted in bulk instead.
+    """
+
+    def __init__(self, levels: List[Level], strict: bool = False, stats: Optional[SeedStats] = None,
+                 table: Optional['EntranceTable'] = None) -> None:
+        # Whether problems with the seed abort the run, rather than just being reported.
+        self.strict = strict
+        self.stats = stats
+        self.table = table
+        # With a table: which entrances are unused, and the number of unused entrances of each level when its rows were
+        # last updated. Entrances are only ever used up, so a level is up to date as long as that number is the same.
+        self._unused_mask = table.new_mask() if table is not None else None
+        self._mask_sizes = list(table.sizes) if table is not None else []
+        self.levels: Dict[str, Level] = {level.name: level for level in levels}
+        # Every level in the tree, in the order they were added.
+        self.tree_flat: List[Level] = []
+        self.in_tree: Set[int] = set()
+        self.unused: Dict[int, Level] = {level.id: level for level in levels}
+        self.unfinished: Dict[int, Level] = {}
+
+        # The open exit counts of unfinished levels, only maintained once track_open_exits is called.
+        self.collectibles: Optional[Collectibles] = None
+        self.open_exits: Dict[int, int] = {}
+        self.total_open_exits = 0
+        # Unfinished levels that have at least one unused entrance gated on collectibles.
+        self._gated: Set[int] = set()
+        self._cube_thresholds = sorted({e.cubes_required for level in levels for e in level.entrances
+                                        if e.cubes_required > 0})
+        self._gate_signature: Optional[Tuple[bool, int, bool, bool]] = None
+
+    def warn(self, message: str) -> None:
+        """
+        Report a problem with the seed being generated.
+
+        :raises GenerationFailed: If this is a strict run.
+        """
+        if self.strict:
+            raise GenerationFailed(message)
+        if self.stats is not None:
+            self.stats.warnings += 1
+        print(message)
+
+    def __getitem__(self, name: str) -> Level:
+        return self.levels[name]
+
+    def is_in_tree(self, level: Level) -> bool:
+        return level.id in self.in_tree
+
+    def is_unused(self, level: Level) -> bool:
+        return level.id in self.unused
+
+    def add_to_tree(self, level: Level) -> None:
+        """
+        Add a level to the tree. The level is not marked as unfinished, see mark_unfinished.
+        """
+        if level.id not in self.in_tree:
+            self.tree_flat.append(level)
+            self.in_tree.add(level.id)
+            self.unused.pop(level.id, None)
+
+    def take_unused(self, name: str) -> Level:
+        """
+        Remove an unused level by name so that it can be added to the tree.
+
+        :raises KeyError: If the level is not unused.
+        """
+        return self.unused.pop(self.levels[name].id)
+
+    def mark_unfinished(self, level: Level) -> None:
+        """Start tracking a level in the tree if it still has unused entrances."""
+        if level.unused_entrances:
+            self.unfinished[level.id] = level
+            self._count_open_exits(level)
+
+    def update_finished(self, level: Level) -> None:
+        """
+        Update a level after one of its entrances has been used. The level stops being tracked once all of its
+        entrances have been used.
+        """
+        if level.id not in self.unfinished:
+            return
+        if level.unused_entrances:
+            self._count_open_exits(level)
+        else:
+            del self.unfinished[level.id]
+            self._forget_open_exits(level)
+
+    def track_open_exits(self, collectibles: Collectibles) -> None:
+        """
+        Start maintaining the open exit counts. Every level in the tree with unused entrances becomes unfinished.
+        """
+        self.collectibles = collectibles
+        self._gate_signature = self._signature(collectibles)
+        for level in self.tree_flat:
+            self.mark_unfinished(level)
+
+    def update_collectibles(self, collectibles: Collectibles) -> None:
+        """
+        Update the open exit counts after the collectibles have changed. Nothing is recounted unless a gate threshold
+        has been crossed, and then only levels with gated entrances are.
+        """
+        self.collectibles = collectibles
+        if self._gate_signature is None:
+            return
+        signature = self._signature(collectibles)
+        if signature != self._gate_signature:
+            self._gate_signature = signature
+            if self.table is None:
+                for level_id in list(self._gated):
+                    self._count_open_exits(self.unfinished[level_id])
+                return
+            # Which entrances are gated doesn't depend on the collectibles, so only the counts change.
+            gated = [self.unfinished[level_id] for level_id in self._gated]
+            self._update_mask(gated)
+            counts = self.table.open_counts(self._unused_mask, collectibles)
+            for level in gated:
+                self.total_open_exits += counts[level.id] - self.open_exits[level.id]
+                self.open_exits[level.id] = counts[level.id]
+
+    def with_exits(self, levels: Iterable[Level], minimum: int = 1) -> List[Level]:
+        """Get the levels with at least minimum unused entrances that can be exited from, in the same order."""
+        if self.table is None:
+            return [level for level in levels if level.num_exits() >= minimum]
+        levels = self._update_mask(levels)
+        counts = self.table.exit_counts(self._unused_mask)
+        return [level for level in levels if counts[level.id] >= minimum]
+
+    def with_open_exits(self, levels: Iterable[Level], collectibles: Collectibles, minimum: int = 1) -> List[Level]:
+        """Get the levels with at least minimum unused entrances that can be entered, in the same order."""
+        if self.table is None:
+            return [level for level in levels if level.open_exits(collectibles) >= minimum]
+        levels = self._update_mask(levels)
+        counts = self.table.open_counts(self._unused_mask, collectibles)
+        return [level for level in levels if counts[level.id] >= minimum]
+
+    def _update_mask(self, levels: Iterable[Level]) -> List[Level]:
+        """Bring the rows of levels in the unused entrance mask up to date, and return the levels as a list."""
+        assert self.table is not None
+        levels = list(levels)
+        for level in levels:
+            if len(level.unused_entrances) != self._mask_sizes[level.id]:
+                self.table.update_mask(self._unused_mask, level)
+                self._mask_sizes[level.id] = len(level.unused_entrances)
+        return levels
+
+    def _signature(self, collectibles: Collectibles) -> Tuple[bool, int, bool, bool]:
+        """
+        Summarize the collectibles by everything Entrance.can_enter checks. Two collectibles with the same signature
+        open exactly the same entrances.
+        """
+        return (collectibles.keys > 0, bisect_right(self._cube_thresholds, collectibles.total_cubes()),
+                bool(collectibles.water_lower), collectibles.owls == 4)
+
+    def _count_open_exits(self, level: Level) -> None:
+        if self._gate_signature is None:
+            return
+        assert self.collectibles is not None
+        count = level.open_exits(self.collectibles)
+        self.total_open_exits += count - self.open_exits.get(level.id, 0)
+        self.open_exits[level.id] = count
+        if any(e.is_gated() for e in level.unused_entrances):
+            self._gated.add(level.id)
+        else:
+            self._gated.discard(level.id)
+
+    def _forget_open_exits(self, level: Level) -> None:
+        self.total_open_exits -= self.open_exits.pop(level.id, 0)
+        self._gated.discard(level.id)
@@ -0,0 +1,505 @@
+"""
+Placement engine with forward checking.
+
+The default generator picks where to connect each level at random and reacts to dead ends after the fact, which can
+leave seeds with self connections, unreachable doors or no open exits left. Once the levels to leave out have been
+removed, every remaining door is needed: the tree has no spare exits to absorb a bad choice. This engine grows the
+same tree from the same hub skeleton, but only makes a placement if the rest of the levels can still be placed after
+it, and steps back to an earlier placement if it does run into a dead end.
+"""
+
+import random
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from .collectible_info import CollectibleCounter
+from .entrance import CABIN_PARTNERS, Entrance, Transition
+from .level import Level
+from .level_graph import GenerationFailed, GenerationState, SeedStats
+
+if TYPE_CHECKING:
+    from .entrance_table import EntranceTable
+
+# The most placements that can be undone in a single run before giving up.
+MAX_BACKTRACKS = 2000
+
+T = TypeVar("T")
+
+
+def random_order(items: Sequence[T], rng: random.Random) -> Iterator[T]:
+    """Yield the items in a random order, only drawing as many random numbers as items are taken."""
+    items = list(items)
+    for end in range(len(items), 0, -1):
+        idx = rng.randrange(end)
+        items[idx], items[end - 1] = items[end - 1], items[idx]
+        yield items[end - 1]
+
+
+# What a gated door needs to be opened: eighths of a cube, lowered water and all the owls. Only the first of these that
+# the door has counts, as in Entrance.can_enter.
+_Requirement = Tuple[int, bool, bool]
+
+
+def _requirement(entrance: Entrance) -> _Requirement:
+    if entrance.cubes_required > 0:
+        return entrance.cubes_required * 8, False, False
+    return 0, entrance.is_underwater, entrance.needs_owls
+
+
+# What placing a level does, as used by ConstraintPlacer._completable: the open doors it adds, its gated doors other
+# than locked doors, its locked doors, the doors of the tree it uses on top of the way in, the keys, eighths of a cube,
+# water and owls it gives, and how many of the open doors it adds can be exited through (see Entrance.can_exit), which
+# the way back out of a one way level has to lead to.
+_Summary = Tuple[int, List[_Requirement], int, int, int, int, bool, int, int]
+
+# What ConstraintPlacer._apply hands back to undo a placement: the collectibles, the size of the tree, the doors used
+# with their positions, the number of transitions, and the door counts of the tree.
+_Undo = Tuple[CollectibleCounter, int, List[Tuple[Level, int, Entrance]], int, List[int], List[Tuple[Entrance, bool]]]
+
+
+class _Move:
+    """
+    A single placement: from an open exit to an unused level, along with the connection back out of it for one way
+    levels.
+    """
+    __slots__ = ("from_level", "from_entrance", "to_level", "to_entrance", "back_level", "back_entrance",
+                 "back_to_level", "back_to_entrance")
+
+    def __init__(self, from_level: Level, from_entrance: Entrance, to_level: Level, to_entrance: Entrance) -> None:
+        self.from_level = from_level
+        self.from_entrance = from_entrance
+        self.to_level = to_level
+        self.to_entrance = to_entrance
+        self.back_level: Optional[Level] = None
+        self.back_entrance: Optional[Entrance] = None
+        self.back_to_level: Optional[Level] = None
+        self.back_to_entrance: Optional[Entrance] = None
+
+
+class ConstraintPlacer:
+    """
+    Places the remaining levels after the hubs have been populated.
+
+    The tree is grown one level at a time. Each level placed uses one open exit of the tree and adds its other doors,
+    and one way levels also use a door of the tree for the way back out. Before a placement is kept, the remaining
+    levels are placed on paper, best first, to check that the tree never runs out of open exits: levels with keys and
+    one way levels go first, then the levels that add exits, and dead ends last, with collectibles opening gated doors
+    as they are gained. Placements that fail this check are skipped. If a placement passes it but still leads to a dead
+    end, it is undone and the next option tried.
+    """
+
+    def __init__(self, state: GenerationState, collectibles: CollectibleCounter, sewer_start: Level,
+                 rng: random.Random, stats: Optional[SeedStats] = None,
+                 behind_key: Optional[Dict[int, str]] = None) -> None:
+        """
+        :param state: The run so far. The levels in its tree are placed, and their unused entrances are the open exits.
+        :param collectibles: The collectibles obtained by the levels in the tree.
+        :param sewer_start: SEWER_START, which is placed along with WELL_2.
+        :param rng: The random number generator for this run.
+        :param stats: If given, record how the run went in it.
+        :param behind_key: The levels of the tree that are behind a locked door, by id, with the level the door is in.
+        """
+        self.rng = rng
+        self.stats = stats
+        self.sewer_start = sewer_start
+        self.collectibles = collectibles
+        self.tree: List[Level] = list(state.tree_flat)
+        self.in_tree = {level.id for level in self.tree}
+        self.unused: List[Level] = [level for level in state.unused.values()]
+        self.levels: Dict[str, Level] = {level.name: level for level in self.tree + self.unused + [sewer_start]}
+        # Levels behind a locked door, with the level the door is in.
+        self.behind_key: Dict[int, str] = dict(behind_key or {})
+        self.transitions: List[Transition] = []
+        self.backtracks = 0
+
+        # For every unused level, None for the second half of the cabin, which is counted along with the first.
+        self._summaries: Dict[int, Optional[_Summary]] = {level.id: self._summary(level) for level in self.unused}
+        # Levels that only use up an exit: no other doors and no keys, so they can go anywhere.
+        self._dead_ends = {level.id for level in self.unused if self._summaries[level.id] is not None
+                           and self._summaries[level.id][:5] == (0, [], 0, 0, 0)}
+        self._dead_ends_left = len(self._dead_ends)
+        # The unused levels in the order they are placed on paper (see _completable).
+        self._plan: List[Level] = sorted(self.unused, key=self._plan_key)
+        # The original positions in unused and _plan, restored when placements are undone.
+        self._unused_order = {level.id: idx for idx, level in enumerate(self.unused)}
+        self._plan_order = {level.id: idx for idx, level in enumerate(self._plan)}
+
+        # The unused doors of the tree as _completable starts from them, kept up to date by _apply rather than counted
+        # for every placement: the open ones, the open ones behind a locked door, how many of each can be exited
+        # through, and the locked ones, along with the gated doors that aren't open yet and whether they are behind a
+        # locked door.
+        self._doors = [0, 0, 0, 0, 0]
+        self._gated: List[Tuple[Entrance, bool]] = []
+        for level in self.tree:
+            for e in level.unused_entrances:
+                self._count(level, e, 1)
+
+    def _partner(self, level: Level) -> Optional[Level]:
+        """Get the level that is placed along with another one."""
+        if level.name in CABIN_PARTNERS:
+            return self.levels.get(CABIN_PARTNERS[level.name])
+        if level.name == "WELL_2":
+            return self.sewer_start
+        return None
+
+    def _summary(self, level: Level) -> Optional[_Summary]:
+        """Summarize what placing a level does to the doors of the tree and the collectibles."""
+        collectibles = level.collectibles
+        if level.name in CABIN_PARTNERS:
+            if level.name == "CABIN_INTERIOR_B":
+                return None
+            # The cabin halves are placed together, each with a single door. The other half's door is added.
+            partner = self._partner(level)
+            if partner is not None:
+                collectibles = collectibles + partner.collectibles
+        gives = (collectibles.keys, (collectibles.golden_cubes + collectibles.anti_cubes) * 8 + collectibles.bits,
+                 collectibles.water_lower, collectibles.owls)
+        if level.name in CABIN_PARTNERS:
+            # The way back out of a one way level never leads into the cabin.
+            return (1, [], 0, 0) + gives + (0,)
+        if level.name == "WELL_2":
+            # The way back out through SEWER_START uses another door of the tree.
+            return (0, [], 0, 1) + gives + (0,)
+        gated = [_requirement(e) for e in level.entrances if e.is_gated() and not e.locked]
+        locked = len([e for e in level.entrances if e.locked])
+        open_doors = len(level.entrances) - len(gated) - locked
+        exits = len([e for e in level.entrances if e.can_exit()])
+        if level.one_way:
+            # The way in, and one of the other doors for the way back out, which may be one that could be exited
+            # through.
+            exits = len([e for e in level.entrances[1:] if e.can_exit()])
+            return (open_doors - 2, gated, locked, 1) + gives + (max(exits - 1, 0),)
+        if exits:
+            return (open_doors - 1, gated, locked, 0) + gives + (exits - 1,)
+        # The way in has to be through a gated door.
+        return (open_doors, gated[1:], locked if gated else locked - 1, 0) + gives + (0,)
+
+    def _plan_key(self, level: Level) -> tuple:
+        """
+        Get the position of a level in _plan. Levels with keys go first, as they can't go behind a locked door, then one
+        way levels, while there are still doors to lead the way back out to, then the levels that add the most open
+        exits. Dead ends go last.
+        """
+        summary = self._summaries[level.id]
+        one_way = summary is not None and summary[3] > 0
+        return (level.collectibles.keys == 0, not one_way, level.id in self._dead_ends, -self._gain(level),
+                not level.collectibles, level.id)
+
+    def _gain(self, level: Level) -> int:
+        """Get the number of open exits that placing a level adds to the tree, before any of its gated doors open."""
+        summary = self._summaries[level.id]
+        if summary is None:
+            return 0
+        return summary[0] - 1 - summary[3]
+
+    def _open_exits(self) -> List[Tuple[Level, Entrance]]:
+        return [(level, e) for level in self.tree for e in level.unused_entrances
+                if e.can_enter(self.collectibles)]
+
+    def _count(self, level: Level, entrance: Entrance, sign: int) -> None:
+        """
+        Add an unused door of the tree to the counts in _doors and _gated, or take it away again.
+
+        :param sign: 1 to add the door, -1 to take it away. Only open and locked doors are ever taken away, as those
+                     are the only ones placements use.
+        """
+        level_behind_key = level.id in self.behind_key
+        if entrance.locked:
+            self._doors[4] += sign
+        elif not entrance.can_enter(self.collectibles):
+            self._gated.append((entrance, level_behind_key))
+        else:
+            idx = 2 if level_behind_key else 0
+            self._doors[idx] += sign
+            if level.name not in CABIN_PARTNERS and entrance.can_exit():
+                self._doors[idx + 1] += sign
+
+    def _completable(self) -> bool:
+        """
+        Check that the remaining levels can all be placed, by placing them on paper in the order of _plan.
+
+        Open exits are split into the ones behind a locked door, and the clean ones that levels with keys can be placed
+        behind. Other levels go through locked doors while there are keys for them, then use up the exits behind locked
+        doors, to keep the clean ones for levels with keys. Of each, the doors that can be exited through are counted as
+        well, as the way back out of a one way level has to lead to one of them, and the others are used up first. Only
+        the collectibles that open doors are counted, as plain numbers, since this runs for every placement, and the
+        doors of the tree are taken from the counts _apply keeps.
+        """
+        keys = self.collectibles.keys
+        cubes = (self.collectibles.golden_cubes + self.collectibles.anti_cubes) * 8 + self.collectibles.bits
+        water = self.collectibles.water_lower
+        owls = self.collectibles.owls
+        clean, clean_exits, behind_key, behind_key_exits, locked = self._doors
+        # Gated doors that aren't open yet, with whether they are behind a locked door.
+        gated: List[Tuple[_Requirement, bool]] = [(_requirement(e), level_behind_key)
+                                                  for e, level_behind_key in self._gated]
+
+        summaries = self._summaries
+        dead_ends_start = len(self._plan) - self._dead_ends_left
+        for idx, level in enumerate(self._plan):
+            if idx == dead_ends_start and not gated:
+                # Nothing is left to open, so the dead ends only need an exit each.
+                return self._dead_ends_left <= min(locked, keys) + behind_key + clean
+            summary = summaries[level.id]
+            if summary is None:
+                continue
+            (open_doors, level_gated, level_locked, extra, level_keys, level_cubes, level_water, level_owls,
+             level_exits) = summary
+            # The way in, through a door that can't be exited through if there is one.
+            if level_keys > 0:
+                if clean == 0:
+                    return False
+                if clean == clean_exits:
+                    clean_exits -= 1
+                clean -= 1
+                is_behind_key = False
+            elif locked > 0 and keys > 0:
+                locked -= 1
+                keys -= 1
+                is_behind_key = True
+            elif behind_key > 0:
+                if behind_key == behind_key_exits:
+                    behind_key_exits -= 1
+                behind_key -= 1
+                is_behind_key = True
+            elif clean > 0:
+                if clean == clean_exits:
+                    clean_exits -= 1
+                clean -= 1
+                is_behind_key = False
+            else:
+                return False
+            # The way back out of one way levels.
+            if extra:
+                if behind_key_exits > 0:
+                    behind_key_exits -= 1
+                    behind_key -= 1
+                elif clean_exits > 0:
+                    clean_exits -= 1
+                    clean -= 1
+                else:
+                    return False
+
+            if is_behind_key:
+                behind_key += open_doors
+                behind_key_exits += level_exits
+            else:
+                clean += open_doors
+                clean_exits += level_exits
+            locked += level_locked
+            if level_gated:
+                gated.extend((requirement, is_behind_key) for requirement in level_gated)
+            keys += level_keys
+            if level_cubes or level_water or level_owls:
+                cubes += level_cubes
+                water = water or level_water
+                owls += level_owls
+                if gated:
+                    still_gated = []
+                    for gate in gated:
+                        (needs_cubes, needs_water, needs_owls), gate_behind_key = gate
+                        if needs_cubes > cubes or needs_water and not water or needs_owls and owls != 4:
+                            still_gated.append(gate)
+                        elif gate_behind_key:
+                            behind_key += 1
+                        else:
+                            clean += 1
+                    gated = still_gated
+        return not gated
+
+    def _destinations(self, exclude: Level, used: Entrance) -> List[Tuple[Level, Entrance]]:
+        """
+        Get the doors of the tree the way out of a one way level can lead to.
+
+        :param exclude: The level the way out starts from.
+        :param used: The door used for the way in, which isn't free any more.
+        """
+        return [(level, e) for level in self.tree if level is not exclude and level.name not in CABIN_PARTNERS
+                for e in level.unused_entrances if e.can_exit() and e is not used]
+
+    def _moves(self) -> Iterator[_Move]:
+        """Yield the possible placements in a random order."""
+        for from_level, from_entrance in random_order(self._open_exits(), self.rng):
+            behind_key = from_entrance.locked or from_level.id in self.behind_key
+            for to_level in random_order(self.unused, self.rng):
+                if behind_key and to_level.collectibles.keys > 0:
+                    continue
+                if to_level.one_way:
+                    to_entrance = to_level.entrances[0]
+                else:
+                    exits = [e for e in to_level.unused_entrances if e.can_exit()]
+                    to_entrance = self.rng.choice(exits or to_level.unused_entrances)
+                move = _Move(from_level, from_entrance, to_level, to_entrance)
+                if to_level.one_way:
+                    back_level = self.sewer_start if to_level.name == "WELL_2" else to_level
+                    back_doors = [e for e in back_level.entrances if e is not to_entrance]
+                    move.back_level = back_level
+                    move.back_entrance = self.rng.choice(back_doors)
+                    for move.back_to_level, move.back_to_entrance in random_order(
+                            self._destinations(back_level, from_entrance), self.rng):
+                        yield move
+                else:
+                    yield move
+
+    def _apply(self, move: _Move) -> _Undo:
+        """
+        Make a placement.
+
+        :return: What is needed to undo it.
+        """
+        undo = (self.collectibles.copy(), len(self.tree), [], len(self.transitions), list(self._doors),
+                list(self._gated))
+        used = undo[2]
+
+        def use(level: Level, entrance: Entrance) -> None:
+            if level.id in self.in_tree and level is not move.to_level and level is not move.back_level:
+                self._count(level, entrance, -1)
+            idx = level.unused_entrances.index(entrance)
+            del level.unused_entrances[idx]
+            used.append((level, idx, entrance))
+
+        def place(level: Level) -> None:
+            self.tree.append(level)
+            self.in_tree.add(level.id)
+            if level is not self.sewer_start:
+                # By identity, as comparing levels compares their names.
+                del self.unused[next(idx for idx, other in enumerate(self.unused) if other is level)]
+                del self._plan[next(idx for idx, other in enumerate(self._plan) if other is level)]
+                if level.id in self._dead_ends:
+                    self._dead_ends_left -= 1
+            self.collectibles += level.collectibles
+
+        use(move.from_level, move.from_entrance)
+        if move.from_entrance.locked:
+            self.collectibles.keys -= 1
+        place(move.to_level)
+        use(move.to_level, move.to_entrance)
+        if move.from_entrance.locked or move.from_level.id in self.behind_key:
+            self.behind_key[move.to_level.id] = self.behind_key.get(move.from_level.id, move.from_level.name)
+        self.transitions.append(Transition(move.from_entrance, move.to_entrance))
+
+        partner = self._partner(move.to_level)
+        if partner is not None and partner.id not in self.in_tree:
+            place(partner)
+        if move.back_level is not None:
+            use(move.back_level, move.back_entrance)
+            use(move.back_to_level, move.back_to_entrance)
+            self.transitions.append(Transition(move.back_entrance, move.back_to_entrance))
+
+        # Open the gated doors the new collectibles open, then count the doors of the levels placed.
+        gated = self._gated
+        self._gated = []
+        for entrance, level_behind_key in gated:
+            if entrance.can_enter(self.collectibles):
+                idx = 2 if level_behind_key else 0
+                self._doors[idx] += 1
+            else:
+                self._gated.append((entrance, level_behind_key))
+        for level in self.tree[undo[1]:]:
+            for e in level.unused_entrances:
+                self._count(level, e, 1)
+        return undo
+
+    def _undo(self, move: _Move, undo: _Undo) -> None:
+        collectibles, tree_size, used, num_transitions, self._doors, self._gated = undo
+        self.collectibles = collectibles
+        for level, idx, entrance in reversed(used):
+            level.unused_entrances.insert(idx, entrance)
+        for level in reversed(self.tree[tree_size:]):
+            self.in_tree.discard(level.id)
+            self.behind_key.pop(level.id, None)
+            if level is not self.sewer_start:
+                self.unused.append(level)
+                self._plan.append(level)
+                if level.id in self._dead_ends:
+                    self._dead_ends_left += 1
+        del self.tree[tree_size:]
+        # Restore the orders, so that the random choices made from them don't depend on what was undone.
+        self.unused.sort(key=lambda level: self._unused_order[level.id])
+        self._plan.sort(key=lambda level: self._plan_order[level.id])
+        del self.transitions[num_transitions:]
+
+    def place_all(self) -> List[Transition]:
+        """
+        Place every unused level.
+
+        :raises GenerationFailed: If there is no way to place them, or too many placements had to be undone.
+        """
+        if not self._completable():
+            raise GenerationFailed(f"The {len(self.unused)} unused levels can't all be placed.")
+
+        # The placements made so far, with the choices still left at each of them.
+        stack: List[Tuple[_Move, tuple, Iterator[_Move]]] = []
+        choices = self._moves()
+        while self.unused:
+            for move in choices:
+                undo = self._apply(move)
+                if self._completable():
+                    stack.append((move, undo, choices))
+                    choices = self._moves()
+                    break
+                self._undo(move, undo)
+            else:
+                # Every choice leads to a dead end, go back to the previous placement and try its next choice.
+                if not stack or self.backtracks == MAX_BACKTRACKS:
+                    raise GenerationFailed(f"No placement left with {len(self.unused)} levels unused.")
+                self.backtracks += 1
+                move, undo, choices = stack.pop()
+                self._undo(move, undo)
+
+        self._finish()
+        if self.stats is not None:
+            self.stats.backtracks += self.backtracks
+        return self.transitions
+
+    def _finish(self) -> None:
+        """
+        Deal with the doors of the tree that are left once every level has been placed.
+
+        :raises GenerationFailed: If there are any, as every door has to be used.
+        """
+        leftover = [e for level in self.tree for e in level.unused_entrances]
+        if leftover:
+            raise GenerationFailed(f"{len(leftover)} doors were left unconnected.")
+
+
+def generate_constrained(levels: List[Level], rng: random.Random, strict: bool = True,
+                         stats: Optional[SeedStats] = None,
+                         table: Optional['EntranceTable'] = None) -> List[Transition]:
+    """
+    Generate a randomized set of transitions with the constraint engine. The levels are removed and the hubs populated
+    in the same way as generate, the rest of the levels are placed by ConstraintPlacer.
+
+    :param levels: A fresh copy of the level database from LevelGraph.fresh_state.
+    :param rng: The random number generator for this run.
+    :param strict: Abort as soon as populating the hubs would degrade the seed, as in generate. The levels after that
+                   are placed without degrading the seed either way, or not at all.
+    :param stats: If given, record how the run went in it.
+    :param table: The level database's entrance table, used while populating the hubs as in generate.
+    :raises GenerationFailed: If the levels couldn't be placed.
+    :return: The transitions to write to the mod config.
+    """
+    from .randomizer import populate_hubs, remove_levels
+
+    sewer_start = remove_levels(levels, rng, stats)
+    state = GenerationState(levels, strict, stats, table)
+    state.add_to_tree(state["GOMEZ_HOUSE"])
+    transitions, collectibles = populate_hubs(state, CollectibleCounter(anti_cubes=1), rng, skip_full_hubs=True)
+
+    placer = ConstraintPlacer(state, collectibles, sewer_start, rng, stats)
+    transitions += placer.place_all()
+
+    # Record the connections on the levels, as generate does.
+    for level_id, source in placer.behind_key.items():
+        level = next(l for l in placer.tree if l.id == level_id)
+        level.is_behind_key = True
+        level.key_door_source = source
+    levels_by_name = {level.name: level for level in placer.tree}
+    for transition in transitions[len(transitions) - len(placer.transitions):]:
+        from_level = levels_by_name[transition.source.level]
+        to_level = levels_by_name[transition.dest.level]
+        if to_level not in from_level.connected_levels:
+            from_level.add_connection(to_level)
+    for name, partner_name in (("CABIN_INTERIOR_A", "CABIN_INTERIOR_B"), ("WELL_2", "SEWER_START")):
+        if name in levels_by_name and partner_name in levels_by_name:
+            levels_by_name[name].add_connection(levels_by_name[partner_name])
+    return transitions
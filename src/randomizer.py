@@ -2,246 +2,555 @@
 Randomizer for FEZ.
 """
 
-import argparse
-from datetime import datetime
-import hashlib
-import json
+from contextlib import nullcontext, redirect_stdout
 import os
 import random
-from typing import List, Tuple
+import sys
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
 
-from level import CollectibleInfo, Level
-from entrance import Entrance, Transition
+from .collectible_info import CollectibleCounter
+from .level import Level
+from .config_writer import DoorPair, encode_compact, format_doors, to_doors, write_compact, write_config
+from .entrance import CABIN_PARTNERS, Transition
+from .level_cache import load_level_graph
+from .level_graph import GenerationFailed, GenerationState, LevelGraph, SeedStats
+from .validator import ValidationResult, validate
 
-LEVEL_INFO_FILE = "src/reference/level_info.json"
+if TYPE_CHECKING:
+    from .entrance_table import EntranceTable
+
+LEVEL_INFO_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reference", "level_info.json")
+
+# Part of the key of every cached config (see seed_cache.DiskSeedCache), so that old configs are discarded once it
+# changes. Bump it whenever a change gives any seed different transitions with any engine or --max-attempts, including
+# changes to how the engines draw from the rng, to remove_levels or populate_hubs, to derive_seed, or to what the
+# validator rejects. Changes that only make generation faster and give the same transitions, such as counting open exits
+# in bulk, don't need a bump, and neither does adding an engine, as the engine is part of the key as well.
+GENERATOR_VERSION = 3
+
+HUB_NAMES = {"NATURE_HUB", "INDUSTRIAL_HUB", "SEWER_HUB", "ZU_CITY_RUINS", "GRAVEYARD_GATE"}
+
+# The placement engines: generate, and placement.generate_constrained.
+ENGINES = ["random", "constraint"]
+
+# The attempts made by the constraint engine when --max-attempts isn't given. About one seed in 5000 still needs a
+# retry: the levels removed and the hub paths, which are drawn as in generate, can leave fewer doors than the rest of
+# the levels need, and the validator opens key doors in the order it finds them, so it can spend the last key before
+# reaching a key door that the engine planned to open earlier.
+CONSTRAINT_ATTEMPTS = 10
 
 def main():
     """
     Script for randomizing FEZ.
     """
+    # Imports only needed by some paths are deferred to keep start up fast, for the CLI and for worker processes.
+    import argparse
 
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--seed", required=False, type=int, help="The random seed used for this script.")
+    parser.add_argument("--count", required=False, type=int,
+                        help="Generate this many consecutive seeds, starting from --seed.")
+    parser.add_argument("--jobs", required=False, type=int, help="Number of worker processes used with --count.")
+    parser.add_argument("--output", required=False,
+                        help="Where to write the config, or - for stdout. Defaults to config.txt (config.bin for "
+                             "--format compact).")
+    parser.add_argument("--output-dir", default="seeds", help="Directory for the configs generated with --count.")
+    parser.add_argument("--format", choices=["text", "compact"], default="text",
+                        help="Write the mod's text config, or the compact binary encoding read by config_writer.")
+    parser.add_argument("--max-attempts", required=False, type=int,
+                        help="Reject degraded seeds and retry with a derived seed, up to this many attempts.")
+    parser.add_argument("--engine", choices=ENGINES, default="random",
+                        help="Place levels at random and react to dead ends (random), or only make placements that "
+                             "keep every remaining level placeable (constraint).")
+    parser.add_argument("--profile", required=False,
+                        help="Count calls and time spent in the generator's hot paths, and write them to this file.")
+    parser.add_argument("--profile-format", choices=["json", "pstats"], default="json",
+                        help="Write the profile as JSON with per-seed breakdowns, or as a cProfile dump for pstats "
+                             "(single seeds only).")
+    parser.add_argument("--cache-dir", required=False,
+                        help="Serve configs from this directory if they were generated before, and store new ones in "
+                             "it. Not used when profiling.")
 
     options = parser.parse_args()
+    if options.profile and options.count and options.profile_format == "pstats":
+        parser.error("--profile-format pstats can't be used with --count.")
 
     if options.seed:
-        random.seed(options.seed)
+        seed = options.seed
     else:
+        from datetime import datetime
+        import hashlib
         timestamp_as_bytes = datetime.now().microsecond.to_bytes(4, "big")
         seed = int.from_bytes(hashlib.sha256(timestamp_as_bytes).digest(), "big")
         print(f"Using seed: {seed}")
-        random.seed(seed)
 
-    with open(LEVEL_INFO_FILE, "r") as f:
-        levels_json = json.load(f)
-    
-    levels = [Level.load_from_json(level) for level in levels_json]
+    cache = None
+    if options.cache_dir and not options.profile:
+        from .seed_cache import DiskSeedCache, hash_level_info
+        cache = DiskSeedCache(options.cache_dir, hash_level_info(LEVEL_INFO_FILE), GENERATOR_VERSION,
+                              engine=options.engine)
+
+    if options.count:
+        from .batch import generate_many, summarize
+
+        def write_seed(seed: int, pairs: List[DoorPair]) -> None:
+            if options.format == "compact":
+                with open(os.path.join(options.output_dir, f"config_{seed}.bin"), "wb") as f:
+                    f.write(encode_compact(pairs))
+            else:
+                with open(os.path.join(options.output_dir, f"config_{seed}.txt"), "w", encoding="UTF-8") as f:
+                    f.write(format_doors(pairs))
+
+        os.makedirs(options.output_dir, exist_ok=True)
+        results = []
+        start = time.perf_counter()
+        seeds = []
+        for batch_seed in range(seed, seed + options.count):
+            pairs = cache.get(batch_seed, options.max_attempts) if cache else None
+            if pairs is None:
+                seeds.append(batch_seed)
+            else:
+                write_seed(batch_seed, pairs)
+        if len(seeds) < options.count:
+            print(f"{options.count - len(seeds)} seeds served from the cache.")
+        profiles = []
+        for result in generate_many(seeds, jobs=options.jobs, max_attempts=options.max_attempts,
+                                    profile=bool(options.profile), engine=options.engine):
+            if result.error:
+                print(f"Seed {result.seed} failed after {result.elapsed:.3f}s: {result.error}")
+            else:
+                if not result.valid:
+                    print(f"Seed {result.seed} is not completable:\n{result.validation}")
+                write_seed(result.seed, result.doors)
+                if cache:
+                    cache.put(result.seed, result.doors, options.max_attempts)
+                print(f"Seed {result.seed} generated in {result.elapsed:.3f}s ({result.attempts} attempts)")
+            if result.warnings:
+                print(f"Seed {result.seed} has {result.warnings} warnings:\n{result.log.rstrip()}")
+            if result.profile is not None:
+                profiles.append(result.profile)
+            results.append(result)
+        print(summarize(results, time.perf_counter() - start))
+        if options.profile:
+            import json
+            from .instrumentation import combine_seeds
+            with open(options.profile, "w", encoding="UTF-8") as f:
+                json.dump(combine_seeds(profiles), f, indent=4)
+        return
+
+    # When the config goes to stdout, everything else goes to stderr.
+    to_stdout = options.output == "-"
+    cached_pairs = cache.get(seed, options.max_attempts) if cache else None
+    with redirect_stdout(sys.stderr) if to_stdout else nullcontext():
+        if cached_pairs is not None:
+            print(f"Using the cached config from {options.cache_dir}.")
+        else:
+            graph = load_level_graph(LEVEL_INFO_FILE)
+            if options.profile and options.profile_format == "pstats":
+                import cProfile
+                profiler = cProfile.Profile()
+                with profiler:
+                    transitions = _generate_reported(graph, seed, options.max_attempts, engine=options.engine)
+                profiler.dump_stats(options.profile)
+            elif options.profile:
+                import json
+                from .instrumentation import Profiler
+                profiler = Profiler()
+                with profiler.installed(), profiler.seed(seed) as stats:
+                    transitions = _generate_reported(graph, seed, options.max_attempts, stats, options.engine)
+                with open(options.profile, "w", encoding="UTF-8") as f:
+                    json.dump(profiler.report(), f, indent=4)
+            else:
+                transitions = _generate_reported(graph, seed, options.max_attempts, engine=options.engine)
+                if cache:
+                    cache.put(seed, to_doors(transitions), options.max_attempts)
+
+    if cached_pairs is not None:
+        write_cached(cached_pairs, options.format, options.output)
+    elif options.format == "compact":
+        if to_stdout:
+            write_compact(transitions, sys.stdout.buffer)
+        else:
+            with open(options.output or "config.bin", "wb") as f:
+                write_compact(transitions, f)
+    elif to_stdout:
+        write_config(transitions, sys.stdout)
+    else:
+        with open(options.output or "config.txt", "w", encoding="UTF-8") as f:
+            write_config(transitions, f)
+
+    print("Done.", file=sys.stderr if to_stdout else sys.stdout)
 
-    entrances = []
-    for level in levels:
-        entrances += level.entrances
 
-    for entrance in entrances:
-        def is_matching_entrance(other: Entrance) -> bool:
-            return other.original_destination == entrance.level and entrance.original_destination == other.level
+def write_cached(pairs: List[DoorPair], output_format: str, output: Optional[str]) -> None:
+    """
+    Write the door pairs of a config served from the cache, in the same way as a newly generated config.
+    """
+    if output_format == "compact":
+        data = encode_compact(pairs)
+        if output == "-":
+            sys.stdout.buffer.write(data)
+        else:
+            with open(output or "config.bin", "wb") as f:
+                f.write(data)
+    elif output == "-":
+        sys.stdout.write(format_doors(pairs))
+    else:
+        with open(output or "config.txt", "w", encoding="UTF-8") as f:
+            f.write(format_doors(pairs))
+
+
+def generate_single(graph: LevelGraph, seed: int, max_attempts: Optional[int], stats: Optional[SeedStats] = None,
+                    engine: str = "random",
+                    all_levels: Optional[List[Level]] = None
+                    ) -> Tuple[List[Transition], int, int, Optional[ValidationResult]]:
+    """
+    Generate the transitions for a single seed as the command line does. With max_attempts, or with the constraint
+    engine, which always retries (up to CONSTRAINT_ATTEMPTS times if max_attempts isn't set), see
+    generate_with_retries. Otherwise the seed is generated once with the random engine.
+
+    :param graph: The level database.
+    :param seed: The seed requested.
+    :param max_attempts: If set, degraded seeds are rejected and retried up to this many times.
+    :param stats: If given, record how the seed went in it.
+    :param engine: The placement engine to use, one of ENGINES.
+    :param all_levels: If given, it is filled with every level of the seed, including the ones the generator removed.
+    :raises GenerationFailed: If every attempt failed.
+    :return: The transitions, the number of attempts made, the derived seed that produced them, and the validator's
+             report on them if they were validated while retrying, or None if the seed was generated once.
+    """
+    if engine != "random":
+        max_attempts = max_attempts or CONSTRAINT_ATTEMPTS
+    if max_attempts:
+        return generate_with_retries(graph, seed, max_attempts, stats, engine, all_levels)
+    levels = graph.fresh_state()
+    if all_levels is not None:
+        all_levels[:] = levels
+    return generate(levels, random.Random(seed), stats=stats, table=graph.entrance_table()), 1, seed, None
+
+
+def _generate_reported(graph: LevelGraph, seed: int, max_attempts: Optional[int],
+                       stats: Optional[SeedStats] = None, engine: str = "random") -> List[Transition]:
+    """
+    Generate the transitions for a single seed with generate_single, reporting the attempts made, or any problems with
+    a seed that was generated once.
+    """
+    start = time.perf_counter()
+    transitions, attempts, used_seed, result = generate_single(graph, seed, max_attempts, stats, engine)
+    if result is not None:
+        print(f"Generated in {attempts} attempts ({time.perf_counter() - start:.3f}s) using seed {used_seed}.")
+    else:
+        result = validate(transitions, graph)
+        if not result.ok:
+            print(result)
+    return transitions
+
+
+def derive_seed(seed: int, attempt: int) -> int:
+    """
+    Get the seed used for a retry. The first attempt uses the seed itself.
+    """
+    if attempt == 0:
+        return seed
+    import hashlib
+    return int.from_bytes(hashlib.sha256(f"{seed}/{attempt}".encode()).digest()[:8], "big")
+
+
+def generate_with_retries(graph: LevelGraph, seed: int, max_attempts: int, stats: Optional[SeedStats] = None,
+                          engine: str = "random",
+                          all_levels: Optional[List[Level]] = None
+                          ) -> Tuple[List[Transition], int, int, ValidationResult]:
+    """
+    Generate strictly, throwing away attempts that fail or that the validator rejects, and retrying with a seed
+    derived from the original one.
+
+    :param graph: The level database.
+    :param seed: The seed requested.
+    :param max_attempts: The number of attempts to make before giving up.
+    :param stats: If given, record how every attempt went in it.
+    :param engine: The placement engine to use, one of ENGINES.
+    :param all_levels: If given, it is filled with every level of the attempt that was kept, including the ones the
+                       generator removed.
+    :raises GenerationFailed: If every attempt failed.
+    :return: The transitions, the number of attempts made, the derived seed that produced them, and the validator's
+             report on them. Passing that seed to the engine directly gives the same transitions.
+    """
+    generate_function = get_engine(engine)
+    failure = ""
+    for attempt in range(max_attempts):
+        attempt_seed = derive_seed(seed, attempt)
+        levels = graph.fresh_state()
+        if all_levels is not None:
+            # The generator removes levels from the list it is given.
+            all_levels[:] = levels
         try:
-            matching_entrance = next(filter(is_matching_entrance, entrances))
-        except StopIteration:
-            if not (entrance.level.startswith("CABIN_INTERIOR") or entrance.original_destination.startswith("CABIN_INTERIOR")):
-                print(f"Misconfigured level info JSON. from={entrance}")
+            transitions = generate_function(levels, random.Random(attempt_seed), strict=True, stats=stats,
+                                            table=graph.entrance_table())
+        except GenerationFailed as e:
+            failure = str(e)
+            continue
+        result = validate(transitions, graph)
+        if result.ok:
+            return transitions, attempt + 1, attempt_seed, result
+        failure = str(result)
+    raise GenerationFailed(f"Gave up after {max_attempts} attempts. Last failure: {failure}")
+
+
+def get_engine(engine: str) -> Callable[..., List[Transition]]:
+    """
+    Get the function that runs a placement engine. Both are called in the same way as generate.
 
-    random.shuffle(levels)
-    removed_levels = 0
-    # Because there are three one way levels and only 2 loopbacks in the graph, two single-entrance rooms will be
-    # unreachable. Ensure these have no collectibles.
-    for level in levels:
-        if removed_levels == 6:
-            break
-        if not level.collectibles and len(level.entrances) == 1 and level.name not in ["GOMEZ_HOUSE", "CABIN_INTERIOR_A", "CABIN_INTERIOR_B", "WELL_2"]:
-            print(f"Removing level: {level.name}")
-            levels.remove(level)
-            removed_levels += 1
+    :raises ValueError: If the engine isn't one of ENGINES.
+    """
+    if engine == "random":
+        return generate
+    if engine == "constraint":
+        from .placement import generate_constrained
+        return generate_constrained
+    raise ValueError(f"Unknown placement engine: {engine}")
 
-    # Start the tree at GOMEZ_HOUSE (after the 2D section).
-    tree = levels[levels.index("GOMEZ_HOUSE")]
 
-    # Remove sewer start from the tree, as it should only be accessed by going through well_2
-    sewer_start = levels.pop(levels.index("SEWER_START"))
-    levels.remove("OWL")
+def generate(levels: List[Level], rng: random.Random, strict: bool = False, stats: Optional[SeedStats] = None,
+             table: Optional['EntranceTable'] = None) -> List[Transition]:
+    """
+    Generate a randomized set of transitions. All randomness is drawn from rng, so the same seed always gives the same
+    transitions, no matter what else is running in the process.
+
+    :param levels: A fresh copy of the level database from LevelGraph.fresh_state. The levels are used up by the run
+                   and can't be passed to generate again.
+    :param rng: The random number generator for this run.
+    :param strict: Abort as soon as the seed would be degraded (a key behind its own key door, an unreachable entrance,
+                   a level connecting to itself, or running out of open exits before every level is placed), instead
+                   of printing a warning and carrying on.
+    :param stats: If given, record how the run went in it.
+    :param table: The level database's entrance table (see LevelGraph.entrance_table), to count open exits in bulk.
+    :raises GenerationFailed: If strict is set and the seed would be degraded.
+    :return: The transitions to write to the mod config.
+    """
+    sewer_start = remove_levels(levels, rng, stats)
 
-    # A list of every level currently in the tree.
-    tree_flat: List[Level] = [tree]
+    state = GenerationState(levels, strict, stats, table)
 
-    transitions = []
+    # Start the tree at GOMEZ_HOUSE (after the 2D section).
+    state.add_to_tree(state["GOMEZ_HOUSE"])
 
-    output_str = ""
+    transitions = []
 
-    current_collectibles = CollectibleInfo(anti_cubes=1)
+    current_collectibles = CollectibleCounter(anti_cubes=1)
 
-    new_transitions, current_collectibles = populate_hubs(levels, tree_flat, current_collectibles)
+    new_transitions, current_collectibles = populate_hubs(state, current_collectibles, rng)
     transitions += new_transitions
 
-    # The unused levels so far.
-    unused_levels = [l for l in levels if l not in tree_flat]
+    state.track_open_exits(current_collectibles)
 
-    while len([l for l in tree_flat if len(l.unused_entrances) > 0]) > 0:
-        #print(tree.pprint())
-        total_unused_entrances = sum([level.open_exits(current_collectibles) for level in tree_flat])
-        unfinished_levels = [l for l in tree_flat if len(l.unused_entrances) > 0]
-        valid_from_levels = [l for l in unfinished_levels if l.open_exits(current_collectibles) > 0]
-        from_level = random.choice(valid_from_levels)
-        from_entrance = from_level.connect_from_random(current_collectibles)
+    while len(state.unfinished) > 0:
+        total_unused_entrances = state.total_open_exits
+        valid_from_levels = [l for l in state.unfinished.values() if state.open_exits[l.id] > 0]
+        if strict and not valid_from_levels:
+            raise GenerationFailed(f"No open exits left with {len(state.unused)} levels unused.")
+        from_level = rng.choice(valid_from_levels)
+        from_entrance = from_level.connect_from_random(current_collectibles, rng)
         if from_entrance.locked:
             current_collectibles.keys -= 1
-        if from_level in unfinished_levels and len(from_level.unused_entrances) == 0:
-            unfinished_levels.remove(from_level)
-        if len(unused_levels) == 0 and len(unfinished_levels) == 1:
+            state.update_collectibles(current_collectibles)
+        state.update_finished(from_level)
+        # Levels added to the tree in this iteration only become unfinished once the iteration is over.
+        new_levels: List[Level] = []
+        if len(state.unused) == 0 and len(state.unfinished) == 1:
             # If there are no more untouched levels, we're stuck. Connect to ourselves if necessary.
             def is_valid(level: Level) -> bool:
                 return True
             hit = 0
-        elif len(unused_levels) == 0:
+        elif len(state.unused) == 0:
             # If every level has been hit, we have to connect back to somewhere in the tree. Avoid connecting to self.
             def is_valid(level: Level) -> bool:
-                return level != from_level
+                return level is not from_level
             hit = 1
-        elif len(unused_levels) == 1:
+        elif len(state.unused) == 1:
             # If there is only one unconnected level left, me must connect to it.
             def is_valid(level: Level) -> bool:
-                return level in unused_levels
+                return state.is_unused(level)
             hit = 2
         elif total_unused_entrances == 1:
             # We must connect a level that has more than one entrance, otherwise the tree is dead. In addition, we
             # can't connect one way levels, as they require even more unused entrances.
+            # The open exits are checked below, for every unused level at once.
             def is_valid(level: Level) -> bool:
-                return (level.open_exits(current_collectibles) >= 2
-                        and not level.one_way
-                        and level in unused_levels)
+                return not level.one_way and state.is_unused(level)
             hit = 3
         elif total_unused_entrances < 3:
             # We don't have an open node that we can connect a one-way level to. This also means we can't connect this
             # level to another one in the tree, as that would use up both entrances.
             def is_valid(level: Level) -> bool:
-                return not level.one_way and level in unused_levels
+                return not level.one_way and state.is_unused(level)
             hit = 4
         else:
             # Do not let levels connect to themselves unless it is the only option.
             def is_valid(level: Level) -> bool:
-                return level in unused_levels
+                return state.is_unused(level)
             hit = 5
-
-        valid_levels = list(filter(is_valid, unfinished_levels + unused_levels))
+        if stats is not None:
+            stats.hits[hit] += 1
+
+        if hit <= 1:
+            valid_levels = [l for l in state.unfinished.values() if is_valid(l)]
+        elif hit == 3:
+            valid_levels = [l for l in state.with_open_exits(state.unused.values(), current_collectibles, 2)
+                            if is_valid(l)]
+        else:
+            # Every valid level is unused, so there is no need to look through the tree.
+            valid_levels = [l for l in state.unused.values() if is_valid(l)]
         try:
-            to_level = random.choice(valid_levels)
+            to_level = rng.choice(valid_levels)
             if from_entrance.locked:
                 to_level.is_behind_key = True
                 to_level.key_door_source = from_level.name
             elif from_level.is_behind_key:
                 to_level.is_behind_key = True
                 to_level.key_door_source = from_level.key_door_source
-            if to_level not in tree_flat:
+            if not state.is_in_tree(to_level):
                 current_collectibles += to_level.collectibles
+                state.update_collectibles(current_collectibles)
                 if to_level.collectibles.keys > 0 and to_level.is_behind_key:
-                    print(f"Key placed behind key door (source door in {to_level.key_door_source})")
-            to_entrance = to_level.connect_to_random()
+                    state.warn(f"Key placed behind key door (source door in {to_level.key_door_source})")
+            to_entrance = to_level.connect_to_random(rng, state.warn)
+        except GenerationFailed:
+            raise
         except:
-            print("Unreachable entrance.")
+            state.warn("Unreachable entrance.")
             to_level = from_level
             to_entrance = from_entrance
 
-        if(from_level == to_level):
-            print(f"Level {from_level.name} connecting to itself. {hit=}")
+        if from_level is to_level:
+            if stats is not None:
+                stats.self_connections += 1
+            state.warn(f"Level {from_level.name} connecting to itself. {hit=}")
 
         if to_level not in from_level.connected_levels:
-            from_level.connected_levels.append(to_level)
+            from_level.add_connection(to_level)
 
-        if to_level not in tree_flat:
-            tree_flat.append(to_level)
-            unused_levels.remove(to_level)
+        if not state.is_in_tree(to_level):
+            state.add_to_tree(to_level)
+            new_levels.append(to_level)
 
+        if strict and to_level.name in CABIN_PARTNERS and not state.is_unused(state[CABIN_PARTNERS[to_level.name]]):
+            raise GenerationFailed(f"{to_level.name} was connected to again after its other half was placed.")
         if to_level.name == "CABIN_INTERIOR_A":
-            cabin_interior_b = unused_levels.pop(unused_levels.index("CABIN_INTERIOR_B"))
-            to_level.connected_levels.append(cabin_interior_b)
-            tree_flat.append(cabin_interior_b)
+            cabin_interior_b = state.take_unused("CABIN_INTERIOR_B")
+            to_level.add_connection(cabin_interior_b)
+            state.add_to_tree(cabin_interior_b)
+            new_levels.append(cabin_interior_b)
         elif to_level.name == "CABIN_INTERIOR_B":
-            cabin_interior_a = unused_levels.pop(unused_levels.index("CABIN_INTERIOR_A"))
-            to_level.connected_levels.append(cabin_interior_a)
-            tree_flat.append(cabin_interior_a)
+            cabin_interior_a = state.take_unused("CABIN_INTERIOR_A")
+            to_level.add_connection(cabin_interior_a)
+            state.add_to_tree(cabin_interior_a)
+            new_levels.append(cabin_interior_a)
         elif to_level.name == "WELL_2":
-            to_level.connected_levels.append(sewer_start)
-            tree_flat.append(sewer_start)
-            transition = connect_one_way(sewer_start, unfinished_levels, current_collectibles)
+            to_level.add_connection(sewer_start)
+            state.add_to_tree(sewer_start)
+            new_levels.append(sewer_start)
+            transition = connect_one_way(sewer_start, state, current_collectibles, rng)
             transitions.append(transition)
         elif to_level.one_way:
-            transition = connect_one_way(to_level, unfinished_levels, current_collectibles)
+            transition = connect_one_way(to_level, state, current_collectibles, rng)
             transitions.append(transition)
 
-        
-        if to_level in unfinished_levels and len(to_level.unused_entrances) == 0:
-            unfinished_levels.remove(to_level)
+        state.update_finished(to_level)
+        for level in new_levels:
+            state.mark_unfinished(level)
 
         transitions.append(Transition(from_entrance, to_entrance))
-    
-    with open("config.txt", "w", encoding="UTF-8") as f:
-        for transition in transitions:
-            f.write(str(transition))
-    
-    print("Done.")
 
-    
-def connect_one_way(level: Level, unfinished_levels: List[Level], current_collectibles: CollectibleInfo) -> Transition:
+    if strict and state.unused:
+        raise GenerationFailed(f"{len(state.unused)} levels were never placed.")
+
+    return transitions
+
+
+def remove_levels(levels: List[Level], rng: random.Random, stats: Optional[SeedStats] = None) -> Level:
+    """
+    Shuffle the levels, and remove the ones that are never placed.
+
+    :return: SEWER_START, which is removed as it is only placed along with WELL_2.
+    """
+    rng.shuffle(levels)
+    removed_levels = 0
+    # Because there are three one way levels and only 2 loopbacks in the graph, two single-entrance rooms will be
+    # unreachable. Ensure these have no collectibles.
+    for level in levels:
+        if removed_levels == 6:
+            break
+        if not level.collectibles and len(level.entrances) == 1 and level.name not in ["GOMEZ_HOUSE", "CABIN_INTERIOR_A", "CABIN_INTERIOR_B", "WELL_2"]:
+            print(f"Removing level: {level.name}")
+            if stats is not None:
+                stats.removed_levels.append(level.name)
+            levels.remove(level)
+            removed_levels += 1
+
+    # Remove sewer start from the tree, as it should only be accessed by going through well_2
+    sewer_start = levels.pop(levels.index("SEWER_START"))
+    levels.remove("OWL")
+    return sewer_start
+
+
+def connect_one_way(level: Level, state: GenerationState, current_collectibles: CollectibleCounter,
+                    rng: random.Random) -> Transition:
     """
     Connect the other end of a one way level back to the tree.
     """
-    from_entrance = level.connect_from_random(current_collectibles)
+    if state.strict and level.open_exits(current_collectibles) == 0:
+        raise GenerationFailed(f"One-way level {level.name} has no open exit.")
+    from_entrance = level.connect_from_random(current_collectibles, rng)
 
-    valid_levels = [l for l in unfinished_levels if l.num_exits() > 0]
+    valid_levels = state.with_exits(state.unfinished.values())
     try:
-        to_level = random.choice(valid_levels)
-        to_entrance = to_level.connect_to_random()
+        to_level = rng.choice(valid_levels)
+        to_entrance = to_level.connect_to_random(rng, state.warn)
+    except GenerationFailed:
+        raise
     except:
-        print("Unreachable entrance.")
+        state.warn("Unreachable entrance.")
         to_level = level
         to_entrance = from_entrance
 
     if to_level not in level.connected_levels:
-        level.connected_levels.append(to_level)
+        level.add_connection(to_level)
+
+    state.update_finished(level)
+    state.update_finished(to_level)
 
-    if level in unfinished_levels and len(level.unused_entrances) == 0:
-        unfinished_levels.remove(level)
-    if to_level in unfinished_levels and len(to_level.unused_entrances) == 0:
-        unfinished_levels.remove(to_level)
-    
     return Transition(from_entrance, to_entrance)
 
 
-def populate_hubs(levels: List[Level], tree_flat: List[Level],
-                  collectibles: CollectibleInfo) -> Tuple[List[Transition], CollectibleInfo]:
+def populate_hubs(state: GenerationState, collectibles: CollectibleCounter, rng: random.Random,
+                  skip_full_hubs: bool = False) -> Tuple[List[Transition], CollectibleCounter]:
     """
     Populate a skeleton graph connecting all hubs.
+
+    :param skip_full_hubs: Only start paths from hubs with a door left that can be exited through. By default any hub in
+                           the tree can be picked, so a path can start from a hub without a free door.
     """
-    gomez_house = tree_flat[tree_flat.index("GOMEZ_HOUSE")]
+    gomez_house = state["GOMEZ_HOUSE"]
 
     new_collectibles = collectibles
 
     transitions = []
-    new_transitions, new_collectibles = connect_to_hub(gomez_house, levels, tree_flat, new_collectibles)
+    new_transitions, new_collectibles = connect_to_hub(gomez_house, state, new_collectibles, rng)
     transitions += new_transitions
 
-    hub_names = ["NATURE_HUB", "INDUSTRIAL_HUB", "SEWER_HUB", "ZU_CITY_RUINS", "GRAVEYARD_GATE"]
     for _ in range(4):
-        from_hub = random.choice([l for l in tree_flat if l.name in hub_names])
-        new_transitions, new_collectibles = connect_to_hub(from_hub, levels, tree_flat, new_collectibles)
+        from_hub = rng.choice([l for l in state.tree_flat if l.name in HUB_NAMES
+                               and not (skip_full_hubs and not any(e.can_exit() for e in l.unused_entrances))])
+        new_transitions, new_collectibles = connect_to_hub(from_hub, state, new_collectibles, rng)
         transitions += new_transitions
-        
-    
+
     return transitions, new_collectibles
 
 
-def connect_to_hub(from_level: Level, levels: List[Level], tree_flat: List[Level],
-                   collectibles: CollectibleInfo) -> Tuple[List[Transition], CollectibleInfo]:
+def connect_to_hub(from_level: Level, state: GenerationState, collectibles: CollectibleCounter,
+                   rng: random.Random) -> Tuple[List[Transition], CollectibleCounter]:
     """
     Connect this level to a random remaining hub using 3-8 levels in the process.
     
@@ -249,41 +558,41 @@ def connect_to_hub(from_level: Level, levels: List[Level], tree_flat: List[Level
     - No one-way levels
     - No entrances that require any collectibles, or that are considered one-way.
     """
-    assert(from_level in tree_flat)
+    assert(state.is_in_tree(from_level))
     # Get a list of all the hubs that haven't bee used yet.
-    unused_levels = [l for l in levels if l not in tree_flat]
-    hub_names = ["NATURE_HUB", "INDUSTRIAL_HUB", "SEWER_HUB", "ZU_CITY_RUINS", "GRAVEYARD_GATE"]
-    unused_hubs = [l for l in unused_levels if l.name in hub_names]
+    unused_hubs = [l for l in state.unused.values() if l.name in HUB_NAMES]
     assert(len(unused_hubs) > 0)
 
-    # Choose a random hub and remove it from the list.
-    hub = random.choice(unused_hubs)
-    unused_levels.remove(hub)
+    # Choose a random hub.
+    hub = rng.choice(unused_hubs)
 
-    valid_levels = [l for l in unused_levels if l.num_exits() > 1 and not l.one_way and l.name not in hub_names]
+    valid_levels = [l for l in state.with_exits(state.unused.values(), 2)
+                    if not l.one_way and l.name not in HUB_NAMES]
 
-    num_rooms = random.randrange(3, 9)
+    num_rooms = rng.randrange(3, 9)
+    if state.stats is not None:
+        state.stats.hub_paths.append(num_rooms)
 
     last_level = from_level
 
     transitions = []
 
     for idx in range(num_rooms):
-        from_entrance = last_level.connect_two_way()
+        if state.strict and not last_level.unused_entrances:
+            raise GenerationFailed(f"{last_level.name} has no entrance left for the path to a hub.")
+        from_entrance = last_level.connect_two_way(rng, state.warn)
         if idx == num_rooms - 1:
             to_level = hub
         else:
-            to_level = random.choice(valid_levels)
-        collectibles += to_level.collectibles
-        last_level.connected_levels.append(to_level)
-        tree_flat.append(to_level)
-        if to_level in valid_levels:
+            if state.strict and not valid_levels:
+                raise GenerationFailed("Ran out of levels for the path to a hub.")
+            to_level = rng.choice(valid_levels)
             valid_levels.remove(to_level)
-        to_entrance = to_level.connect_two_way()
+        collectibles += to_level.collectibles
+        last_level.add_connection(to_level)
+        state.add_to_tree(to_level)
+        to_entrance = to_level.connect_two_way(rng, state.warn)
         transitions.append(Transition(from_entrance, to_entrance))
         last_level = to_level
 
     return transitions, collectibles
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
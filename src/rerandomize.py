@@ -0,0 +1,325 @@
+"""
+Re-randomize part of an existing seed.
+
+The config is read back into transitions, and the levels of the chosen subgraph (for example everything behind one of
+the hubs) are freed along with every transition that touches them. The doors outside the subgraph that those
+transitions used become the open exits, and the constraint engine (see SubgraphPlacer) places the levels of the
+subgraph again behind them, so that every door is used. The rest of the config is kept as it is, and only the
+subgraph is placed, so the time taken depends on the size of the subgraph rather than the whole world.
+"""
+
+import argparse
+from collections import deque
+from difflib import unified_diff
+import random
+import sys
+import time
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from .collectible_info import CollectibleCounter
+from .config_writer import COMPACT_MAGIC, DoorPair, normalize, read_config, write_compact, write_config
+from .entrance import Entrance, Transition
+from .level import Level
+from .level_cache import load_level_graph
+from .level_graph import GenerationFailed, GenerationState, LevelGraph, SeedStats
+from .placement import ConstraintPlacer, random_order
+from .randomizer import CONSTRAINT_ATTEMPTS, LEVEL_INFO_FILE, derive_seed
+from .validator import FIXED_LINKS, START_LEVEL, validate
+
+
+def owners(graph: LevelGraph) -> Dict[Entrance, str]:
+    """Get the level every entrance is in."""
+    return {e: level.name for level in graph.templates for e in level.entrances}
+
+
+def to_transitions(pairs: Iterable[DoorPair], graph: LevelGraph) -> List[Transition]:
+    """
+    Get the transitions of a config read by config_writer.read_config. Doors are matched to the entrances of the level
+    database by their level and volume id, which are unique. Level names are compared as they are written to the
+    config, as compact configs keep them as they are in the level database.
+
+    :raises ValueError: If a door isn't in the level database.
+    """
+    doors = {(normalize(e.level), e.volume_id): e for level in graph.templates for e in level.entrances}
+    transitions = []
+    for pair in pairs:
+        entrances = []
+        for door in pair:
+            try:
+                entrances.append(doors[(normalize(door.level), door.volume_id)])
+            except KeyError:
+                raise ValueError(f"The config has a door that isn't in the level database: {door}") from None
+        transitions.append(Transition(*entrances))
+    return transitions
+
+
+def _links(transitions: Iterable[Transition], levels: Dict[Entrance, str]) -> Dict[str, Set[str]]:
+    """Get the levels connected to every placed level, in either direction."""
+    links: Dict[str, Set[str]] = {START_LEVEL: set()}
+    for transition in transitions:
+        source, dest = levels[transition.source], levels[transition.dest]
+        links.setdefault(source, set()).add(dest)
+        links.setdefault(dest, set()).add(source)
+    for name, linked in FIXED_LINKS.items():
+        if name in links:
+            for other in linked:
+                links[name].add(other)
+                links.setdefault(other, set()).add(name)
+    return links
+
+
+def behind(transitions: List[Transition], graph: LevelGraph, names: Iterable[str]) -> Set[str]:
+    """
+    Get the levels behind some levels: the ones that can only be reached from GOMEZ_HOUSE through them.
+
+    :raises ValueError: If a level isn't placed, or is GOMEZ_HOUSE.
+    """
+    links = _links(transitions, owners(graph))
+    names = set(names)
+    if START_LEVEL in names or not names <= set(links):
+        raise ValueError(f"Only placed levels other than {START_LEVEL} can be placed again, not: "
+                         f"{', '.join(sorted(names - set(links) | names & {START_LEVEL}))}")
+    reached = {START_LEVEL} | names
+    queue = deque([START_LEVEL])
+    while queue:
+        for other in links[queue.popleft()]:
+            if other not in reached:
+                reached.add(other)
+                queue.append(other)
+    return set(links) - reached
+
+
+def _keys_behind_doors(transitions: List[Transition], levels: Dict[Entrance, str]) -> Dict[str, str]:
+    """
+    Get the levels that can only be reached from GOMEZ_HOUSE through a locked door, with the level the first locked
+    door on the way is in, as generate records them.
+    """
+    links: Dict[str, List[Tuple[str, bool]]] = {}
+    for transition in transitions:
+        source, dest = levels[transition.source], levels[transition.dest]
+        locked = transition.source.locked or transition.dest.locked
+        links.setdefault(source, []).append((dest, locked))
+        links.setdefault(dest, []).append((source, locked))
+    for name, linked in FIXED_LINKS.items():
+        links.setdefault(name, []).extend((other, False) for other in linked)
+
+    # First the levels reachable without going through a locked door, then the rest through the locked doors.
+    sources: Dict[str, str] = {START_LEVEL: ""}
+    queue: Deque[str] = deque([START_LEVEL])
+    while queue:
+        name = queue.popleft()
+        for other, locked in links.get(name, []):
+            if other not in sources and not locked:
+                sources[other] = ""
+                queue.append(other)
+    queue.extend(sources)
+    while queue:
+        name = queue.popleft()
+        for other, locked in links.get(name, []):
+            if other not in sources:
+                sources[other] = sources[name] or name
+                queue.append(other)
+    return {name: source for name, source in sources.items() if source}
+
+
+def subgraph(transitions: List[Transition], graph: LevelGraph, names: Iterable[str]) -> Set[str]:
+    """
+    Get the levels to place again for some levels: the levels themselves, the levels that are always placed along with
+    them, and the levels behind them, which would be cut off from the rest of the seed otherwise.
+
+    :raises ValueError: If a level isn't placed, or is GOMEZ_HOUSE.
+    """
+    names = set(names)
+    for name in list(names):
+        names.update(FIXED_LINKS.get(name, []))
+    if "SEWER_START" in names:
+        names.add("WELL_2")
+    return names | behind(transitions, graph, names)
+
+
+class SubgraphPlacer(ConstraintPlacer):
+    """
+    Places the levels of a subgraph behind the doors that led into it. Those are often only a few, so unlike after
+    populating the hubs, levels with keys can't be placed first on paper without using up the clean exits: the levels
+    that add the most open exits are placed first instead.
+    """
+
+    def _plan_key(self, level: Level) -> tuple:
+        summary = self._summaries[level.id]
+        one_way = summary is not None and summary[3] > 0
+        return (level.id in self._dead_ends, -self._gain(level), level.collectibles.keys == 0, not one_way,
+                not level.collectibles, level.id)
+
+    def _finish(self) -> None:
+        """
+        Connect the doors that are left to each other. This happens when the subgraph was connected to the rest of the
+        seed by connections back into the tree, which generate makes once every level has been placed.
+
+        :raises GenerationFailed: If the doors can't be paired up.
+        """
+        leftover = [(level, e) for level in self.tree for e in level.unused_entrances]
+        if len(leftover) % 2:
+            raise GenerationFailed(f"{len(leftover)} doors were left, which can't be connected to each other.")
+        leftover = list(random_order(leftover, self.rng))
+        while leftover:
+            from_level, from_entrance = leftover.pop()
+            # Avoid connecting a level to itself if there is any other choice.
+            to_level, to_entrance = next((other for other in leftover if other[0] is not from_level), leftover[0])
+            leftover.remove((to_level, to_entrance))
+            if not from_entrance.can_enter(self.collectibles):
+                from_entrance, to_entrance = to_entrance, from_entrance
+                if not from_entrance.can_enter(self.collectibles):
+                    raise GenerationFailed(f"Neither {from_entrance} nor {to_entrance} can be entered.")
+            from_level.unused_entrances.remove(from_entrance)
+            to_level.unused_entrances.remove(to_entrance)
+            self.transitions.append(Transition(from_entrance, to_entrance))
+
+
+def rerandomize(transitions: List[Transition], graph: LevelGraph, region: Set[str], rng: random.Random,
+                stats: Optional[SeedStats] = None) -> List[Transition]:
+    """
+    Place the levels of a subgraph again, keeping the rest of the seed.
+
+    :param transitions: The transitions of the seed.
+    :param graph: The level database the seed was generated from.
+    :param region: The names of the levels to place again, along with the levels that go with them (see subgraph).
+    :param rng: The random number generator for this run.
+    :param stats: If given, record how the run went in it.
+    :raises ValueError: If a level isn't placed, or is GOMEZ_HOUSE.
+    :raises GenerationFailed: If the levels couldn't be placed.
+    :return: The transitions of the seed, with the ones that were kept first in their original order.
+    """
+    levels = owners(graph)
+    placed = {START_LEVEL} | {levels[e] for t in transitions for e in (t.source, t.dest)}
+    region = subgraph(transitions, graph, region)
+
+    kept = [t for t in transitions if levels[t.source] not in region and levels[t.dest] not in region]
+    # The doors outside the subgraph that lead into it, which the subgraph is placed behind.
+    sockets = {e for t in transitions for e in (t.source, t.dest)
+               if levels[e] not in region and (levels[t.source] in region or levels[t.dest] in region)}
+
+    fresh = {level.name: level for level in graph.fresh_state()}
+    tree: List[Level] = []
+    for name in sorted({levels[e] for e in sockets}, key=graph.ids.__getitem__):
+        level = fresh[name]
+        level.unused_entrances = [e for e in level.entrances if e in sockets]
+        tree.append(level)
+    unused = [fresh[name] for name in sorted(region - {"SEWER_START"}, key=graph.ids.__getitem__)]
+
+    # Everything outside the subgraph has been collected, apart from the keys used on the locked doors kept.
+    collectibles = CollectibleCounter(anti_cubes=1)
+    for name in placed - region:
+        collectibles += fresh[name].collectibles
+    collectibles.keys -= len([t for t in kept if t.source.locked])
+    behind_key = {fresh[name].id: source for name, source in _keys_behind_doors(kept, levels).items()}
+
+    state = GenerationState(tree + unused, True, stats)
+    for level in tree:
+        state.add_to_tree(level)
+    placer = SubgraphPlacer(state, collectibles, fresh["SEWER_START"], rng, stats, behind_key)
+    return kept + placer.place_all()
+
+
+def rerandomize_with_retries(transitions: List[Transition], graph: LevelGraph, region: Set[str], seed: int,
+                             max_attempts: int, stats: Optional[SeedStats] = None) -> Tuple[List[Transition], int, int]:
+    """
+    Place the levels of a subgraph again, retrying with derived seeds until the validator accepts the seed, as
+    randomizer.generate_with_retries does.
+
+    :raises ValueError: If the subgraph has a level that can't be placed again.
+    :raises GenerationFailed: If every attempt failed.
+    :return: The transitions, the number of attempts made, and the derived seed that produced them.
+    """
+    failure = ""
+    for attempt in range(max_attempts):
+        attempt_seed = derive_seed(seed, attempt)
+        try:
+            new_transitions = rerandomize(transitions, graph, region, random.Random(attempt_seed), stats)
+        except GenerationFailed as e:
+            failure = str(e)
+            continue
+        result = validate(new_transitions, graph)
+        if result.ok:
+            return new_transitions, attempt + 1, attempt_seed
+        failure = str(result)
+    raise GenerationFailed(f"Gave up after {max_attempts} attempts. Last failure: {failure}")
+
+
+def diff(old: List[Transition], new: List[Transition], graph: LevelGraph) -> str:
+    """
+    Get a unified diff of the transitions of two seeds, with a line per transition.
+    """
+    levels = owners(graph)
+
+    def lines(transitions: List[Transition]) -> List[str]:
+        return [f"{levels[t.source]} {t.source.volume_id} -> {levels[t.dest]} {t.dest.volume_id}\n"
+                for t in transitions]
+
+    return "".join(unified_diff(lines(old), lines(new), "old", "new"))
+
+
+def main():
+    """
+    Script for re-randomizing part of a seed.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("config", help="The config to change, in either format.")
+    parser.add_argument("--behind", required=False,
+                        help="Place the levels that can only be reached through this level (e.g. a hub) again.")
+    parser.add_argument("--levels", required=False,
+                        help="Comma separated names of more levels to place again, along with the levels behind them.")
+    parser.add_argument("--seed", default=1, type=int, help="The random seed for the new placement.")
+    parser.add_argument("--max-attempts", default=CONSTRAINT_ATTEMPTS, type=int,
+                        help="Retry with a derived seed up to this many attempts.")
+    parser.add_argument("--output", required=False,
+                        help="Where to write the new config, or - for stdout. Defaults to overwriting the config.")
+    parser.add_argument("--format", choices=["text", "compact"], required=False,
+                        help="The format of the new config. Defaults to the format of the config read.")
+    parser.add_argument("--diff", required=False, help="Write the diff of the transitions to this file, not stdout.")
+    options = parser.parse_args()
+    if not options.behind and not options.levels:
+        parser.error("Choose the levels to place again with --behind or --levels.")
+
+    graph = load_level_graph(LEVEL_INFO_FILE)
+    # When the config goes to stdout, everything else goes to stderr.
+    log = sys.stderr if options.output == "-" else sys.stdout
+    try:
+        with open(options.config, "rb") as f:
+            output_format = options.format or ("compact" if f.read(len(COMPACT_MAGIC)) == COMPACT_MAGIC else "text")
+            f.seek(0)
+            transitions = to_transitions(read_config(f), graph)
+        region = behind(transitions, graph, [options.behind]) if options.behind else set()
+        if options.levels:
+            region |= set(options.levels.split(","))
+        region = subgraph(transitions, graph, region)
+        start = time.perf_counter()
+        new_transitions, attempts, used_seed = rerandomize_with_retries(transitions, graph, region, options.seed,
+                                                                       options.max_attempts)
+    except (OSError, ValueError, GenerationFailed) as e:
+        parser.error(str(e))
+    print(f"Placed {len(region)} levels again in {attempts} attempts ({time.perf_counter() - start:.3f}s) using "
+          f"seed {used_seed}.", file=log)
+
+    changes = diff(transitions, new_transitions, graph)
+    if options.diff:
+        with open(options.diff, "w", encoding="UTF-8") as f:
+            f.write(changes)
+    else:
+        log.write(changes)
+
+    output = options.output or options.config
+    if output == "-":
+        if output_format == "compact":
+            write_compact(new_transitions, sys.stdout.buffer)
+        else:
+            write_config(new_transitions, sys.stdout)
+    elif output_format == "compact":
+        with open(output, "wb") as f:
+            write_compact(new_transitions, f)
+    else:
+        with open(output, "w", encoding="UTF-8") as f:
+            write_config(new_transitions, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""
+Search the seed space for seeds with particular properties.
+
+Seeds are generated in chunks of consecutive seeds on a pool of worker processes, and every finished seed is checked
+against a query. The search stops as soon as enough matches have been found. Chunks are handed out and their results
+collected in seed order, so a search always finds the first matching seeds of its range, however many workers it runs
+on.
+
+Queries combine checks with and, or, not and parentheses, for example:
+
+    depth(SEWER_HUB) <= 4 and not key_behind_key_door
+    distance(NATURE_HUB, BIG_OWL) < 6 or (valid and self_connections == 0)
+
+The values that can be checked are:
+
+    distance(A, B)         The fewest doors between levels A and B (UNREACHABLE if there is no path).
+    depth(A)               distance(GOMEZ_HOUSE, A).
+    placed(A)              Whether level A is part of the seed.
+    behind_key_door(A)     Whether level A is behind a locked door.
+    self_connections       The number of doors that lead back into their own level.
+    keys_behind_key_doors  The number of levels with a key that are behind a locked door.
+    key_behind_key_door    Whether there are any.
+    valid                  Whether every placed level can be reached (see validator.validate).
+    softlock_possible      Whether opening the locked doors in the wrong order can leave the player stuck.
+
+Distances count doors in either direction, along with the fixed links between the cabin halves and from WELL_2 to
+SEWER_START.
+"""
+
+import argparse
+from collections import deque
+from contextlib import closing
+from dataclasses import dataclass, field
+import operator
+import re
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+from .batch import chunks, map_chunks, quiet_range
+from .entrance import Transition
+from .level import Level
+from .level_cache import load_level_graph
+from .level_graph import LevelGraph
+from .randomizer import ENGINES, LEVEL_INFO_FILE, generate_single
+from .validator import FIXED_LINKS, START_LEVEL, ValidationResult, validate
+
+# The distance between levels that aren't connected.
+UNREACHABLE = 1_000_000
+
+Value = Union[int, bool]
+
+
+class SeedGraph:
+    """
+    A finished seed, as the queries see it.
+    """
+
+    def __init__(self, seed: int, transitions: List[Transition], levels: List[Level], graph: LevelGraph,
+                 validation: Optional[ValidationResult] = None) -> None:
+        """
+        :param seed: The seed that was generated.
+        :param transitions: The transitions of the seed.
+        :param levels: Every level of the run, including the ones removed by the generator.
+        :param graph: The level database the seed was generated from.
+        :param validation: The validator's report on the seed, if it is already known.
+        """
+        self.seed = seed
+        self.transitions = transitions
+        self.levels = {level.name: level for level in levels}
+        self.graph = graph
+        self.self_connections = 0
+        # The levels on the other side of every door of each level.
+        self.neighbours: Dict[str, Set[str]] = {}
+        for transition in transitions:
+            source, dest = transition.source.level, transition.dest.level
+            if source == dest:
+                self.self_connections += 1
+                continue
+            self.neighbours.setdefault(source, set()).add(dest)
+            self.neighbours.setdefault(dest, set()).add(source)
+        for name, linked in FIXED_LINKS.items():
+            if name in self.neighbours:
+                for other in linked:
+                    self.neighbours[name].add(other)
+                    self.neighbours.setdefault(other, set()).add(name)
+        self._validation = validation
+
+    @property
+    def validation(self) -> ValidationResult:
+        """The validator's report on the seed, worked out the first time a query needs it."""
+        if self._validation is None:
+            self._validation = validate(self.transitions, self.graph)
+        return self._validation
+
+    def distance(self, start: str, end: str) -> int:
+        """Get the fewest doors between two levels, or UNREACHABLE."""
+        if start == end:
+            return 0 if start in self.neighbours else UNREACHABLE
+        distances = {start: 0}
+        queue = deque([start])
+        while queue:
+            name = queue.popleft()
+            for other in self.neighbours.get(name, ()):
+                if other not in distances:
+                    if other == end:
+                        return distances[name] + 1
+                    distances[other] = distances[name] + 1
+                    queue.append(other)
+        return UNREACHABLE
+
+    def placed(self, name: str) -> bool:
+        return name in self.neighbours
+
+    def behind_key_door(self, name: str) -> bool:
+        return self.placed(name) and self.levels[name].is_behind_key
+
+    def keys_behind_key_doors(self) -> int:
+        return len([level for name, level in self.levels.items()
+                    if level.collectibles.keys > 0 and self.behind_key_door(name)])
+
+
+# The values queries can check: the number of levels they take, and how to get them from a seed.
+FUNCTIONS: Dict[str, Tuple[int, Callable[..., Value]]] = {
+    "distance": (2, lambda seed, start, end: seed.distance(start, end)),
+    "depth": (1, lambda seed, name: seed.distance(START_LEVEL, name)),
+    "placed": (1, lambda seed, name: seed.placed(name)),
+    "behind_key_door": (1, lambda seed, name: seed.behind_key_door(name)),
+    "self_connections": (0, lambda seed: seed.self_connections),
+    "keys_behind_key_doors": (0, lambda seed: seed.keys_behind_key_doors()),
+    "key_behind_key_door": (0, lambda seed: seed.keys_behind_key_doors() > 0),
+    "valid": (0, lambda seed: seed.validation.ok),
+    "softlock_possible": (0, lambda seed: seed.validation.key_softlock_possible),
+}
+
+_COMPARISONS = {"<": operator.lt, "<=": operator.le, "==": operator.eq, "!=": operator.ne, ">=": operator.ge,
+                ">": operator.gt}
+
+# Numbers, names (level names can contain +, - and #), and symbols.
+_TOKEN = re.compile(r"\s*(?:(\d+)|([A-Za-z_][A-Za-z0-9_+\-#]*)|(<=|>=|==|!=|<|>|\(|\)|,))")
+
+Predicate = Callable[[SeedGraph], bool]
+
+
+class Query:
+    """
+    A parsed query, which checks seeds.
+    """
+
+    def __init__(self, text: str, graph: LevelGraph) -> None:
+        """
+        :param text: The query, see the module documentation.
+        :param graph: The level database, to check level names against.
+        :raises ValueError: If the query can't be parsed, or names a level that doesn't exist.
+        """
+        self.text = text
+        self.graph = graph
+        self._tokens = self._tokenize(text)
+        self._position = 0
+        self.predicate = self._parse_or()
+        if self._peek() is not None:
+            raise ValueError(f"Unexpected {self._peek()!r} in query: {text}")
+
+    def matches(self, seed: SeedGraph) -> bool:
+        return self.predicate(seed)
+
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = _TOKEN.match(text, position)
+            if match is None:
+                raise ValueError(f"Can't parse query at {text[position:]!r}")
+            tokens.append(match.group(match.lastindex))
+            position = match.end()
+        return tokens
+
+    def _peek(self) -> Optional[str]:
+        return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+    def _next(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise ValueError(f"Unexpected end of query: {self.text}")
+        self._position += 1
+        return token
+
+    def _expect(self, token: str) -> None:
+        found = self._next()
+        if found != token:
+            raise ValueError(f"Expected {token!r} but found {found!r} in query: {self.text}")
+
+    def _parse_or(self) -> Predicate:
+        predicates = [self._parse_and()]
+        while self._peek() == "or":
+            self._next()
+            predicates.append(self._parse_and())
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda seed: any(predicate(seed) for predicate in predicates)
+
+    def _parse_and(self) -> Predicate:
+        predicates = [self._parse_not()]
+        while self._peek() == "and":
+            self._next()
+            predicates.append(self._parse_not())
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda seed: all(predicate(seed) for predicate in predicates)
+
+    def _parse_not(self) -> Predicate:
+        if self._peek() == "not":
+            self._next()
+            predicate = self._parse_not()
+            return lambda seed: not predicate(seed)
+        if self._peek() == "(":
+            self._next()
+            predicate = self._parse_or()
+            self._expect(")")
+            return predicate
+        return self._parse_comparison()
+
+    def _parse_comparison(self) -> Predicate:
+        name = self._next()
+        if name not in FUNCTIONS:
+            raise ValueError(f"Unknown value {name!r} in query, expected one of: {', '.join(FUNCTIONS)}")
+        num_args, function = FUNCTIONS[name]
+        args: List[str] = []
+        if num_args:
+            self._expect("(")
+            for idx in range(num_args):
+                if idx:
+                    self._expect(",")
+                level = self._next()
+                if level not in self.graph.ids:
+                    raise ValueError(f"Unknown level {level!r} in query: {self.text}")
+                args.append(level)
+            self._expect(")")
+
+        if self._peek() not in _COMPARISONS:
+            return lambda seed: bool(function(seed, *args))
+        compare = _COMPARISONS[self._next()]
+        number = self._next()
+        if not number.isdigit():
+            raise ValueError(f"Expected a number but found {number!r} in query: {self.text}")
+        limit = int(number)
+        return lambda seed: compare(function(seed, *args), limit)
+
+
+@dataclass
+class SearchResult:
+    """Class for storing the outcome of a search."""
+    matches: List[int] = field(default_factory=list)
+    # The number of seeds up to the last match, or all of them if the search ran out of seeds. Workers may have
+    # generated a few more before the search stopped, which aren't counted.
+    searched: int = 0
+    # The seeds among those that failed to generate.
+    failed: List[int] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def summary(self) -> str:
+        rate = self.searched / self.elapsed if self.elapsed else 0.0
+        return (f"Found {len(self.matches)} matching seeds in {self.searched} searched ({len(self.failed)} failed to "
+                f"generate) in {self.elapsed:.2f}s ({rate:.1f} seeds/s).")
+
+
+# The level database, query and settings, loaded once per worker process.
+_graph: Optional[LevelGraph] = None
+_query: Optional[Query] = None
+_limit = 0
+_max_attempts: Optional[int] = None
+_engine = "random"
+
+
+def _init_worker(level_info_file: str, query: str, limit: int, max_attempts: Optional[int], engine: str) -> None:
+    global _graph, _query, _limit, _max_attempts, _engine
+    _graph = load_level_graph(level_info_file)
+    _query = Query(query, _graph)
+    _limit = limit
+    _max_attempts = max_attempts
+    _engine = engine
+
+
+def _search_chunk(seeds: Tuple[int, int]) -> SearchResult:
+    """
+    Search the seeds in [start, stop), stopping once it has as many matches as the search needs, as only the first
+    ones count.
+    """
+    assert _graph is not None and _query is not None
+    result = SearchResult()
+    for seed in quiet_range(seeds):
+        result.searched += 1
+        all_levels: List[Level] = []
+        try:
+            transitions, _, _, validation = generate_single(_graph, seed, _max_attempts, engine=_engine,
+                                                            all_levels=all_levels)
+        except Exception:
+            result.failed.append(seed)
+            continue
+        if _query.matches(SeedGraph(seed, transitions, all_levels, _graph, validation)):
+            result.matches.append(seed)
+            if len(result.matches) == _limit:
+                break
+    return result
+
+
+def search(query: str, start: int, count: int, matches: int, jobs: Optional[int] = None,
+           level_info_file: str = LEVEL_INFO_FILE, chunk_size: int = 200, max_attempts: Optional[int] = None,
+           engine: str = "random", progress: Optional[Callable[[SearchResult], None]] = None) -> SearchResult:
+    """
+    Find the first seeds in a range that match a query. Seeds are generated as by the command line (see
+    randomizer.generate_single), and a seed that needed retries is checked as the attempt that was kept.
+
+    :param query: The query, see the module documentation.
+    :param start: The first seed to search.
+    :param count: The number of seeds to search at most.
+    :param matches: Stop once this many matching seeds have been found.
+    :param jobs: The number of worker processes. Defaults to the number of CPUs; 1 runs in this process.
+    :param level_info_file: The level database to generate from.
+    :param chunk_size: The number of consecutive seeds handed to a worker at a time.
+    :param max_attempts: If set, degraded seeds are rejected and retried up to this many times (see
+                         generate_with_retries).
+    :param engine: The placement engine to generate with (see randomizer.ENGINES).
+    :param progress: If given, called with the running totals after every chunk.
+    :raises ValueError: If the query is invalid, which is checked before any seed is generated.
+    """
+    Query(query, load_level_graph(level_info_file))
+    started = time.perf_counter()
+    total = SearchResult()
+
+    def add(result: SearchResult) -> bool:
+        """Add the result of the next chunk, and return whether the search is done."""
+        total.matches += result.matches[:matches - len(total.matches)]
+        done = len(total.matches) >= matches
+        if done and total.matches:
+            # Only count the seeds up to the last match, however far the chunk went past it.
+            total.searched = total.matches[-1] - start + 1
+            total.failed += [seed for seed in result.failed if seed < total.matches[-1]]
+        else:
+            total.searched += result.searched
+            total.failed += result.failed
+        total.elapsed = time.perf_counter() - started
+        if progress is not None:
+            progress(total)
+        return done
+
+    results = map_chunks(_search_chunk, chunks(start, count, chunk_size), jobs, _init_worker,
+                         (level_info_file, query, matches, max_attempts, engine))
+    # Closing the results drops the chunks that haven't started once enough matches are found.
+    with closing(results):
+        for result in results:
+            if add(result):
+                break
+    return total
+
+
+def main():
+    """
+    Script for searching for seeds that match a query.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("query", help="What the seeds must satisfy, for example \"depth(SEWER_HUB) <= 4\".")
+    parser.add_argument("--seed", default=1, type=int, help="The first seed to search.")
+    parser.add_argument("--count", default=1_000_000, type=int, help="The number of seeds to search at most.")
+    parser.add_argument("--matches", default=10, type=int, help="Stop once this many matching seeds are found.")
+    parser.add_argument("--jobs", required=False, type=int, help="Number of worker processes.")
+    parser.add_argument("--chunk-size", default=200, type=int, help="The number of seeds handed to a worker at a time.")
+    parser.add_argument("--max-attempts", required=False, type=int,
+                        help="Reject degraded seeds and retry with a derived seed, up to this many attempts.")
+    parser.add_argument("--engine", choices=ENGINES, default="random", help="The placement engine to generate with.")
+    options = parser.parse_args()
+
+    reported = 0
+
+    def progress(result: SearchResult) -> None:
+        nonlocal reported
+        for seed in result.matches[reported:]:
+            print(f"Seed {seed} matches.")
+        reported = len(result.matches)
+
+    try:
+        result = search(options.query, options.seed, options.count, options.matches, options.jobs,
+                        chunk_size=options.chunk_size, max_attempts=options.max_attempts, engine=options.engine,
+                        progress=progress)
+    except ValueError as e:
+        parser.error(str(e))
+    print(result.summary())
+
+
+if __name__ == "__main__":
+    main()
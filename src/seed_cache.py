@@ -0,0 +1,138 @@
+"""
+Content-addressed on-disk cache of generated configs.
+
+The same seed, level database and generator always give the same transitions, so a config is stored under a hash of
+those inputs and served from disk the next time it is asked for. Entries are written atomically, so any number of
+processes can share a cache directory, and the least recently used ones are evicted once the directory grows past its
+size limit.
+"""
+
+import hashlib
+import mmap
+import os
+from typing import List, Optional
+
+from .config_writer import COMPACT_VERSION, DoorPair, decode_compact, encode_compact
+from .file_utils import write_atomic
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_SUFFIX = ".cfg"
+
+
+def hash_level_info(level_info_file: str) -> str:
+    """Get the hash of a level database, as used in cache keys."""
+    with open(level_info_file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class DiskSeedCache:
+    """
+    Class for storing the configs of seeds in a directory. They are stored in the compact encoding, which keeps the
+    level names exactly as they are in the level database, so either format can be written from them.
+    """
+
+    def __init__(self, directory: str, level_info_hash: str, generator_version: int,
+                 max_bytes: int = DEFAULT_MAX_BYTES, engine: str = "random") -> None:
+        """
+        :param directory: Where to store the configs. Created if it doesn't exist.
+        :param level_info_hash: The hash of the level database (see hash_level_info).
+        :param generator_version: The version of the generator, which changes whenever its output does.
+        :param max_bytes: The largest the cache is allowed to grow to.
+        :param engine: The placement engine the configs are generated with (see randomizer.ENGINES).
+        """
+        self.directory = directory
+        self.level_info_hash = level_info_hash
+        self.generator_version = generator_version
+        self.engine = engine
+        self.max_bytes = max_bytes
+        # The size of the cache as last measured plus what this process has written since, so that the directory is
+        # only scanned when it may have grown too large.
+        self._size: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, seed: int, max_attempts: Optional[int] = None) -> str:
+        """
+        Get the key of a seed. max_attempts and the engine are part of the key, as they give different transitions, and
+        so is the version of the compact encoding the entries are stored in.
+        """
+        inputs = (f"{seed}/{max_attempts or 0}/{self.level_info_hash}/{self.generator_version}/{self.engine}/"
+                  f"{COMPACT_VERSION}")
+        return hashlib.sha256(inputs.encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + _SUFFIX)
+
+    def get(self, seed: int, max_attempts: Optional[int] = None) -> Optional[List[DoorPair]]:
+        """Get the door pairs of a cached seed, or None if it isn't cached."""
+        path = self.path(self.key(seed, max_attempts))
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                # Decoded straight from the mapping, without copying the entry into a bytes object first.
+                pairs = decode_compact(data)
+        except (OSError, ValueError):
+            # Missing, or empty (which mmap refuses).
+            return None
+        try:
+            # The modification time is the last use, for the LRU eviction.
+            os.utime(path)
+        except OSError:
+            pass
+        return pairs
+
+    def put(self, seed: int, pairs: List[DoorPair], max_attempts: Optional[int] = None) -> None:
+        """
+        Store the door pairs of a seed (see config_writer.to_doors), then evict old entries if the cache is too large.
+        """
+        path = self.path(self.key(seed, max_attempts))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = encode_compact(pairs)
+        write_atomic(path, data)
+        if self._size is None or self._size + len(data) > self.max_bytes:
+            self.evict()
+        else:
+            self._size += len(data)
+
+    def evict(self) -> None:
+        """
+        Delete the least recently used entries if the cache is larger than max_bytes. It is trimmed to 90% of that, so
+        that the directory isn't scanned again on every write.
+        """
+        entries = []
+        total = 0
+        # Another process sharing the directory may evict the same entries meanwhile, so anything can disappear between
+        # listing it and looking at it.
+        try:
+            subdirectories = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            subdirectories = []
+        for subdirectory in subdirectories:
+            if not subdirectory.is_dir():
+                continue
+            try:
+                files = list(os.scandir(subdirectory.path))
+            except FileNotFoundError:
+                continue
+            for entry in files:
+                if entry.name.endswith(_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        if total <= self.max_bytes:
+            self._size = total
+            return
+        entries.sort()
+        target = self.max_bytes * 9 // 10
+        for _, size, path in entries:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by another process.
+                pass
+            total -= size
+            if total <= target:
+                break
+        self._size = total
@@ -0,0 +1,242 @@
+"""
+A long-running service that generates configs on demand over HTTP.
+
+The level database is loaded once per worker process, generation runs on a process pool, requests for a seed that is
+already being generated wait for that result instead of generating it again, and recent configs are kept in an LRU
+cache. Only the standard library is used, for both the server and the client.
+
+    GET /seed/<seed>   The text config for a seed.
+    GET /stats         Cache statistics as JSON.
+"""
+
+import argparse
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import json
+from typing import Dict, Optional, Tuple
+import urllib.request
+
+from .batch import SeedResult, generate_seed, init_worker
+from .randomizer import ENGINES, LEVEL_INFO_FILE
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class SeedCache:
+    """
+    Least recently used cache of generated seeds.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.results: 'OrderedDict[int, SeedResult]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, seed: int) -> Optional[SeedResult]:
+        result = self.results.get(seed)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results.move_to_end(seed)
+        return result
+
+    def put(self, seed: int, result: SeedResult) -> None:
+        self.results[seed] = result
+        self.results.move_to_end(seed)
+        while len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+            self.evictions += 1
+
+
+class SeedService:
+    """
+    Generates seeds on a process pool, sharing the work between concurrent requests for the same seed.
+    """
+
+    def __init__(self, jobs: Optional[int] = None, cache_size: int = 1024, level_info_file: str = LEVEL_INFO_FILE,
+                 max_attempts: Optional[int] = None, engine: str = "random") -> None:
+        self.pool = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                        initargs=(level_info_file, max_attempts, False, engine))
+        self.cache = SeedCache(cache_size)
+        # Seeds being generated, with the future every request for them waits on.
+        self.in_flight: Dict[int, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def get(self, seed: int) -> SeedResult:
+        """Get the result of generating a seed, from the cache if possible."""
+        # A seed being generated isn't cached yet, so requests that join it are counted as coalesced, not as misses.
+        future = self.in_flight.get(seed)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        result = self.cache.get(seed)
+        if result is not None:
+            return result
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.pool, generate_seed, seed)
+        self.in_flight[seed] = future
+        future.add_done_callback(lambda done: self._finished(seed, done))
+        # Shielded, so that a client hanging up doesn't cancel the work other requests are waiting on.
+        return await asyncio.shield(future)
+
+    def _finished(self, seed: int, future: asyncio.Future) -> None:
+        del self.in_flight[seed]
+        # Failures aren't cached, so that they can be retried.
+        if not future.cancelled() and future.exception() is None and not future.result().error:
+            self.cache.put(seed, future.result())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cached": len(self.cache.results),
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "evictions": self.cache.evictions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.in_flight),
+        }
+
+    async def handle(self, method: str, path: str) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        Handle a request.
+
+        :return: The status code, the extra headers, and the body of the response.
+        """
+        if method != "GET":
+            return 405, {}, b"Only GET is supported.\n"
+        if path == "/stats":
+            return 200, {"Content-Type": "application/json"}, json.dumps(self.stats()).encode("UTF-8")
+        if not path.startswith("/seed/"):
+            return 404, {}, b"Not found.\n"
+        try:
+            seed = int(path[len("/seed/"):])
+        except ValueError:
+            return 400, {}, b"The seed must be an integer.\n"
+
+        result = await self.get(seed)
+        if result.error:
+            return 500, {}, f"Seed {seed} failed: {result.error}\n".encode("UTF-8")
+        headers = {
+            "Content-Type": "text/plain; charset=utf-8",
+            "X-Seed-Valid": "true" if result.valid else "false",
+            "X-Seed-Attempts": str(result.attempts),
+            "X-Seed-Used": str(result.used_seed),
+        }
+        return 200, headers, result.config.encode("UTF-8")
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answer the requests on a connection, one at a time. A request that can't be read or handled gets an error
+        response rather than dropping the connection.
+        """
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    # Skip the headers, requests don't have bodies.
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                except ValueError:
+                    # A line longer than the stream's limit. Its remainder can't be told apart from the next request.
+                    await self._respond(writer, 400, {}, b"Request line or header too long.\n", False)
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    status, headers, body = 400, {}, b"Malformed request.\n"
+                    version = "HTTP/1.0"
+                else:
+                    try:
+                        status, headers, body = await self.handle(method, path)
+                    except Exception as e:
+                        # Such as a BrokenProcessPool when a worker process died.
+                        status, headers, body = 500, {}, f"{type(e).__name__}: {e}\n".encode("UTF-8")
+                keep_alive = version == "HTTP/1.1"
+                await self._respond(writer, status, headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, headers: Dict[str, str], body: bytes,
+                       keep_alive: bool) -> None:
+        headers["Content-Length"] = str(len(body))
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        head = f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+
+async def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, **kwargs) -> None:
+    """
+    Run the service until cancelled. Any other keyword arguments are passed to SeedService.
+    """
+    service = SeedService(**kwargs)
+    server = await asyncio.start_server(service.serve_connection, host, port)
+    print(f"Serving seeds on http://{host}:{port}/seed/<seed>")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def fetch_seed(seed: int, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 60.0) -> str:
+    """
+    Get the config for a seed from a running service.
+
+    :raises urllib.error.HTTPError: If the seed couldn't be generated.
+    """
+    with urllib.request.urlopen(f"http://{host}:{port}/seed/{seed}", timeout=timeout) as response:
+        return response.read().decode("UTF-8")
+
+
+def fetch_stats(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 10.0) -> Dict[str, int]:
+    """Get the cache statistics of a running service."""
+    with urllib.request.urlopen(f"http://{host}:{port}/stats", timeout=timeout) as response:
+        return json.load(response)
+
+
+def main():
+    """
+    Script for running the seed service.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=DEFAULT_HOST, help="The address to listen on.")
+    parser.add_argument("--port", default=DEFAULT_PORT, type=int, help="The port to listen on.")
+    parser.add_argument("--jobs", required=False, type=int, help="Number of worker processes.")
+    parser.add_argument("--cache-size", default=1024, type=int, help="The number of configs kept in memory.")
+    parser.add_argument("--max-attempts", required=False, type=int,
+                        help="Reject degraded seeds and retry with a derived seed, up to this many attempts.")
+    parser.add_argument("--engine", choices=ENGINES, default="random", help="The placement engine to generate with.")
+    options = parser.parse_args()
+
+    try:
+        asyncio.run(serve(options.host, options.port, jobs=options.jobs, cache_size=options.cache_size,
+                          max_attempts=options.max_attempts, engine=options.engine))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
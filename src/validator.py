@@ -0,0 +1,199 @@
+"""
+Reachability check for generated seeds.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Tuple, Union
+
+from .collectible_info import CollectibleCounter
+from .entrance import Entrance, Transition
+from .level import Level
+from .level_graph import START_LEVEL, LevelGraph
+
+# Connections that aren't part of the transitions.
+FIXED_LINKS: Dict[str, List[str]] = {
+    "CABIN_INTERIOR_A": ["CABIN_INTERIOR_B"],
+    "CABIN_INTERIOR_B": ["CABIN_INTERIOR_A"],
+    "WELL_2": ["SEWER_START"],
+}
+
+# A place the player can be in. This is a level name, except for one-way levels entered through one of their exits,
+# where only the entrance they came through is usable.
+Node = Union[str, Tuple[str, Entrance]]
+
+
+@dataclass
+class ValidationResult:
+    """Class for storing the outcome of validating a seed."""
+    reachable_levels: Set[str]
+    # Levels that were placed in the world, but can't be reached from the start.
+    unreachable_levels: List[str] = field(default_factory=list)
+    # Placed levels with collectibles that can't be reached.
+    missing_collectibles: List[str] = field(default_factory=list)
+    # Whether there was a point with more locked doors than keys, so that opening them in the wrong order may leave
+    # the player stuck.
+    key_softlock_possible: bool = False
+    self_connections: int = 0
+    collectibles: CollectibleCounter = field(default_factory=CollectibleCounter)
+
+    @property
+    def all_collectibles_obtainable(self) -> bool:
+        return not self.missing_collectibles
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing_collectibles and not self.unreachable_levels
+
+    def __str__(self) -> str:
+        if self.ok:
+            return f"Seed is valid: {len(self.reachable_levels)} levels reachable."
+        output = []
+        if self.unreachable_levels:
+            output.append(f"Unreachable levels: {', '.join(self.unreachable_levels)}")
+        if self.missing_collectibles:
+            output.append(f"Unobtainable collectibles in: {', '.join(self.missing_collectibles)}")
+        if self.key_softlock_possible:
+            output.append("Keys can run out if the locked doors are opened in the wrong order.")
+        return "\n".join(output)
+
+
+def validate(transitions: List[Transition], graph: LevelGraph) -> ValidationResult:
+    """
+    Check that every level placed by a seed can be reached from GOMEZ_HOUSE, so that all of its collectibles can be
+    obtained.
+
+    This sweeps outwards from the start until nothing changes. Doors are gated with the same rules as
+    Entrance.can_enter (so needs_switch is assumed to be solvable from inside the level). Keys are used up, so locked
+    doors are only opened once nothing else can be reached. If there are more of them than keys at that point, the door
+    that leads to the most keys is opened first, and the seed is flagged as one where opening the doors in the wrong
+    order can leave the player stuck.
+
+    :param transitions: The transitions of the seed.
+    :param graph: The level database the seed was generated from.
+    """
+    templates: Dict[str, Level] = {level.name: level for level in graph.templates}
+
+    # Every door placed by the seed, with the door on the other side of it.
+    doors: Dict[str, List[Tuple[Entrance, Entrance]]] = {}
+    self_connections = 0
+    for transition in transitions:
+        if transition.source == transition.dest:
+            self_connections += 1
+            continue
+        doors.setdefault(transition.source.level, []).append((transition.source, transition.dest))
+        doors.setdefault(transition.dest.level, []).append((transition.dest, transition.source))
+
+    placed = set(doors)
+    for name, linked in FIXED_LINKS.items():
+        if name in placed:
+            placed.update(linked)
+
+    sweep = _Sweep(templates, doors)
+    sweep.frontier.append(START_LEVEL)
+    key_softlock_possible = False
+    while True:
+        sweep.expand()
+        locked = sweep.pending_locked()
+        keys_available = sweep.collectibles.keys - sweep.keys_used
+        if not locked or keys_available <= 0:
+            break
+        if keys_available >= len(locked):
+            for door, other in locked:
+                sweep.open_locked(door, other)
+            continue
+        key_softlock_possible = True
+
+        # Look ahead through each door and open the one that leads to the most keys.
+        def keys_behind(locked_door: Tuple[Entrance, Entrance]) -> int:
+            lookahead = sweep.copy()
+            lookahead.open_locked(*locked_door)
+            lookahead.expand()
+            return lookahead.collectibles.keys
+        sweep.open_locked(*max(locked, key=keys_behind))
+
+    reachable_levels = {node for node in sweep.reached if isinstance(node, str)}
+    unreachable_levels = sorted(placed - reachable_levels)
+    missing_collectibles = [name for name in unreachable_levels if name in templates and templates[name].collectibles]
+    return ValidationResult(reachable_levels, unreachable_levels, missing_collectibles, key_softlock_possible,
+                            self_connections, sweep.collectibles)
+
+
+class _Sweep:
+    """
+    The state of a reachability sweep.
+    """
+
+    def __init__(self, templates: Dict[str, Level], doors: Dict[str, List[Tuple[Entrance, Entrance]]]) -> None:
+        self.templates = templates
+        self.doors = doors
+        self.collectibles = CollectibleCounter(anti_cubes=1)
+        self.keys_used = 0
+        self.reached: Set[Node] = set()
+        self.frontier: List[Node] = []
+        # Doors found so far that can't be used yet.
+        self.gated: List[Tuple[Entrance, Entrance]] = []
+        self.locked: List[Tuple[Entrance, Entrance]] = []
+
+    def copy(self) -> '_Sweep':
+        other = _Sweep(self.templates, self.doors)
+        other.collectibles = self.collectibles.copy()
+        other.keys_used = self.keys_used
+        other.reached = set(self.reached)
+        other.frontier = list(self.frontier)
+        other.gated = list(self.gated)
+        other.locked = list(self.locked)
+        return other
+
+    def arrive(self, door: Entrance) -> Node:
+        """Get where the player ends up after coming through a door."""
+        level = self.templates.get(door.level)
+        if level is not None and level.one_way and level.entrances[0] != door:
+            return (door.level, door)
+        return door.level
+
+    def expand(self) -> None:
+        """Reach everything that can be reached without opening another locked door."""
+        while True:
+            while self.frontier:
+                node = self.frontier.pop()
+                if node in self.reached:
+                    continue
+                self.reached.add(node)
+                if isinstance(node, tuple):
+                    # Stuck by the exit of a one-way level, the only way out is back through the same door.
+                    name, only_door = node
+                    exits = [(door, other) for door, other in self.doors.get(name, []) if door == only_door]
+                else:
+                    level = self.templates.get(node)
+                    if level is not None:
+                        self.collectibles += level.collectibles
+                    self.frontier.extend(FIXED_LINKS.get(node, []))
+                    exits = self.doors.get(node, [])
+                for door, other in exits:
+                    if door.locked:
+                        self.locked.append((door, other))
+                    elif door.can_enter(self.collectibles):
+                        self.frontier.append(self.arrive(other))
+                    else:
+                        self.gated.append((door, other))
+
+            # Try the doors that may have opened since they were found.
+            still_gated = []
+            for door, other in self.gated:
+                if door.can_enter(self.collectibles):
+                    self.frontier.append(self.arrive(other))
+                else:
+                    still_gated.append((door, other))
+            self.gated = still_gated
+            if not self.frontier:
+                return
+
+    def pending_locked(self) -> List[Tuple[Entrance, Entrance]]:
+        """Get the locked doors that would lead somewhere new."""
+        self.locked = [(door, other) for door, other in self.locked if self.arrive(other) not in self.reached]
+        return self.locked
+
+    def open_locked(self, door: Entrance, other: Entrance) -> None:
+        self.keys_used += 1
+        self.locked.remove((door, other))
+        self.frontier.append(self.arrive(other))
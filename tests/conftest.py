@@ -0,0 +1,18 @@
+import random
+
+import pytest
+
+from src.level_cache import load_level_graph
+from src.randomizer import LEVEL_INFO_FILE, generate
+
+
+@pytest.fixture(scope="session")
+def graph():
+    """The level database."""
+    return load_level_graph(LEVEL_INFO_FILE)
+
+
+@pytest.fixture(scope="session")
+def transitions(graph):
+    """The transitions of seed 7, generated with the default engine. Tests must not change them."""
+    return generate(graph.fresh_state(), random.Random(7), table=graph.entrance_table())
@@ -0,0 +1,43 @@
+import io
+
+import pytest
+
+from src.config_writer import (Door, decode_compact, encode_compact, format_config, format_doors, normalize,
+                               parse_text, read_config, to_doors, write_compact)
+
+
+def test_compact_round_trip(transitions):
+    pairs = to_doors(transitions)
+    assert decode_compact(encode_compact(pairs)) == pairs
+
+
+def test_compact_keeps_level_names(transitions):
+    names = {door.level for pair in decode_compact(encode_compact(to_doors(transitions))) for door in pair}
+    assert "LIGHTHOUSE*" in names
+
+
+def test_compact_and_text_give_the_same_config(transitions):
+    output = io.BytesIO()
+    write_compact(transitions, output)
+    assert format_doors(decode_compact(output.getvalue())) == format_config(transitions)
+
+
+def test_text_round_trip(transitions):
+    text = format_config(transitions)
+    pairs = parse_text(text)
+    assert format_doors(pairs) == text
+    assert pairs == [tuple(Door(normalize(door.level), normalize(door.original_destination), door.volume_id,
+                                door.viewpoint) for door in pair)
+                     for pair in to_doors(transitions)]
+
+
+def test_read_config_detects_the_format(transitions):
+    pairs = to_doors(transitions)
+    assert read_config(io.BytesIO(encode_compact(pairs))) == pairs
+    assert format_doors(read_config(io.BytesIO(format_config(transitions).encode("UTF-8")))) == \
+        format_config(transitions)
+
+
+def test_decode_rejects_other_data():
+    with pytest.raises(ValueError):
+        decode_compact(b"not a config")
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from src.corpus import CorpusReader, CorpusWriter, export, from_record, generate_records, index_file_for
+from src.randomizer import LEVEL_INFO_FILE
+from src.seed_cache import hash_level_info
+
+
+@pytest.fixture(scope="module")
+def records():
+    return [(seed, record) for seed, record in generate_records(1, 20, jobs=1) if record is not None]
+
+
+def write(path, records):
+    with CorpusWriter(str(path), hash_level_info(LEVEL_INFO_FILE), chunk_bytes=2000) as writer:
+        for seed, record in records:
+            writer.append(seed, record)
+
+
+def read(path):
+    with CorpusReader(str(path)) as reader:
+        return list(reader)
+
+
+def test_round_trip(tmp_path, records, graph):
+    path = tmp_path / "corpus.bin"
+    write(path, records)
+    assert read(path) == records
+    with CorpusReader(str(path)) as reader:
+        seed, transitions = reader.transitions(3, graph)
+    assert seed == records[3][0]
+    assert transitions == from_record(records[3][1], graph)
+
+
+def test_reads_records_by_seed(tmp_path, records):
+    path = tmp_path / "corpus.bin"
+    write(path, records[5:])
+    write(path, records[:5])
+    os.remove(index_file_for(str(path)))
+    # Rebuilding the index keeps the seeds.
+    write(path, [])
+    with CorpusReader(str(path)) as reader:
+        for seed, record in records:
+            assert reader.by_seed(seed) == record
+        with pytest.raises(KeyError):
+            reader.by_seed(0)
+
+
+def test_appends_to_an_existing_corpus(tmp_path, records):
+    path = tmp_path / "corpus.bin"
+    write(path, records[:5])
+    write(path, records[5:])
+    assert read(path) == records
+
+
+def test_recovers_from_a_partly_written_record(tmp_path, records):
+    path = tmp_path / "corpus.bin"
+    write(path, records[:10])
+    # Cut the last record off halfway, as if the export was interrupted while writing it.
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 100)
+    assert read(path) == records[:9]
+    write(path, records[9:])
+    assert read(path) == records
+
+
+def test_recovers_records_missing_from_the_index(tmp_path, records):
+    path = tmp_path / "corpus.bin"
+    write(path, records[:10])
+    # Drop the offsets of the last records, as if the export stopped before writing them.
+    index = index_file_for(str(path))
+    with open(index, "r+b") as f:
+        f.truncate(os.path.getsize(index) - 3 * 16)
+    assert len(read(path)) == 7
+    write(path, records[10:])
+    assert read(path) == records
+
+
+def test_rebuilds_a_missing_index(tmp_path, records):
+    path = tmp_path / "corpus.bin"
+    write(path, records)
+    os.remove(index_file_for(str(path)))
+    write(path, [])
+    assert read(path) == records
+
+
+def test_export_is_the_same_for_any_number_of_jobs(tmp_path):
+    one, two = tmp_path / "one.bin", tmp_path / "two.bin"
+    export(str(one), 1, 30, jobs=1)
+    export(str(two), 1, 30, jobs=2)
+    assert read(one) == read(two)
+
+
+def test_rejects_another_level_database(tmp_path, records):
+    path = tmp_path / "corpus.bin"
+    write(path, records[:1])
+    with pytest.raises(ValueError):
+        CorpusWriter(str(path), "0" * 64)
@@ -0,0 +1,38 @@
+import io
+import json
+import random
+from contextlib import redirect_stdout
+
+import pytest
+
+from src.benchmark import scale_level_info
+from src.level_cache import load_levels_from_json
+from src.level_graph import VECTORIZE_MIN_ENTRANCES, LevelGraph
+from src.randomizer import LEVEL_INFO_FILE, generate
+
+
+@pytest.fixture(scope="module")
+def scaled_graph():
+    pytest.importorskip("numpy")
+    with open(LEVEL_INFO_FILE, "rb") as f:
+        levels_json = json.load(f)
+    with redirect_stdout(io.StringIO()):
+        return LevelGraph(load_levels_from_json(json.dumps(scale_level_info(levels_json, 5)).encode("UTF-8")))
+
+
+def generate_with(graph, seed, table):
+    with redirect_stdout(io.StringIO()):
+        return generate(graph.fresh_state(), random.Random(seed), table=table)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3, 4])
+def test_numpy_and_plain_paths_give_the_same_transitions(scaled_graph, seed):
+    table = scaled_graph.entrance_table()
+    assert table is not None
+    assert len(table.level) >= VECTORIZE_MIN_ENTRANCES
+    assert generate_with(scaled_graph, seed, table) == generate_with(scaled_graph, seed, None)
+
+
+def test_scaled_databases_can_be_generated(scaled_graph):
+    for seed in range(1, 11):
+        generate_with(scaled_graph, seed, scaled_graph.entrance_table())
@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from src.collectible_info import CollectibleInfo
+from src.entrance import Entrance
+from src.level import GraphVersion, Level
+from src.level_graph import GenerationFailed, GenerationState, SeedStats
+
+
+def chain(version=None):
+    return [Level(name, CollectibleInfo(), [], version=version) for name in ("A", "B", "C")]
+
+
+def test_traversals_see_later_connections_without_a_shared_version():
+    a, b, c = chain()
+    a.add_connection(b)
+    assert not a.contains(c)
+    b.add_connection(c)
+    assert a.contains(c)
+
+
+def test_traversals_see_later_connections_with_a_shared_version():
+    a, b, c = chain(GraphVersion())
+    a.add_connection(b)
+    assert a.reachable() == (a, b)
+    b.add_connection(c)
+    assert a.reachable() == (a, b, c)
+
+
+def test_emerging_from_a_locked_door_is_reported_to_the_generation_state():
+    level = Level("A", CollectibleInfo(), [Entrance("A", 0, "", "B", locked=True)])
+    state = GenerationState([level], stats=SeedStats())
+    level.connect_two_way(random.Random(0), state.warn)
+    assert state.stats.warnings == 1
+
+    level = Level("A", CollectibleInfo(), [Entrance("A", 0, "", "B", locked=True)])
+    with pytest.raises(GenerationFailed, match="locked door"):
+        level.connect_to_random(random.Random(0), GenerationState([level], strict=True).warn)
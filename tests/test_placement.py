@@ -0,0 +1,42 @@
+import random
+from collections import Counter, deque
+
+import pytest
+
+from src.placement import generate_constrained
+from src.validator import FIXED_LINKS
+
+
+@pytest.fixture(scope="module", params=range(20))
+def constrained(request, graph):
+    return generate_constrained(graph.fresh_state(), random.Random(request.param), table=graph.entrance_table())
+
+
+def test_uses_every_door_once(constrained):
+    doors = Counter(e for t in constrained for e in (t.source, t.dest))
+    assert max(doors.values()) == 1
+
+
+def test_no_self_connections(constrained):
+    assert all(t.source.level != t.dest.level for t in constrained)
+
+
+def test_every_level_is_connected_to_the_start(constrained):
+    links = {}
+    for t in constrained:
+        links.setdefault(t.source.level, set()).add(t.dest.level)
+        links.setdefault(t.dest.level, set()).add(t.source.level)
+    for name, linked in FIXED_LINKS.items():
+        if name in links:
+            for other in linked:
+                links[name].add(other)
+                links.setdefault(other, set()).add(name)
+    reached = {"GOMEZ_HOUSE"}
+    queue = deque(reached)
+    while queue:
+        for other in links.get(queue.popleft(), ()):
+            if other not in reached:
+                reached.add(other)
+                queue.append(other)
+    assert "GOMEZ_HOUSE" in links
+    assert reached == set(links)
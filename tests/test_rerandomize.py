@@ -0,0 +1,62 @@
+import random
+from collections import Counter
+
+import pytest
+
+from src.config_writer import decode_compact, encode_compact, format_config, parse_text, to_doors
+from src.rerandomize import behind, diff, owners, rerandomize, subgraph, to_transitions
+
+
+def doors(transitions):
+    return Counter(e for t in transitions for e in (t.source, t.dest))
+
+
+def test_reads_back_compact_configs(graph, transitions):
+    assert to_transitions(decode_compact(encode_compact(to_doors(transitions))), graph) == transitions
+
+
+def test_reads_back_text_configs(graph, transitions):
+    assert to_transitions(parse_text(format_config(transitions)), graph) == transitions
+
+
+def test_behind_is_only_reached_through_the_level(graph, transitions):
+    levels = owners(graph)
+    region = behind(transitions, graph, ["SEWER_HUB"])
+    assert region and "SEWER_HUB" not in region
+    for t in transitions:
+        source, dest = levels[t.source], levels[t.dest]
+        if (source in region) != (dest in region):
+            assert "SEWER_HUB" in (source, dest)
+
+
+def test_behind_rejects_the_start(graph, transitions):
+    with pytest.raises(ValueError):
+        behind(transitions, graph, ["GOMEZ_HOUSE"])
+
+
+def test_keeps_the_rest_of_the_seed(graph, transitions):
+    levels = owners(graph)
+    region = subgraph(transitions, graph, behind(transitions, graph, ["NATURE_HUB"]))
+    kept = [t for t in transitions if levels[t.source] not in region and levels[t.dest] not in region]
+    new = rerandomize(transitions, graph, region, random.Random(1))
+    assert new[:len(kept)] == kept
+    assert doors(new) == doors(transitions)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_finish_uses_every_door_once(graph, transitions, seed):
+    # The level is connected to the rest of the seed by connections back into the tree, which _finish pairs up.
+    new = rerandomize(transitions, graph, subgraph(transitions, graph, ["ORRERY"]), random.Random(seed))
+    assert max(doors(new).values()) == 1
+    assert doors(new) == doors(transitions)
+
+
+def test_diff(graph, transitions):
+    assert diff(transitions, transitions, graph) == ""
+    new = rerandomize(transitions, graph, subgraph(transitions, graph, ["ORRERY"]), random.Random(1))
+    lines = diff(transitions, new, graph).splitlines()
+    assert lines[:2] == ["--- old", "+++ new"]
+    added = [line for line in lines[2:] if line.startswith("+")]
+    removed = [line for line in lines[2:] if line.startswith("-")]
+    assert added and len(added) == len(removed)
+    assert all("ORRERY" in line for line in added + removed)
@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from src.randomizer import generate
+from src.search import UNREACHABLE, Query, SeedGraph, search
+
+
+@pytest.fixture(scope="module")
+def seed(graph):
+    levels = graph.fresh_state()
+    all_levels = list(levels)
+    transitions = generate(levels, random.Random(1), table=graph.entrance_table())
+    return SeedGraph(1, transitions, all_levels, graph)
+
+
+def matches(text, graph, seed):
+    return Query(text, graph).matches(seed)
+
+
+def test_comparisons(graph, seed):
+    depth = seed.distance("GOMEZ_HOUSE", "SEWER_HUB")
+    assert matches(f"depth(SEWER_HUB) == {depth}", graph, seed)
+    assert matches(f"depth(SEWER_HUB) <= {depth}", graph, seed)
+    assert not matches(f"depth(SEWER_HUB) < {depth}", graph, seed)
+    assert matches(f"distance(SEWER_HUB, GOMEZ_HOUSE) == {depth}", graph, seed)
+
+
+def test_boolean_operators(graph, seed):
+    assert matches("placed(GOMEZ_HOUSE)", graph, seed)
+    assert not matches("not placed(GOMEZ_HOUSE)", graph, seed)
+    assert matches("placed(GOMEZ_HOUSE) or not placed(GOMEZ_HOUSE)", graph, seed)
+    assert not matches("placed(GOMEZ_HOUSE) and not placed(GOMEZ_HOUSE)", graph, seed)
+    # and binds tighter than or.
+    assert matches("placed(GOMEZ_HOUSE) or placed(GOMEZ_HOUSE) and not placed(GOMEZ_HOUSE)", graph, seed)
+    assert not matches("(placed(GOMEZ_HOUSE) or placed(GOMEZ_HOUSE)) and not placed(GOMEZ_HOUSE)", graph, seed)
+
+
+def test_values_without_arguments(graph, seed):
+    assert matches(f"self_connections == {seed.self_connections}", graph, seed)
+    assert matches(f"keys_behind_key_doors == {seed.keys_behind_key_doors()}", graph, seed)
+    assert matches("key_behind_key_door", graph, seed) == (seed.keys_behind_key_doors() > 0)
+    assert matches("valid", graph, seed) == seed.validation.ok
+
+
+def test_unplaced_levels_are_unreachable(graph, seed):
+    removed = next(name for name in seed.levels if not seed.placed(name))
+    assert seed.distance("GOMEZ_HOUSE", removed) == UNREACHABLE
+    assert matches(f"not placed({removed})", graph, seed)
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "depth(SEWER_HUB) <=",
+    "depth(SEWER_HUB",
+    "depth(NOT_A_LEVEL) < 3",
+    "distance(SEWER_HUB) < 3",
+    "unknown_value",
+    "valid valid",
+    "placed(GOMEZ_HOUSE) and",
+    "depth(SEWER_HUB) < 3 $",
+])
+def test_invalid_queries(graph, text):
+    with pytest.raises(ValueError):
+        Query(text, graph)
+
+
+def test_search_is_the_same_for_any_number_of_jobs():
+    one = search("depth(SEWER_HUB) <= 4", 1, 200, 3, jobs=1, chunk_size=20)
+    two = search("depth(SEWER_HUB) <= 4", 1, 200, 3, jobs=2, chunk_size=20)
+    assert (one.matches, one.searched, one.failed) == (two.matches, two.searched, two.failed)
+    assert one.searched == one.matches[-1]
+
+
+def test_constraint_search_checks_the_retried_seed():
+    # The constraint engine retries rejected seeds, so every seed it generates is valid.
+    assert search("valid", 1, 10, 10, jobs=1, engine="constraint").matches == list(range(1, 11))
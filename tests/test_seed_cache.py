@@ -0,0 +1,85 @@
+import os
+import shutil
+
+import pytest
+
+from src import seed_cache
+from src.config_writer import encode_compact, to_doors
+from src.seed_cache import DiskSeedCache
+
+
+@pytest.fixture
+def pairs(transitions):
+    return to_doors(transitions)
+
+
+def make_cache(directory, **kwargs):
+    return DiskSeedCache(str(directory), "hash", 1, **kwargs)
+
+
+def test_round_trip(tmp_path, pairs):
+    cache = make_cache(tmp_path)
+    assert cache.get(7) is None
+    cache.put(7, pairs)
+    # Decoded from a memory map of the entry.
+    assert cache.get(7) == pairs
+    assert make_cache(tmp_path).get(7) == pairs
+
+
+def test_empty_and_corrupt_entries_are_misses(tmp_path, pairs):
+    cache = make_cache(tmp_path)
+    cache.put(1, pairs)
+    cache.put(2, pairs)
+    open(cache.path(cache.key(1)), "wb").close()
+    with open(cache.path(cache.key(2)), "wb") as f:
+        f.write(b"not a config")
+    assert cache.get(1) is None
+    assert cache.get(2) is None
+
+
+def test_key_depends_on_every_input(tmp_path):
+    key = make_cache(tmp_path).key(7)
+    assert make_cache(tmp_path).key(7) == key
+    assert make_cache(tmp_path).key(8) != key
+    assert make_cache(tmp_path).key(7, max_attempts=10) != key
+    assert make_cache(tmp_path, engine="constraint").key(7) != key
+    assert DiskSeedCache(str(tmp_path), "other hash", 1).key(7) != key
+    assert DiskSeedCache(str(tmp_path), "hash", 2).key(7) != key
+
+
+def test_evicts_the_least_recently_used(tmp_path, pairs):
+    size = len(encode_compact(pairs))
+    # Room for three entries, and trimmed to 90% of that, which is still three.
+    cache = make_cache(tmp_path, max_bytes=size * 10 // 3)
+    for seed in range(3):
+        cache.put(seed, pairs)
+        os.utime(cache.path(cache.key(seed)), (1000 + seed, 1000 + seed))
+    # Reading seed 0 makes it the most recently used.
+    assert cache.get(0) == pairs
+    cache.put(3, pairs)
+    assert cache.get(1) is None
+    assert cache.get(0) == pairs
+    assert cache.get(2) == pairs
+    assert cache.get(3) == pairs
+
+
+def test_tolerates_concurrent_eviction(tmp_path, pairs, monkeypatch):
+    cache = make_cache(tmp_path)
+    for seed in range(20):
+        cache.put(seed, pairs)
+    scandir = os.scandir
+
+    def evicting_scandir(path):
+        """List a directory, then remove what was listed, as another process evicting the same cache would."""
+        entries = list(scandir(path))
+        if os.path.samefile(path, tmp_path):
+            shutil.rmtree(entries[0].path)
+        else:
+            for entry in entries:
+                os.remove(entry.path)
+        return iter(entries)
+
+    monkeypatch.setattr(seed_cache.os, "scandir", evicting_scandir)
+    cache.max_bytes = 1
+    cache.evict()
+    cache.put(20, pairs)
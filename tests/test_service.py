@@ -0,0 +1,128 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+import random
+import urllib.error
+import urllib.request
+
+import pytest
+
+from src.config_writer import format_config
+from src.randomizer import generate, generate_single
+from src.service import SeedCache, SeedService, fetch_seed, fetch_stats
+
+
+async def serve_and(service, client):
+    """Run the service on a free port while client(port) runs."""
+    server = await asyncio.start_server(service.serve_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        async with server:
+            return await client(port)
+    finally:
+        service.close()
+
+
+def test_round_trip(graph):
+    expected = format_config(generate(graph.fresh_state(), random.Random(5), table=graph.entrance_table()))
+
+    async def client(port):
+        first = await asyncio.to_thread(fetch_seed, 5, port=port)
+        second = await asyncio.to_thread(fetch_seed, 5, port=port)
+        return first, second, await asyncio.to_thread(fetch_stats, port=port)
+
+    first, second, stats = asyncio.run(serve_and(SeedService(jobs=1), client))
+    assert first == expected
+    assert second == expected
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_concurrent_requests_share_a_generation():
+    service = SeedService(jobs=1)
+    submitted = []
+    submit = service.pool.submit
+
+    def counted(function, *args):
+        submitted.append(args)
+        return submit(function, *args)
+
+    service.pool.submit = counted
+
+    async def requests():
+        try:
+            return await asyncio.gather(service.get(5), service.get(5))
+        finally:
+            service.close()
+
+    first, second = asyncio.run(requests())
+    assert submitted == [(5,)]
+    assert first is second
+    assert service.stats()["coalesced"] == 1
+    assert service.stats()["misses"] == 1
+
+
+def test_engine(graph):
+    expected = format_config(generate_single(graph, 5, None, engine="constraint")[0])
+    service = SeedService(jobs=1, engine="constraint")
+
+    async def request():
+        try:
+            return await service.get(5)
+        finally:
+            service.close()
+
+    assert asyncio.run(request()).config == expected
+
+
+def test_cache_evicts_the_least_recently_used():
+    cache = SeedCache(2)
+    cache.put(1, "one")
+    cache.put(2, "two")
+    assert cache.get(1) == "one"
+    cache.put(3, "three")
+    assert cache.get(2) is None
+    assert cache.get(1) == "one"
+    assert cache.get(3) == "three"
+    assert cache.evictions == 1
+
+
+def test_bad_requests():
+    def status(port, path):
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=10) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    async def client(port):
+        return [await asyncio.to_thread(status, port, path) for path in ["/seed/abc", "/nothing"]]
+
+    assert asyncio.run(serve_and(SeedService(jobs=1), client)) == [400, 404]
+
+
+def test_failures_get_an_error_response():
+    service = SeedService(jobs=1)
+
+    async def broken(seed):
+        raise BrokenProcessPool("A worker died.")
+
+    service.get = broken
+
+    async def client(port):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            await asyncio.to_thread(fetch_seed, 1, port=port)
+        return error.value.code
+
+    assert asyncio.run(serve_and(service, client)) == 500
+
+
+def test_oversized_requests_get_an_error_response():
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /seed/" + b"1" * 100_000 + b" HTTP/1.1\r\n\r\n")
+        await writer.drain()
+        status_line = await reader.readline()
+        writer.close()
+        return status_line
+
+    assert asyncio.run(serve_and(SeedService(jobs=1), client)).startswith(b"HTTP/1.1 400")
@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from src.entrance import Transition
+from src.placement import generate_constrained
+from src.validator import validate
+
+
+@pytest.fixture(scope="module")
+def door(graph):
+    levels = {level.name: level for level in graph.templates}
+
+    def get(name, volume_id=None):
+        """Get a door of a level, by its volume id or the first one."""
+        return next(e for e in levels[name].entrances if volume_id is None or e.volume_id == volume_id)
+    return get
+
+
+def test_generated_seed_is_valid(graph):
+    transitions = generate_constrained(graph.fresh_state(), random.Random(1), table=graph.entrance_table())
+    result = validate(transitions, graph)
+    assert result.ok
+    assert not result.unreachable_levels and not result.missing_collectibles
+
+
+def test_completable(graph, door):
+    # The key in PARLOR opens the locked door of MAUSOLEUM.
+    transitions = [Transition(door("GOMEZ_HOUSE"), door("MAUSOLEUM", 0)),
+                   Transition(door("MAUSOLEUM", 1), door("PARLOR")),
+                   Transition(door("MAUSOLEUM", 2), door("MINE_BOMB_PILLAR"))]
+    result = validate(transitions, graph)
+    assert result.ok
+    assert {"GOMEZ_HOUSE", "MAUSOLEUM", "PARLOR", "MINE_BOMB_PILLAR"} <= result.reachable_levels
+
+
+def test_key_behind_its_own_key_door(graph, door):
+    transitions = [Transition(door("GOMEZ_HOUSE"), door("MAUSOLEUM", 0)),
+                   Transition(door("MAUSOLEUM", 2), door("PARLOR"))]
+    result = validate(transitions, graph)
+    assert not result.ok
+    assert result.unreachable_levels == ["PARLOR"]
+    assert result.missing_collectibles == ["PARLOR"]
+
+
+def test_unreachable_level(graph, door):
+    transitions = [Transition(door("GOMEZ_HOUSE"), door("MAUSOLEUM", 0)),
+                   Transition(door("ARCH"), door("WALL_HOLE"))]
+    result = validate(transitions, graph)
+    assert not result.ok
+    assert result.unreachable_levels == ["ARCH", "WALL_HOLE"]
+    assert "MAUSOLEUM" in result.reachable_levels